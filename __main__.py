@@ -1,16 +1,27 @@
-from asyncio import run, sleep
-from copy import deepcopy
-from datetime import datetime
+from asyncio import Queue, gather, run, to_thread
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, List
 
 from logger import logger
-from misc import Candle, DiscordMessage, Liquidation, LiquidationSet
-import threading
-from typing import List
-
-from coinalyze_scanner import CoinalyzeScanner, COINALYZE_LIQUIDATION_URL
-from discord_client import USE_DISCORD, get_discord_table
-from exchange import Exchange, TICKER, LEVERAGE
-
+from misc import Candle, DiscordMessage, LiquidationSet
+
+from coinalyze_client import CoinalyzeClient
+from coinalyze_scanner import (
+    ASSETS,
+    COINALYZE_LIQUIDATION_URL,
+    COINALYZE_SECRET_API_KEY,
+    CoinalyzeScanner,
+)
+from discord_client import USE_DISCORD, DiscordOutbox, get_discord_table
+from candle_buffer import USE_CANDLE_BUFFER
+from candle_feed import USE_CANDLE_FEED
+from exchange import ACCOUNTS, EXCHANGE_NAME, Exchange, LEVERAGE, get_ccxt_exchange
+from liquidation_store import LiquidationStore, USE_LIQUIDATION_STORE
+from order_fills import USE_ORDER_FILL_WATCHER
+from metrics import MetricsServer, USE_METRICS
+from scheduler import Scheduler
+from startup_cache import StartupCache
+from state_store import StateStore, USE_STATE_STORE
 
 if USE_DISCORD:
     from coinalyze_scanner import (
@@ -20,7 +31,7 @@ if USE_DISCORD:
         MINIMAL_NR_OF_LIQUIDATIONS,
         LIQUIDATION_DAYS,
     )
-    from discord_client import post_to_discord, DISCORD_CHANNEL_HEARTBEAT_ID
+    from discord_client import DiscordDispatcher, DISCORD_CHANNEL_HEARTBEAT_ID
     from exchange import (
         USE_FIXED_RISK,
         FORBIDDEN_NR_OF_CANDLES_BEFORE_ENTRY,
@@ -47,35 +58,170 @@ if USE_DISCORD:
         DISCORD_SETTINGS["position_percentage"] = POSITION_PERCENTAGE
 
 
-LIQUIDATIONS: List[Liquidation] = []
-LIQUIDATION_SET: LiquidationSet = LiquidationSet(liquidations=LIQUIDATIONS)
+FIVE_MINUTES = timedelta(minutes=5)
+STRATEGY_TYPES = ["reversed"]
 
 
 async def main() -> None:
-    # enable scanner
-    scanner = CoinalyzeScanner(datetime.now(), LIQUIDATION_SET)
-    await scanner.set_symbols()
-
-    # enable exchange
-    exchange = Exchange(LIQUIDATION_SET, scanner)
-    scanner.exchange = exchange
-
-    for direction in ["long", "short"]:
-        await exchange.set_leverage(
-            symbol=TICKER,
-            leverage=LEVERAGE,
-            direction=direction,
+    if USE_METRICS:
+        await MetricsServer().start()
+
+    # 1 exchange connection per account, 1 Coinalyze session and discord outbox
+    ccxt_exchanges = {account.name: get_ccxt_exchange(account) for account in ACCOUNTS}
+    coinalyze_client = CoinalyzeClient(api_key=COINALYZE_SECRET_API_KEY)
+    discord_message_queue: Queue[DiscordMessage] = DiscordOutbox()
+    state_store: StateStore | None = StateStore() if USE_STATE_STORE else None
+    liquidation_store: LiquidationStore | None = (
+        LiquidationStore() if USE_LIQUIDATION_STORE else None
+    )
+
+    # enable a scanner and exchange pipeline per asset, its strategy trades on the
+    # main account and fans out to followers on the extra accounts
+    exchanges: List[Exchange] = []
+    for asset in ASSETS:
+        scanner = CoinalyzeScanner(
+            datetime.now(), LiquidationSet(), asset=asset, client=coinalyze_client
         )
+        scanner.liquidation_store = liquidation_store
+        exchange, *followers = [
+            Exchange(
+                scanner.liquidation_set,
+                scanner,
+                asset=asset,
+                exchange=ccxt_exchanges[account.name],
+                discord_message_queue=discord_message_queue,
+                account=account,
+            )
+            for account in ACCOUNTS
+        ]
+        exchange.followers = followers
+        scanner.exchange = exchange
+        if USE_STATE_STORE:
+            for account_exchange in [exchange] + followers:
+                account_exchange.state_store = state_store
+                account_exchange.restore_state()
+        if USE_CANDLE_FEED:
+            exchange.candle_feed.start()
+        if USE_ORDER_FILL_WATCHER:
+            for account_exchange in [exchange] + followers:
+                account_exchange.order_fills.start()
+        exchange.algorithm_input.refresh(STRATEGY_TYPES, datetime.now().date())
+        exchanges.append(exchange)
+    account_exchanges: List[Exchange] = [
+        account_exchange
+        for exchange in exchanges
+        for account_exchange in [exchange] + exchange.followers
+    ]
+
+    async def for_all(
+        exchanges: List[Exchange], callback: Callable[[Exchange], Awaitable]
+    ) -> None:
+        """Run the callback for every exchange concurrently, so adding assets or
+        accounts doesn't add round trips, and log errors per asset and account"""
+
+        results = await gather(
+            *(callback(exchange) for exchange in exchanges), return_exceptions=True
+        )
+        for exchange, result in zip(exchanges, results):
+            if isinstance(result, Exception):
+                logger.error(
+                    f"Error handling {exchange.asset} on account "
+                    + f"{exchange.account.name}: {result}"
+                )
+
+    # the future markets of all assets come in 1 Coinalyze response and the
+    # exchange markets are loaded once for all accounts, both come from the
+    # startup cache when it is fresh and are refreshed in the background
+    startup_cache = StartupCache()
+    main_ccxt_exchange = ccxt_exchanges[ACCOUNTS[0].name]
+
+    async def fetch_coinalyze_markets() -> List[dict]:
+        """Return the Coinalyze markets of the traded assets"""
+
+        prefixes = tuple(f"{asset}USD" for asset in ASSETS)
+        return [
+            market
+            for market in await exchanges[0].scanner.get_future_markets()
+            if market.get("symbol", "").upper().startswith(prefixes)
+        ]
+
+    async def set_symbols(markets: List[dict]) -> None:
+        """Update the symbols of all scanners"""
+
+        await for_all(exchanges, lambda exchange: exchange.scanner.set_symbols(markets))
+
+    async def fetch_ccxt_markets() -> dict:
+        """Return the markets and currencies of the exchange"""
+
+        await main_ccxt_exchange.load_markets(reload=True)
+        return dict(
+            markets=list(main_ccxt_exchange.markets.values()),
+            currencies=main_ccxt_exchange.currencies,
+        )
+
+    async def set_ccxt_markets(markets: dict) -> None:
+        """Share the markets with the connections of all accounts"""
+
+        main_ccxt_exchange.set_markets(markets["markets"], markets["currencies"])
+        for ccxt_exchange in ccxt_exchanges.values():
+            if ccxt_exchange is not main_ccxt_exchange:
+                ccxt_exchange.set_markets_from_exchange(main_ccxt_exchange)
+
+    async def set_leverages(exchange: Exchange) -> None:
+        """Set the leverage of both position sides of the asset on the account"""
+
+        await gather(
+            *(
+                exchange.set_leverage(
+                    symbol=exchange.ticker,
+                    leverage=exchange.account.leverage,
+                    direction=direction,
+                )
+                for direction in ["long", "short"]
+            )
+        )
+
+    async def load_ccxt_markets_and_prepare_exchanges() -> None:
+        """Load the exchange markets, setting leverages and seeding the candle
+        buffers need them"""
+
+        await startup_cache.load(
+            f"{EXCHANGE_NAME}_markets", fetch_ccxt_markets, set_ccxt_markets
+        )
+        preparations = [for_all(account_exchanges, set_leverages)]
+        if USE_CANDLE_BUFFER:
+            preparations.append(
+                for_all(exchanges, lambda exchange: exchange.seed_candles())
+            )
+        await gather(*preparations)
+
+    await gather(
+        startup_cache.load(
+            "coinalyze_markets", fetch_coinalyze_markets, set_symbols, default=[]
+        ),
+        load_ccxt_markets_and_prepare_exchanges(),
+    )
 
     # start the bot
     info = "Starting / Restarting the bot"
     logger.info(info + "...")
-    logger.info(
-        "BTC markets that will be scanned: %s", ", ".join(scanner.symbols.split(","))
-    )
+    for exchange in exchanges:
+        logger.info(
+            "%s markets that will be scanned: %s",
+            exchange.asset,
+            ", ".join(exchange.scanner.symbols.split(",")),
+        )
     if USE_DISCORD:
-        DISCORD_SETTINGS["symbols"] = scanner.symbols.split(",")
-        exchange.discord_message_queue.append(
+        if len(ACCOUNTS) > 1:
+            DISCORD_SETTINGS["accounts"] = {
+                account.name: account.to_dict() for account in ACCOUNTS
+            }
+        DISCORD_SETTINGS["symbols"] = [
+            symbol
+            for exchange in exchanges
+            for symbol in exchange.scanner.symbols.split(",")
+        ]
+        discord_message_queue.put_nowait(
             DiscordMessage(
                 channel_id=DISCORD_CHANNEL_HEARTBEAT_ID,
                 messages=[
@@ -84,70 +230,108 @@ async def main() -> None:
             )
         )
 
-    while True:
-        now = datetime.now()
-
-        if now.minute % 5 == 0 and now.second == 0:
+        # post messages from the queue through 1 long-lived discord connection
+        discord_dispatcher = DiscordDispatcher(discord_message_queue)
+        discord_dispatcher.start()
 
-            # update scanner time
-            scanner.now = now
-            last_candle: Candle | None = await exchange.get_last_candle()
-            if last_candle:
+    async def run_candle_and_strategy(exchange: Exchange, now: datetime) -> None:
+        """Fetch the last candle, run the strategy and scan for fresh liquidations
+        of 1 asset"""
 
-                # run strategy for the exchange on LIQUIDATIONS list
-                await exchange.run_loop(last_candle)
+        # update scanner time
+        scanner = exchange.scanner
+        scanner.now = now
+        last_candle: Candle | None = await exchange.get_last_candle()
+        if last_candle:
 
-                # check for fresh liquidations and add to LIQUIDATIONS list
-                await scanner.handle_liquidation_set(
-                    last_candle,
-                    await scanner.handle_coinalyze_url(COINALYZE_LIQUIDATION_URL),
-                )
-
-                # log liquidations if any
-                if LIQUIDATIONS:
-                    logger.info(f"{LIQUIDATIONS=}")
+            # run strategy for the exchange on its liquidation set
+            await exchange.run_loop(last_candle)
 
-            await sleep(0.99)
+            # check for fresh liquidations and add to the liquidation set
+            await scanner.handle_liquidation_set(
+                last_candle,
+                await scanner.handle_coinalyze_url(COINALYZE_LIQUIDATION_URL),
+            )
 
-        if now.minute % 5 == 3 and now.second == 0:
+            # log liquidations if any
+            if scanner.liquidation_set:
+                logger.info(f"{scanner.liquidation_set.liquidations=}")
 
-            # fetch open positions and orders from the exchange
-            await exchange.get_open_positions()
+            # store what is pending, so a restart continues with it
+            exchange.save_state()
 
-            await sleep(0.99)
+    async def run_candles_and_strategies(now: datetime) -> None:
+        """Run the candle and strategy step of all assets"""
 
-        if now.minute % 5 == 4 and now.second == 0:
+        await for_all(
+            exchanges, lambda exchange: run_candle_and_strategy(exchange, now)
+        )
 
-            # recalculate position sizes based on current balance
-            await exchange.set_position_sizes()
+    async def get_open_positions(now: datetime) -> None:
+        """Fetch open positions and orders from the exchange"""
 
-            await sleep(0.99)
+        await for_all(account_exchanges, lambda exchange: exchange.get_open_positions())
 
-        if USE_DISCORD and (now.hour % 12 == 8 and now.minute == 1 and now.second == 0):
+    async def set_position_sizes(now: datetime) -> None:
+        """Recalculate position sizes based on current balance"""
 
-            # send heartbeat message to discord
-            exchange.discord_message_queue.append(
-                DiscordMessage(channel_id=DISCORD_CHANNEL_HEARTBEAT_ID, messages=["."])
-            )
+        await for_all(account_exchanges, lambda exchange: exchange.set_position_sizes())
 
-            # update symbols in scanner
-            await scanner.set_symbols()
+    async def refresh_algorithm_input(now: datetime) -> None:
+        """Reload changed algorithm input files and prefetch tomorrow's files"""
 
-            await sleep(0.99)
+        await for_all(
+            exchanges,
+            lambda exchange: to_thread(
+                exchange.algorithm_input.refresh, STRATEGY_TYPES, now.date()
+            ),
+        )
 
-        if USE_DISCORD and exchange.discord_message_queue:
+    async def heartbeat(now: datetime) -> None:
+        """Send a heartbeat message to discord and update symbols in scanners"""
 
-            # post messages to discord from the queue
-            message_queue = deepcopy(exchange.discord_message_queue)
-            exchange.discord_message_queue.clear()
-            threading.Thread(
-                target=post_to_discord,
-                kwargs=dict(message_queue=message_queue),
-            ).start()
+        discord_message_queue.put_nowait(
+            DiscordMessage(
+                channel_id=DISCORD_CHANNEL_HEARTBEAT_ID,
+                messages=[
+                    ".",
+                    get_discord_table(scheduler.lateness_report()),
+                ],
+            )
+        )
+        await startup_cache.refresh(
+            "coinalyze_markets", fetch_coinalyze_markets, set_symbols
+        )
 
-            await sleep(0.99)
+    scheduler = Scheduler()
+    scheduler.add_job("candle_and_strategy", run_candles_and_strategies, FIVE_MINUTES)
+    scheduler.add_job(
+        "get_open_positions",
+        get_open_positions,
+        FIVE_MINUTES,
+        offset=timedelta(minutes=3),
+    )
+    scheduler.add_job(
+        "set_position_sizes",
+        set_position_sizes,
+        FIVE_MINUTES,
+        offset=timedelta(minutes=4),
+    )
+    scheduler.add_job(
+        "refresh_algorithm_input",
+        refresh_algorithm_input,
+        FIVE_MINUTES,
+        offset=timedelta(minutes=2),
+    )
+    if USE_DISCORD:
+        scheduler.add_job(
+            "heartbeat",
+            heartbeat,
+            timedelta(hours=12),
+            offset=timedelta(hours=8, minutes=1),
+        )
 
-        await sleep(0.01)
+    await scheduler.run()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,147 @@
+import csv
+from dataclasses import dataclass
+from datetime import date, timedelta
+import os
+from typing import Dict, Iterable, List, Tuple
+
+from logger import logger
+from misc import AlgorithmInput
+
+
+ALGORITHM_INPUT_DIRECTORY = "algorithm_input/"
+ALGORITHM_INPUT_PREFIX = "algorithm_input-{asset}USDT-"
+
+
+@dataclass
+class AlgorithmInputFile:
+    """AlgorithmInputFile class to hold 1 parsed file, indexed by hour"""
+
+    path: str
+    mtime: float
+    hours: List[AlgorithmInput | None]
+
+
+class AlgorithmInputStore:
+    """In-memory cache of the algorithm input files keyed by (strategy_type, date),
+    so entering a position never has to wait on disk"""
+
+    def __init__(
+        self,
+        directory: str = ALGORITHM_INPUT_DIRECTORY,
+        asset: str = "BTC",
+    ) -> None:
+        self.directory = directory
+        self.prefix = ALGORITHM_INPUT_PREFIX.format(asset=asset)
+        self.files: Dict[Tuple[str, date], AlgorithmInputFile] = {}
+
+    def get_date_path(self, strategy_type: str, input_date: date) -> str:
+        """Return the path of the file for the date, whether it exists or not"""
+
+        return os.path.join(
+            self.directory, f"{self.prefix}{input_date}-{strategy_type}-lvl2.csv"
+        )
+
+    def get_path(self, strategy_type: str, input_date: date) -> str | None:
+        """Return the file for the date, or the last file of the strategy type if
+        there is no file for that date (yet)"""
+
+        path = self.get_date_path(strategy_type, input_date)
+        if os.path.isfile(path):
+            return path
+
+        file_names = sorted(
+            name
+            for name in os.listdir(self.directory)
+            if (
+                name.startswith(self.prefix)
+                and strategy_type in name
+                and name.endswith("lvl2.csv")
+                and os.path.isfile(os.path.join(self.directory, name))
+            )
+        )
+        if not file_names:
+            return None
+        return os.path.join(self.directory, file_names[-1])
+
+    def read(self, path: str) -> List[AlgorithmInput | None]:
+        """Parse an algorithm input file into a list indexed by hour, blank tp and
+        sl (hours that don't trade) are None"""
+
+        hours: List[AlgorithmInput | None] = [None] * 24
+        with open(path, newline="") as csv_file:
+            for row in csv.DictReader(csv_file):
+                hour = int(row["hour"])
+                if row["trade_lvl2"] == "True" and not (row["tp"] and row["sl"]):
+                    logger.error(f"Skipping hour {hour} of {path}: no tp/sl to trade")
+                    continue
+                hours[hour] = AlgorithmInput(
+                    hour=hour,
+                    tp=float(row["tp"]) if row["tp"] else None,
+                    sl=float(row["sl"]) if row["sl"] else None,
+                    performance_lvl2=float(row["performance_lvl2"]),
+                    trade_lvl2=row["trade_lvl2"] == "True",
+                )
+        return hours
+
+    def load(self, strategy_type: str, input_date: date) -> AlgorithmInputFile | None:
+        """(Re)load the file for the strategy type and date if it changed on disk"""
+
+        try:
+            path = self.get_path(strategy_type, input_date)
+            if path is None:
+                logger.error(f"No algorithm input file found for {strategy_type}")
+                return None
+            mtime = os.stat(path).st_mtime
+            cached = self.files.get((strategy_type, input_date))
+            if cached and cached.path == path and cached.mtime == mtime:
+                return cached
+            algorithm_input_file = AlgorithmInputFile(
+                path=path, mtime=mtime, hours=self.read(path)
+            )
+        except Exception as e:
+            logger.error(f"Error loading algorithm input file: {e}")
+            return self.files.get((strategy_type, input_date))
+
+        logger.info(f"Loaded {path} for {strategy_type} on {input_date}")
+        self.files[(strategy_type, input_date)] = algorithm_input_file
+        return algorithm_input_file
+
+    def refresh(self, strategy_types: Iterable[str], today: date) -> None:
+        """Reload changed files for today and prefetch tomorrow, dropping old dates"""
+
+        for key in [key for key in self.files if key[1] < today - timedelta(days=1)]:
+            del self.files[key]
+        for strategy_type in strategy_types:
+            for input_date in [today, today + timedelta(days=1)]:
+                self.load(strategy_type, input_date)
+
+    def is_stale(
+        self,
+        algorithm_input_file: AlgorithmInputFile,
+        strategy_type: str,
+        input_date: date,
+    ) -> bool:
+        """Return whether the file for the date changed on disk or was created after
+        a fallback file was cached for it, 1 stat instead of reading the file"""
+
+        path = self.get_date_path(strategy_type, input_date)
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return False  # no file for the date (yet), the fallback still holds
+        return algorithm_input_file.path != path or algorithm_input_file.mtime != mtime
+
+    def get(
+        self, strategy_type: str, input_date: date, hour: int
+    ) -> AlgorithmInput | None:
+        """Return the algorithm input for the hour, only reading from disk on a miss
+        or when the file for the date changed"""
+
+        algorithm_input_file = self.files.get((strategy_type, input_date))
+        if algorithm_input_file is None or self.is_stale(
+            algorithm_input_file, strategy_type, input_date
+        ):
+            algorithm_input_file = self.load(strategy_type, input_date)
+        if algorithm_input_file is None:
+            return None
+        return algorithm_input_file.hours[hour]
@@ -0,0 +1,330 @@
+"""Generate the per hour algorithm input files by grid searching tp/sl combinations
+of the reversed strategy over historical candles and liquidations.
+
+    python algorithm_input_generator.py --candles candles.csv \\
+        --liquidations liquidations.json --date 2026-03-02
+
+For every hour, the best tp/sl combination is picked on the history before the
+validation window (lvl1) and then checked on the validation window (lvl2).
+Performance is the sum of the trade results in R (multiples of the stop loss).
+"""
+
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+import csv
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+import os
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from algorithm_input import ALGORITHM_INPUT_PREFIX
+from history import read_candles, read_liquidations
+from misc import Candle
+
+
+ALGORITHM_INPUT_COLUMNS = [
+    "hour",
+    "tp",
+    "sl",
+    "performance_lvl1",
+    "trade_lvl1",
+    "performance_lvl2",
+    "trade_lvl2",
+]
+STOPLOSSES = [0.4, 0.6, 0.8, 1.0, 1.2, 1.4]
+RISK_REWARDS = [2, 3, 4, 5]
+FEES = 0.08  # % taker entry + maker take profit
+WINDOW = 288  # candles a trade may stay open (1 day of 5m candles)
+
+
+@dataclass
+class Entry:
+    """Entry class to hold 1 simulated entry of the reversed strategy"""
+
+    index: int
+    direction: int  # 1 long, -1 short
+    hour: int
+    timestamp: int
+
+
+@dataclass
+class HourResult:
+    """HourResult class to hold 1 row of an algorithm input file"""
+
+    hour: int
+    tp: float | None
+    sl: float | None
+    performance_lvl1: float
+    trade_lvl1: bool
+    performance_lvl2: float
+    trade_lvl2: bool
+
+
+def get_grid(
+    stoplosses: List[float] = STOPLOSSES, risk_rewards: List[int] = RISK_REWARDS
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the tp and sl arrays of all combinations"""
+
+    grid = sorted({(round(sl * rr, 1), sl) for sl in stoplosses for rr in risk_rewards})
+    return (
+        np.array([tp for tp, _ in grid], dtype=np.float64),
+        np.array([sl for _, sl in grid], dtype=np.float64),
+    )
+
+
+def get_entries(
+    candles: List[Candle],
+    liquidations: Dict[int, List[dict]],
+    minimal_liquidation: int,
+    minimal_nr_of_liquidations: int,
+    liquidation_days: List[int],
+    forbidden_nr_of_candles_before_entry: List[int],
+) -> List[Entry]:
+    """Walk the liquidations through the same rules as Exchange.handle_liquidation
+    and handle_position_to_open, using the candle opens as the price the bot sees
+    at every 5m boundary"""
+
+    opens = [candle.open for candle in candles]
+    indices = {candle.timestamp: index for index, candle in enumerate(candles)}
+    entries: List[Entry] = []
+    for bar_time, symbols in sorted(liquidations.items()):
+        j = indices.get((bar_time + 300) * 1000)
+        if j is None:
+            continue
+        liquidation_datetime = datetime.fromtimestamp(candles[j].timestamp / 1000)
+        if liquidation_datetime.weekday() not in liquidation_days:
+            continue
+
+        nr_of_liquidations = sum(history.get("l") > 100 for history in symbols) + sum(
+            history.get("s") > 100 for history in symbols
+        )
+        if nr_of_liquidations < minimal_nr_of_liquidations:
+            continue
+
+        for direction, key in [(-1, "l"), (1, "s")]:
+            if sum(history.get(key) for history in symbols) <= minimal_liquidation:
+                continue
+
+            # reaction to the liquidation within 3 candles
+            for k in range(j + 1, min(j + 4, len(candles))):
+                if (direction == -1 and opens[k] > opens[j]) or (
+                    direction == 1 and opens[k] < opens[j]
+                ):
+                    break
+            else:
+                continue
+
+            # enter beyond 0.4%, cancel at 0.4% the other way
+            trigger = opens[k] * (0.996 if direction == -1 else 1.004)
+            cancel = opens[k] * (1.004 if direction == -1 else 0.996)
+            for m in range(k + 1, min(k + 1 + WINDOW, len(candles))):
+                if (direction == -1 and opens[m] > cancel) or (
+                    direction == 1 and opens[m] < cancel
+                ):
+                    break
+                if (direction == -1 and opens[m] < trigger) or (
+                    direction == 1 and opens[m] > trigger
+                ):
+                    if m - k + 1 not in forbidden_nr_of_candles_before_entry:
+                        entries.append(
+                            Entry(
+                                index=m,
+                                direction=direction,
+                                hour=liquidation_datetime.hour,
+                                timestamp=candles[m].timestamp,
+                            )
+                        )
+                    break
+    return entries
+
+
+def get_windows(
+    candles: List[Candle], entries: List[Entry]
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return the favorable and adverse excursion (%) and the final result (%) of
+    every entry over the next WINDOW candles"""
+
+    high = np.array([candle.high for candle in candles])
+    low = np.array([candle.low for candle in candles])
+    close = np.array([candle.close for candle in candles])
+    opens = np.array([candle.open for candle in candles])
+
+    index = np.array([entry.index for entry in entries])
+    direction = np.array([entry.direction for entry in entries])[:, None]
+    window = np.minimum(index[:, None] + np.arange(WINDOW)[None, :], len(candles) - 1)
+    price = opens[index][:, None]
+    up = (high[window] / price - 1) * 100
+    down = (low[window] / price - 1) * 100
+
+    favorable = np.maximum.accumulate(np.where(direction == 1, up, -down), axis=1)
+    adverse = np.minimum.accumulate(np.where(direction == 1, down, -up), axis=1)
+    final = ((close[window[:, -1]] / price[:, 0] - 1) * 100) * direction[:, 0]
+    return favorable, adverse, final
+
+
+def evaluate_hour(
+    hour: int,
+    favorable: np.ndarray,
+    adverse: np.ndarray,
+    final: np.ndarray,
+    validation: np.ndarray,
+    tps: np.ndarray,
+    sls: np.ndarray,
+) -> HourResult:
+    """Evaluate all tp/sl combinations for the entries of 1 hour at once"""
+
+    if not len(final):
+        return HourResult(hour, None, None, 0.0, False, 0.0, False)
+
+    # first candle hitting the take profit / stop loss, WINDOW if never
+    tp_hit = favorable[:, None, :] >= tps[None, :, None]
+    sl_hit = adverse[:, None, :] <= -sls[None, :, None]
+    first_tp = np.where(tp_hit.any(axis=2), tp_hit.argmax(axis=2), WINDOW)
+    first_sl = np.where(sl_hit.any(axis=2), sl_hit.argmax(axis=2), WINDOW)
+
+    # results in R, the stop loss wins a tie within the same candle
+    results = np.where(
+        first_tp < first_sl,
+        tps / sls,
+        np.where(first_sl < WINDOW, -1.0, final[:, None] / sls[None, :]),
+    ) - (FEES / sls)
+
+    performance_lvl1 = results[~validation].sum(axis=0)
+    performance_lvl2 = results[validation].sum(axis=0)
+    best = int(performance_lvl1.argmax())
+    trade_lvl1 = bool(performance_lvl1[best] > 0)
+    return HourResult(
+        hour=hour,
+        tp=float(tps[best]) if trade_lvl1 else None,
+        sl=float(sls[best]) if trade_lvl1 else None,
+        performance_lvl1=round(float(performance_lvl1[best]), 2),
+        trade_lvl1=trade_lvl1,
+        performance_lvl2=round(float(performance_lvl2[best]), 2),
+        trade_lvl2=trade_lvl1 and bool(performance_lvl2[best] > 0),
+    )
+
+
+def generate(
+    candles: List[Candle],
+    liquidations: Dict[int, List[dict]],
+    for_date: date,
+    validation_days: int,
+    minimal_liquidation: int,
+    minimal_nr_of_liquidations: int,
+    liquidation_days: List[int],
+    forbidden_nr_of_candles_before_entry: List[int],
+    workers: int | None = None,
+) -> List[HourResult]:
+    """Grid search every hour on a process pool, using data before for_date"""
+
+    until = datetime.combine(for_date, datetime.min.time()).timestamp() * 1000
+    candles = [candle for candle in candles if candle.timestamp < until]
+    validation_start = until - validation_days * 24 * 60 * 60 * 1000
+    entries = get_entries(
+        candles,
+        liquidations,
+        minimal_liquidation,
+        minimal_nr_of_liquidations,
+        liquidation_days,
+        forbidden_nr_of_candles_before_entry,
+    )
+    if not entries:
+        return [
+            HourResult(hour, None, None, 0.0, False, 0.0, False) for hour in range(24)
+        ]
+
+    tps, sls = get_grid()
+    favorable, adverse, final = get_windows(candles, entries)
+    hours = np.array([entry.hour for entry in entries])
+    validation = np.array([entry.timestamp >= validation_start for entry in entries])
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                evaluate_hour,
+                hour,
+                favorable[hours == hour],
+                adverse[hours == hour],
+                final[hours == hour],
+                validation[hours == hour],
+                tps,
+                sls,
+            )
+            for hour in range(24)
+        ]
+        return [future.result() for future in futures]
+
+
+def write_algorithm_input(results: List[HourResult], path: str) -> None:
+    """Write the results in the algorithm input file format, like the example file
+    tp and sl are blank for the hours without a profitable combination (lvl1)"""
+
+    with open(path, "w", newline="") as csv_file:
+        writer = csv.writer(csv_file, lineterminator="\n")
+        writer.writerow(ALGORITHM_INPUT_COLUMNS)
+        for result in results:
+            if result.trade_lvl2 and (result.tp is None or result.sl is None):
+                raise ValueError(f"Hour {result.hour} trades lvl2 without tp/sl")
+            writer.writerow(
+                [
+                    result.hour,
+                    "" if result.tp is None else result.tp,
+                    "" if result.sl is None else result.sl,
+                    result.performance_lvl1,
+                    result.trade_lvl1,
+                    result.performance_lvl2,
+                    result.trade_lvl2,
+                ]
+            )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--candles", required=True)
+    parser.add_argument("--liquidations", required=True)
+    parser.add_argument("--date", type=date.fromisoformat, default=date.today())
+    parser.add_argument("--days", type=int, default=1, help="files to generate")
+    parser.add_argument("--validation-days", type=int, default=30)
+    parser.add_argument("--minimal-liquidation", type=int, default=2000)
+    parser.add_argument("--minimal-nr-of-liquidations", type=int, default=1)
+    parser.add_argument(
+        "--liquidation-days", type=int, nargs="*", default=[0, 1, 2, 3, 4]
+    )
+    parser.add_argument(
+        "--forbidden-nr-of-candles-before-entry", type=int, nargs="*", default=[1]
+    )
+    parser.add_argument("--asset", default="BTC")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--output", default="algorithm_input/")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    candles = read_candles(args.candles)
+    liquidations = read_liquidations(args.liquidations)
+    os.makedirs(args.output, exist_ok=True)
+    for day in range(args.days):
+        for_date = args.date + timedelta(days=day)
+        results = generate(
+            candles,
+            liquidations,
+            for_date,
+            args.validation_days,
+            args.minimal_liquidation,
+            args.minimal_nr_of_liquidations,
+            args.liquidation_days,
+            args.forbidden_nr_of_candles_before_entry,
+            args.workers,
+        )
+        path = os.path.join(
+            args.output,
+            ALGORITHM_INPUT_PREFIX.format(asset=args.asset)
+            + f"{for_date}-reversed-lvl2.csv",
+        )
+        write_algorithm_input(results, path)
+        print(
+            f"{path}: {sum(result.trade_lvl2 for result in results)} hour(s) to trade"
+        )
+    print(f"generated in {time.perf_counter() - started:.2f}s")
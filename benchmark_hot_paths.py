@@ -0,0 +1,290 @@
+"""Micro-benchmark the pure hot paths of the trading tick.
+
+    python benchmark_hot_paths.py --save baseline.json
+    python benchmark_hot_paths.py --compare baseline.json --threshold 0.2
+
+Times the scanner, exchange and message formatting functions that run every tick
+without waiting on the network, so performance work on the tick path can be
+measured. --save stores the results as a JSON baseline, --compare flags every
+function whose median got slower than the baseline by more than --threshold and
+exits with status 1 if any did.
+"""
+
+import offline  # noqa: F401, must be imported before the bot modules
+
+from argparse import ArgumentParser
+from asyncio import run
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from inspect import isawaitable
+import json
+import logging
+import platform
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+from algorithm_input import AlgorithmInputFile
+from benchmark_order_path import PRICE, get_exchange, get_position_to_open
+from candle_buffer import CandleBuffer
+from discord_client import get_discord_table
+from exchange import Exchange, LONG, SHORT
+from logger import logger
+from misc import AlgorithmInput, Candle, Liquidation, LiquidationSet
+from simulated_exchange import SimulatedExchange
+
+
+@dataclass
+class Case:
+    """Case class to hold 1 micro-benchmark, setup runs untimed before every sample
+    and returns the call to time number times"""
+
+    name: str
+    setup: Callable[[], Callable[[], Any]]
+    number: int = 1
+
+
+def get_liquidation(
+    now: datetime, _id: str = "l-bench", minutes_ago: int = 5
+) -> Liquidation:
+    """Return a short liquidation whose candle low is above PRICE, so the reaction
+    to it is strong"""
+
+    timestamp = now - timedelta(minutes=minutes_ago)
+    return Liquidation(
+        _id=_id,
+        amount=250000,
+        direction=SHORT,
+        time=int(timestamp.timestamp()),
+        nr_of_liquidations=3,
+        candle=Candle(
+            int(timestamp.timestamp() * 1000),
+            PRICE + 200,
+            PRICE + 300,
+            PRICE + 100,
+            PRICE + 150,
+            1000,
+        ),
+        on_liquidation_days=True,
+    )
+
+
+def get_cases(exchange: Exchange, symbols: int, liquidations: int) -> List[Case]:
+    """Return the benchmark cases, trading on the exchange"""
+
+    now = exchange.scanner.now
+    candle = exchange.exchange.candle
+    # reversed input for every hour, so handle_liquidation creates a setup
+    exchange.algorithm_input.files[
+        ("reversed", (now - timedelta(minutes=5)).date())
+    ] = AlgorithmInputFile(
+        path="",
+        mtime=0,
+        hours=[
+            AlgorithmInput(
+                hour=hour, tp=1.5, sl=0.5, performance_lvl2=3.0, trade_lvl2=True
+            )
+            for hour in range(24)
+        ],
+    )
+    history = [
+        {"t": int(now.timestamp()), "l": 150.0 + nr, "s": 80.0 + nr}
+        for nr in range(symbols)
+    ]
+    liquidation = get_liquidation(now)
+    liquidation_set = LiquidationSet(
+        get_liquidation(now, _id=f"l-bench-{nr}", minutes_ago=nr % 20)
+        for nr in range(liquidations)
+    )
+
+    def handle_liquidation_set() -> Callable[[], Any]:
+        exchange.scanner.liquidation_set = LiquidationSet()
+        return lambda: exchange.scanner.handle_liquidation_set(candle, history)
+
+    def handle_liquidation() -> Callable[[], Any]:
+        exchange.liquidation_set = LiquidationSet([liquidation])
+        exchange.positions_to_open = []
+        return lambda: exchange.handle_liquidation(liquidation, candle)
+
+    def handle_position_to_open(cancel: bool) -> Callable[[], Any]:
+        position_to_open = get_position_to_open(exchange)
+        # not entered: the price is below long_above, or above cancel_above
+        position_to_open.long_above = PRICE + 100
+        if cancel:
+            position_to_open.cancel_above = PRICE - 100
+        exchange.positions_to_open = [position_to_open]
+        return lambda: exchange.handle_position_to_open(position_to_open, candle)
+
+    def remove_old_liquidations() -> Callable[[], Any]:
+        old_liquidation_set = LiquidationSet(liquidation_set.liquidations)
+        return lambda: old_liquidation_set.remove_old_liquidations(now)
+
+    def append_candle() -> Callable[[], Any]:
+        timestamp = exchange.candles.last.timestamp + 300000
+        return lambda: exchange.candles.append(
+            Candle(timestamp, PRICE, PRICE + 10, PRICE - 10, PRICE + 5, 10)
+        )
+
+    exchange.candles = CandleBuffer()
+    exchange.candles.extend(
+        Candle(
+            candle.timestamp - minutes * 60000,
+            PRICE,
+            PRICE + minutes % 7,
+            PRICE - minutes % 5,
+            PRICE + 1,
+            10,
+        )
+        for minutes in range(0, exchange.candles.size * 5, 5)
+    )
+    message_dict = get_position_to_open(exchange).init_message_dict()
+    return [
+        Case(f"handle_liquidation_set[{symbols} symbols]", handle_liquidation_set),
+        Case("handle_liquidation", handle_liquidation),
+        Case(
+            "handle_position_to_open[waiting]",
+            lambda: handle_position_to_open(cancel=False),
+        ),
+        Case(
+            "handle_position_to_open[cancel]",
+            lambda: handle_position_to_open(cancel=True),
+        ),
+        Case(
+            "get_sl_and_tp_price",
+            lambda: lambda: exchange.get_sl_and_tp_price(LONG, PRICE, 0.5, 1.5),
+            number=100,
+        ),
+        Case(
+            f"LiquidationSet.total_amount[{liquidations}]",
+            lambda: lambda: liquidation_set.total_amount(SHORT),
+            number=100,
+        ),
+        Case(
+            f"LiquidationSet.remove_old_liquidations[{liquidations}]",
+            remove_old_liquidations,
+        ),
+        Case("Liquidation.to_dict", lambda: liquidation.to_dict, number=100),
+        Case("CandleBuffer.append", append_candle),
+        Case("CandleBuffer.atr", lambda: exchange.candles.atr, number=100),
+        Case(
+            "CandleBuffer.highest_since",
+            lambda: lambda: exchange.candles.highest_since(
+                liquidation.candle.timestamp
+            ),
+            number=100,
+        ),
+        Case(
+            "get_discord_table",
+            lambda: lambda: get_discord_table(message_dict),
+            number=10,
+        ),
+    ]
+
+
+async def measure(case: Case, samples: int) -> List[float]:
+    """Return the µs per call of every sample of the case"""
+
+    timings = []
+    for _ in range(samples):
+        call = case.setup()
+        start = time.perf_counter_ns()
+        for _ in range(case.number):
+            result = call()
+            if isawaitable(result):
+                await result
+        timings.append((time.perf_counter_ns() - start) / case.number / 1000)
+    return timings
+
+
+async def benchmark(
+    samples: int, symbols: int, liquidations: int
+) -> Dict[str, Dict[str, float]]:
+    """Run the cases and return min / median / p95 per case in µs"""
+
+    exchange = await get_exchange(SimulatedExchange(latency=0, seed=0))
+    results = {}
+    for case in get_cases(exchange, symbols, liquidations):
+        await measure(case, max(samples // 10, 1))  # warm up
+        values = sorted(await measure(case, samples))
+        results[case.name] = dict(
+            min=round(values[0], 3),
+            median=round(statistics.median(values), 3),
+            p95=round(values[min(int(len(values) * 0.95), len(values) - 1)], 3),
+        )
+    return results
+
+
+def compare(
+    results: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    threshold: float,
+) -> List[str]:
+    """Print the medians next to the baseline and return the regressed cases"""
+
+    regressions = []
+    print(f"{'case (µs)':<48}{'baseline':>12}{'median':>12}{'change':>10}")
+    for name, result in results.items():
+        if name not in baseline:
+            print(f"{name:<48}{'-':>12}{result['median']:>12}{'new':>10}")
+            continue
+        change = result["median"] / baseline[name]["median"] - 1
+        regressed = change > threshold
+        if regressed:
+            regressions.append(name)
+        print(
+            f"{name:<48}{baseline[name]['median']:>12}{result['median']:>12}"
+            + f"{change:>+10.1%}"
+            + ("  REGRESSION" if regressed else "")
+        )
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--samples", type=int, default=1000, help="per case")
+    parser.add_argument("--symbols", type=int, default=500, help="Coinalyze symbols")
+    parser.add_argument(
+        "--liquidations", type=int, default=1000, help="in the liquidation set"
+    )
+    parser.add_argument("--save", help="write the results as baseline to this file")
+    parser.add_argument("--compare", help="compare the results to this baseline")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="fraction a median may get slower before it is a regression",
+    )
+    args = parser.parse_args()
+
+    logger.setLevel(logging.CRITICAL)
+    results = run(benchmark(args.samples, args.symbols, args.liquidations))
+
+    if args.compare:
+        with open(args.compare) as json_file:
+            baseline = json.load(json_file)["results"]
+        regressions = compare(results, baseline, args.threshold)
+    else:
+        regressions = []
+        print(f"{'case (µs)':<48}{'min':>12}{'median':>12}{'p95':>12}")
+        for name, result in results.items():
+            print(
+                f"{name:<48}"
+                + "".join(f"{result[key]:>12}" for key in ["min", "median", "p95"])
+            )
+    if args.save:
+        with open(args.save, "w") as json_file:
+            json.dump(
+                dict(
+                    python=platform.python_version(),
+                    machine=platform.machine(),
+                    created=datetime.now().isoformat(timespec="seconds"),
+                    samples=args.samples,
+                    results=results,
+                ),
+                json_file,
+                indent=2,
+            )
+    if regressions:
+        print(f"{len(regressions)} regression(s) above {args.threshold:.0%}")
+        sys.exit(1)
@@ -0,0 +1,280 @@
+"""Benchmark the order path of the bot against the simulated exchange.
+
+    python benchmark_order_path.py --latency 0.05 --runs 10
+
+Measures the time from calling handle_position_to_open with its conditions met
+until the entry and the take profit order are acknowledged, the time from calling
+run_loop with --pending setups until the entry of the last one is acknowledged,
+the time until the take profit orders of all --accounts are acknowledged, and the
+wall time of set_leverage, set_position_sizes and get_open_positions.
+"""
+
+import offline  # noqa: F401, must be imported before the bot modules
+
+from argparse import ArgumentParser
+from asyncio import run
+from datetime import datetime, timedelta
+import json
+import logging
+import statistics
+import time
+from typing import Dict, List
+
+from coinalyze_scanner import CoinalyzeScanner
+from exchange import Exchange, LEVERAGE
+from logger import logger
+from misc import Candle, Liquidation, LiquidationSet, PositionToOpen
+from simulated_exchange import SimulatedExchange
+
+PRICE = 60000.0
+
+
+async def get_exchange(simulated_exchange: SimulatedExchange) -> Exchange:
+    """Return an Exchange trading on the simulated exchange at a 5m boundary"""
+
+    now = datetime.now().replace(second=0, microsecond=0)
+    now -= timedelta(minutes=now.minute % 5)
+    candle = Candle(int(now.timestamp() * 1000), PRICE, PRICE, PRICE, PRICE, 0)
+    simulated_exchange.set_candle(candle)
+    scanner = CoinalyzeScanner(now, LiquidationSet(liquidations=[]))
+    exchange = Exchange(scanner.liquidation_set, scanner)
+    exchange.exchange = simulated_exchange
+    scanner.exchange = exchange
+    await exchange.set_position_sizes()
+    return exchange
+
+
+def get_position_to_open(exchange: Exchange, _id: str = "s-bench") -> PositionToOpen:
+    """Return a long setup whose conditions are met at PRICE"""
+
+    now = exchange.scanner.now
+    liquidation_candle = exchange.exchange.candle
+    liquidation = Liquidation(
+        _id=_id,
+        amount=100000,
+        direction="short",
+        time=int((now - timedelta(minutes=15)).timestamp()),
+        nr_of_liquidations=1,
+        candle=liquidation_candle,
+        on_liquidation_days=True,
+    )
+    return PositionToOpen(
+        _id=liquidation._id,
+        liquidation=liquidation,
+        candles_before_confirmation=0,
+        long_above=PRICE - 100,
+        long_tp=2.0,
+        long_sl=0.5,
+        long_weight=1.0,
+        short_below=None,
+        short_tp=None,
+        short_sl=None,
+        short_weight=None,
+        cancel_above=None,
+        cancel_below=None,
+    )
+
+
+async def measure_order_path(simulated_exchange: SimulatedExchange) -> Dict[str, float]:
+    """Return the ms until the entry and take profit orders are acknowledged"""
+
+    exchange = await get_exchange(simulated_exchange)
+    position_to_open = get_position_to_open(exchange)
+    exchange.positions_to_open.append(position_to_open)
+    simulated_exchange.calls.clear()
+
+    start = time.perf_counter()
+    try:
+        await exchange.handle_position_to_open(
+            position_to_open, simulated_exchange.candle
+        )
+    except Exception as e:
+        print(f"handle_position_to_open failed: {type(e).__name__}: {e}")
+    orders = [
+        acknowledged
+        for method, acknowledged in simulated_exchange.calls
+        if method == "create_order"
+    ]
+    return {
+        "entry": (orders[0] - start) * 1000 if len(orders) > 0 else float("nan"),
+        "take_profit": (orders[1] - start) * 1000 if len(orders) > 1 else float("nan"),
+    }
+
+
+async def measure_run_loop(
+    simulated_exchange: SimulatedExchange, pending: int
+) -> Dict[str, float]:
+    """Return the ms until the entry of the last of the pending setups is
+    acknowledged, when the others are evaluated but not entered"""
+
+    exchange = await get_exchange(simulated_exchange)
+    exchange.positions_to_open = [
+        get_position_to_open(exchange, _id=f"s-bench-{nr}") for nr in range(pending)
+    ]
+    # only the last setup's conditions are met
+    for position_to_open in exchange.positions_to_open[:-1]:
+        position_to_open.long_above = PRICE + 100
+    simulated_exchange.calls.clear()
+
+    start = time.perf_counter()
+    await exchange.run_loop(simulated_exchange.candle)
+    orders = [
+        acknowledged
+        for method, acknowledged in simulated_exchange.calls
+        if method == "create_order"
+    ]
+    return {"run_loop_entry": (orders[0] - start) * 1000 if orders else float("nan")}
+
+
+async def measure_fan_out(
+    simulated_exchanges: List[SimulatedExchange],
+) -> Dict[str, float]:
+    """Return the ms until the take profit orders on all accounts are acknowledged,
+    with the first simulated exchange as main account and the others as followers"""
+
+    exchange, *followers = [
+        await get_exchange(simulated_exchange)
+        for simulated_exchange in simulated_exchanges
+    ]
+    exchange.followers = followers
+    position_to_open = get_position_to_open(exchange)
+    exchange.positions_to_open.append(position_to_open)
+    for simulated_exchange in simulated_exchanges:
+        simulated_exchange.calls.clear()
+
+    start = time.perf_counter()
+    await exchange.handle_position_to_open(
+        position_to_open, simulated_exchanges[0].candle
+    )
+    take_profits = [
+        [
+            acknowledged
+            for method, acknowledged in simulated_exchange.calls
+            if method == "create_order"
+        ][1:2]
+        for simulated_exchange in simulated_exchanges
+    ]
+    return {
+        "fan_out_take_profit": (
+            (max(take_profit[0] for take_profit in take_profits) - start) * 1000
+            if all(take_profits)
+            else float("nan")
+        )
+    }
+
+
+async def measure_calls(simulated_exchange: SimulatedExchange) -> Dict[str, float]:
+    """Return the ms spent in the other exchange calls of the bot"""
+
+    exchange = await get_exchange(simulated_exchange)
+    timings = {}
+    start = time.perf_counter()
+    for direction in ["long", "short"]:
+        await exchange.set_leverage(
+            symbol=exchange.ticker, leverage=LEVERAGE, direction=direction
+        )
+    timings["set_leverage"] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    await exchange.set_position_sizes()
+    timings["set_position_sizes"] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    await exchange.get_open_positions()
+    timings["get_open_positions"] = (time.perf_counter() - start) * 1000
+    return timings
+
+
+async def benchmark(
+    runs: int,
+    latency: float,
+    jitter: float,
+    failure_rate: float,
+    report_fills: bool,
+    pending: int,
+    accounts: int,
+) -> Dict[str, Dict[str, float]]:
+    """Run the measurements and return min / median / p95 / max per stage in ms"""
+
+    samples: Dict[str, List[float]] = {}
+    for run_nr in range(runs):
+        simulated_exchange, *simulated_followers = [
+            SimulatedExchange(
+                latency=latency,
+                jitter=jitter,
+                failure_rate=failure_rate,
+                report_fills=report_fills,
+                seed=run_nr * accounts + account_nr,
+            )
+            for account_nr in range(accounts)
+        ]
+        for stage, ms in (await measure_order_path(simulated_exchange)).items():
+            samples.setdefault(stage, []).append(ms)
+        for stage, ms in (await measure_run_loop(simulated_exchange, pending)).items():
+            samples.setdefault(stage, []).append(ms)
+        for stage, ms in (
+            await measure_fan_out([simulated_exchange] + simulated_followers)
+        ).items():
+            samples.setdefault(stage, []).append(ms)
+        for stage, ms in (await measure_calls(simulated_exchange)).items():
+            samples.setdefault(stage, []).append(ms)
+
+    results = {}
+    for stage, values in samples.items():
+        values = sorted(value for value in values if value == value)  # drop nan
+        if not values:
+            results[stage] = dict(failed=runs)
+            continue
+        results[stage] = dict(
+            min=round(values[0], 2),
+            median=round(statistics.median(values), 2),
+            p95=round(values[min(int(len(values) * 0.95), len(values) - 1)], 2),
+            max=round(values[-1], 2),
+            failed=runs - len(values),
+        )
+    return results
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds")
+    parser.add_argument("--jitter", type=float, default=0.2, help="fraction")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--poll-fills",
+        action="store_true",
+        help="order responses without fills, like BloFin's",
+    )
+    parser.add_argument("--pending", type=int, default=5, help="setups in run_loop")
+    parser.add_argument("--accounts", type=int, default=3, help="to fan out to")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    logger.setLevel(logging.CRITICAL)
+    results = run(
+        benchmark(
+            args.runs,
+            args.latency,
+            args.jitter,
+            args.failure_rate,
+            not args.poll_fills,
+            args.pending,
+            args.accounts,
+        )
+    )
+
+    print(
+        f"{'stage (ms)':<24}{'min':>10}{'median':>10}{'p95':>10}{'max':>10}{'failed':>8}"
+    )
+    for stage, result in results.items():
+        print(
+            f"{stage:<24}"
+            + "".join(
+                f"{result.get(key, '-'):>10}" for key in ["min", "median", "p95", "max"]
+            )
+            + f"{result['failed']:>8}"
+        )
+    if args.json:
+        with open(args.json, "w") as json_file:
+            json.dump(results, json_file, indent=2)
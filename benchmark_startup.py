@@ -0,0 +1,117 @@
+"""Profile the import time of the bot entry point per module.
+
+    python benchmark_startup.py --top 20
+    python benchmark_startup.py --budget 1.5
+
+Imports __main__.py (without running main) in fresh interpreters with
+-X importtime and prints the modules with the largest cumulative import time of
+the median run and its total, which every restart waits for before main() runs.
+The bot's own settings are used, --offline profiles it without credentials.
+--budget exits with status 1 when the median is over the budget (s), so a change
+that slows down restarts is caught before it is deployed.
+"""
+
+from argparse import ArgumentParser
+from dataclasses import dataclass
+import subprocess
+import sys
+from typing import List, Tuple
+
+
+ENTRY_POINT = "__main__.py"
+IMPORT_TIME_PREFIX = "import time:"
+
+
+@dataclass
+class ModuleTime:
+    """ModuleTime class to hold the import time of 1 module in µs, cumulative
+    includes the modules it imported"""
+
+    module: str
+    self_time: int
+    cumulative: int
+    depth: int
+
+
+def parse_import_times(stderr: str) -> List[ModuleTime]:
+    """Return the module import times of -X importtime output"""
+
+    module_times = []
+    for line in stderr.splitlines():
+        if not line.startswith(IMPORT_TIME_PREFIX):
+            continue
+        self_time, cumulative, module = line[len(IMPORT_TIME_PREFIX) :].split("|")
+        if not self_time.strip().isdigit():
+            continue  # the header
+        name = module.strip()
+        module_times.append(
+            ModuleTime(
+                module=name,
+                self_time=int(self_time),
+                cumulative=int(cumulative),
+                depth=(len(module) - len(module.lstrip()) - 1) // 2,
+            )
+        )
+    return module_times
+
+
+def profile(entry_point: str, offline: bool) -> Tuple[float, List[ModuleTime]]:
+    """Import the entry point in a fresh interpreter, returns the seconds it took
+    and the import time per module"""
+
+    code = (
+        ("import offline; " if offline else "")
+        + "import runpy, time; start = time.perf_counter(); "
+        + f"runpy.run_path({entry_point!r}, run_name='benchmark_startup'); "
+        + "print(time.perf_counter() - start)"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return float(result.stdout.split()[-1]), parse_import_times(result.stderr)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entry-point", default=ENTRY_POINT)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=25, help="modules to print")
+    parser.add_argument(
+        "--budget", type=float, help="seconds the import may take at most"
+    )
+    parser.add_argument(
+        "--offline", action="store_true", help="dummy credentials, no discord"
+    )
+    args = parser.parse_args()
+
+    runs = sorted(
+        (profile(args.entry_point, args.offline) for _ in range(args.runs)),
+        key=lambda run: run[0],
+    )
+    seconds, module_times = runs[len(runs) // 2]
+
+    print(f"{'module':<56}{'self (ms)':>12}{'cumulative (ms)':>18}")
+    for module_time in sorted(
+        module_times, key=lambda module_time: module_time.cumulative, reverse=True
+    )[: args.top]:
+        print(
+            f"{'  ' * module_time.depth + module_time.module:<56}"
+            + f"{module_time.self_time / 1000:>12.1f}"
+            + f"{module_time.cumulative / 1000:>18.1f}"
+        )
+    top_level = [module_time for module_time in module_times if not module_time.depth]
+    print(
+        f"{len(module_times)} modules, {len(top_level)} imported by "
+        + f"{args.entry_point}: {sum(m.cumulative for m in top_level) / 1000:.1f} ms"
+    )
+    print(
+        f"{args.entry_point} imported in {seconds:.3f} s (median of {args.runs}, "
+        + f"{runs[0][0]:.3f} - {runs[-1][0]:.3f} s)"
+    )
+    if args.budget is not None and seconds > args.budget:
+        print(f"Over the budget of {args.budget:.3f} s")
+        sys.exit(1)
@@ -0,0 +1,136 @@
+from typing import Iterable, List
+
+from decouple import config
+
+from lazy_imports import lazy_import
+from logger import logger
+from misc import Candle
+
+
+USE_CANDLE_BUFFER = config("USE_CANDLE_BUFFER", cast=bool, default=False)
+logger.info(f"{USE_CANDLE_BUFFER=}")
+CANDLE_BUFFER_SIZE = config("CANDLE_BUFFER_SIZE", cast=int, default="288")
+logger.info(f"{CANDLE_BUFFER_SIZE=}")  # 288 5m candles is 1 day
+TIMESTAMP, OPEN, HIGH, LOW, CLOSE, VOLUME = range(6)  # columns
+
+# imported when the first buffer is created, not when the bot starts
+np = lazy_import("numpy")
+
+
+class CandleBuffer:
+    """Fixed-size ring of the last candles of 1 symbol in a NumPy array, so the
+    strategy can look back without extra REST calls.
+
+    Every row is written twice, size rows apart, so the last size candles are
+    always 1 contiguous view of the array and the helpers never copy."""
+
+    def __init__(self, size: int = CANDLE_BUFFER_SIZE, time_frame: str = "5m") -> None:
+        self.size = size
+        self.time_frame = time_frame
+        self.rows = np.zeros((2 * size, 6))
+        self.count = 0  # candles appended, including the overwritten ones
+
+    def __len__(self) -> int:
+        return min(self.count, self.size)
+
+    @property
+    def candles(self) -> "np.ndarray":
+        """Return the stored candles from old to new, a view of the ring"""
+
+        if self.count <= self.size:
+            return self.rows[: self.count]
+        start = self.count % self.size
+        return self.rows[start : start + self.size]
+
+    @property
+    def last(self) -> Candle | None:
+        """Return the newest candle"""
+
+        if not self.count:
+            return None
+        row = self.candles[-1]
+        return Candle(
+            int(row[TIMESTAMP]), *row[OPEN:].tolist(), time_frame=self.time_frame
+        )
+
+    def append(self, candle: Candle) -> None:
+        """Store a candle, updating it when its timestamp is stored already (the
+        running candle changes until it closes)"""
+
+        row = (
+            candle.timestamp,
+            candle.open,
+            candle.high,
+            candle.low,
+            candle.close,
+            candle.volume,
+        )
+        candles = self.candles
+        if self.count and candle.timestamp <= candles[-1, TIMESTAMP]:
+            index = int(np.searchsorted(candles[:, TIMESTAMP], candle.timestamp))
+            if candles[index, TIMESTAMP] == candle.timestamp:
+                slot = (self.count - len(self) + index) % self.size
+                self.rows[slot] = row
+                self.rows[slot + self.size] = row
+            return  # older than the stored candles or missing, not stored
+
+        slot = self.count % self.size
+        self.rows[slot] = row
+        self.rows[slot + self.size] = row
+        self.count += 1
+
+    def extend(self, candles: Iterable[Candle]) -> None:
+        """Store candles, e.g. the bulk fetch that seeds the buffer"""
+
+        for candle in sorted(candles, key=lambda candle: candle.timestamp):
+            self.append(candle)
+
+    def since(self, timestamp: int) -> "np.ndarray":
+        """Return the candles that opened at or after timestamp (ms)"""
+
+        candles = self.candles
+        return candles[np.searchsorted(candles[:, TIMESTAMP], timestamp) :]
+
+    def ranges(self, n: int | None = None) -> "np.ndarray":
+        """Return high - low of the last n candles (all by default)"""
+
+        candles = self.candles[-n:] if n else self.candles
+        return candles[:, HIGH] - candles[:, LOW]
+
+    def true_ranges(self) -> "np.ndarray":
+        """Return the true range of every candle after the first, the range
+        including the gap from the previous close"""
+
+        candles = self.candles
+        previous_close = candles[:-1, CLOSE]
+        return np.maximum(candles[1:, HIGH], previous_close) - np.minimum(
+            candles[1:, LOW], previous_close
+        )
+
+    def atr(self, period: int = 14) -> float | None:
+        """Return the average true range of the last period candles, None when
+        fewer candles are stored"""
+
+        if len(self) <= period:
+            return None
+        return float(self.true_ranges()[-period:].mean())
+
+    def highest_since(self, timestamp: int) -> float | None:
+        """Return the highest high since timestamp (ms), None without candles"""
+
+        candles = self.since(timestamp)
+        return float(candles[:, HIGH].max()) if len(candles) else None
+
+    def lowest_since(self, timestamp: int) -> float | None:
+        """Return the lowest low since timestamp (ms), None without candles"""
+
+        candles = self.since(timestamp)
+        return float(candles[:, LOW].min()) if len(candles) else None
+
+    def to_candles(self) -> List[Candle]:
+        """Return the stored candles as Candle instances"""
+
+        return [
+            Candle(int(row[TIMESTAMP]), *row[OPEN:], time_frame=self.time_frame)
+            for row in self.candles.tolist()
+        ]
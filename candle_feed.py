@@ -0,0 +1,101 @@
+from asyncio import CancelledError, Event, Task, create_task, sleep, timeout
+import ccxt.pro as ccxt
+from decouple import config
+from logger import logger
+from misc import Candle
+from typing import Dict
+
+
+USE_CANDLE_FEED = config("USE_CANDLE_FEED", cast=bool, default=True)
+logger.info(f"{USE_CANDLE_FEED=}")
+CANDLE_FEED_TIMEOUT = config(
+    "CANDLE_FEED_TIMEOUT", cast=float, default="2.0"
+)  # seconds to wait for the candle before falling back to REST
+CANDLE_FEED_RECONNECT_DELAY = config(
+    "CANDLE_FEED_RECONNECT_DELAY", cast=float, default="1.0"
+)  # seconds
+CANDLE_FEED_MAX_CANDLES = 12
+
+
+class CandleFeed:
+    """Keeps a live websocket subscription to the candles of 1 symbol, so the
+    strategy does not have to make a REST round trip at the candle boundary"""
+
+    def __init__(
+        self, exchange: ccxt.Exchange, symbol: str, timeframe: str = "5m"
+    ) -> None:
+        self.exchange = exchange
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.candles: Dict[int, Candle] = {}
+        self.connected: bool = False
+        self.updated: Event = Event()
+        self.task: Task | None = None
+
+    def start(self) -> None:
+        """Start watching candles in the background"""
+
+        if self.task is None or self.task.done():
+            self.task = create_task(self.watch())
+
+    async def stop(self) -> None:
+        """Stop watching candles"""
+
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except CancelledError:
+                pass
+        self.task = None
+        self.connected = False
+
+    async def watch(self) -> None:
+        """Store every candle update and wake up waiters, reconnecting on errors"""
+
+        while True:
+            try:
+                ohlcvs = await self.exchange.watch_ohlcv(
+                    symbol=self.symbol, timeframe=self.timeframe
+                )
+            except CancelledError:
+                raise
+            except Exception as e:
+                if self.connected:
+                    logger.warning(f"Candle feed disconnected: {e}")
+                self.connected = False
+                self.notify()
+                await sleep(CANDLE_FEED_RECONNECT_DELAY)
+                continue
+
+            if not self.connected:
+                logger.info(f"Candle feed connected for {self.symbol}")
+            self.connected = True
+            for ohlcv in ohlcvs:
+                self.candles[ohlcv[0]] = Candle(*ohlcv[:6], time_frame=self.timeframe)
+            for timestamp in sorted(self.candles)[:-CANDLE_FEED_MAX_CANDLES]:
+                del self.candles[timestamp]
+            self.notify()
+
+    def notify(self) -> None:
+        """Wake up everyone waiting on the current event"""
+
+        updated, self.updated = self.updated, Event()
+        updated.set()
+
+    async def get_candle(
+        self, timestamp: int, wait: float = CANDLE_FEED_TIMEOUT
+    ) -> Candle | None:
+        """Return the candle that opened at timestamp (ms) as soon as it is pushed,
+        or None if the feed is disconnected or the candle does not arrive in time"""
+
+        try:
+            async with timeout(wait):
+                while self.connected:
+                    if timestamp in self.candles:
+                        return self.candles[timestamp]
+                    await self.updated.wait()
+        except TimeoutError:
+            logger.warning(f"Candle feed did not receive candle {timestamp} in time")
+        return None
+
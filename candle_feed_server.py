@@ -0,0 +1,215 @@
+"""Local stand-in for the BloFin public market data API, so the candle feed can be
+tested offline.
+
+Serves the REST endpoints ccxt needs for loading markets and fetching candles and
+the public websocket candle channel. Point the bot to it with:
+
+    EXCHANGE_REST_URL=http://localhost:8765
+    EXCHANGE_WS_URL=ws://localhost:8765/ws/public
+
+and start it with `python candle_feed_server.py`.
+"""
+
+from argparse import ArgumentParser
+from asyncio import create_task, sleep
+from dataclasses import dataclass, field
+import json
+import random
+import time
+from typing import Dict, List, Set
+
+from aiohttp import WSMsgType, web
+
+from logger import logger
+
+
+INSTRUMENT = {
+    "instId": "BTC-USDT",
+    "baseCurrency": "BTC",
+    "quoteCurrency": "USDT",
+    "settleCurrency": "USDT",
+    "instType": "SWAP",
+    "contractType": "linear",
+    "contractValue": "0.001",
+    "listTime": "1600000000000",
+    "maxLeverage": "150",
+    "minSize": "0.1",
+    "lotSize": "0.1",
+    "tickSize": "0.1",
+    "maxLimitSize": "100000",
+    "maxMarketSize": "6000",
+    "state": "live",
+}
+TIMEFRAMES = {"1m": 60, "3m": 180, "5m": 300, "15m": 900, "30m": 1800, "1H": 3600}
+
+
+@dataclass
+class StandInMarket:
+    """Random walk price that builds wall clock aligned candles per timeframe"""
+
+    price: float = 60000.0
+    volatility: float = 0.0005
+    candles: Dict[str, Dict[int, List[float]]] = field(default_factory=dict)
+    subscribers: Dict[str, Set[web.WebSocketResponse]] = field(default_factory=dict)
+
+    def tick(self) -> None:
+        """Move the price and update the running candle of every timeframe"""
+
+        self.price = round(self.price * (1 + random.gauss(0, self.volatility)), 1)
+        now = time.time()
+        for bar, seconds in TIMEFRAMES.items():
+            timestamp = int(now // seconds * seconds * 1000)
+            candles = self.candles.setdefault(bar, {})
+            if timestamp in candles:
+                candle = candles[timestamp]
+                candle[2] = max(candle[2], self.price)
+                candle[3] = min(candle[3], self.price)
+                candle[4] = self.price
+                candle[5] += random.randint(1, 50)
+            else:
+                candles[timestamp] = [timestamp] + 4 * [self.price] + [0]
+            for old_timestamp in sorted(candles)[:-100]:
+                del candles[old_timestamp]
+
+    def to_blofin(self, bar: str, timestamp: int) -> List[str]:
+        """Return a candle in the BloFin REST / websocket format"""
+
+        candle = self.candles[bar][timestamp]
+        confirm = "1" if timestamp < max(self.candles[bar]) else "0"
+        volume = candle[5]
+        return [str(value) for value in candle[:5]] + [
+            str(volume),
+            str(round(volume * 0.001, 4)),
+            str(round(volume * 0.001 * candle[4], 2)),
+            confirm,
+        ]
+
+    def latest(self, bar: str, limit: int) -> List[List[str]]:
+        """Return the latest candles, newest first like BloFin does"""
+
+        timestamps = sorted(self.candles.get(bar, {}), reverse=True)[:limit]
+        return [self.to_blofin(bar, timestamp) for timestamp in timestamps]
+
+
+class StandInServer:
+    """aiohttp application serving the stand-in market"""
+
+    def __init__(
+        self, update_interval: float, drop_every: float, latency: float
+    ) -> None:
+        self.market = StandInMarket()
+        self.update_interval = update_interval
+        self.drop_every = drop_every
+        self.latency = latency
+        self.app = web.Application()
+        self.app.router.add_get("/api/v1/market/instruments", self.instruments)
+        self.app.router.add_get("/api/v1/market/candles", self.rest_candles)
+        self.app.router.add_get("/ws/public", self.websocket)
+        self.app.on_startup.append(self.start_background_tasks)
+
+    async def start_background_tasks(self, app: web.Application) -> None:
+        """Start the price ticker and the optional connection dropper"""
+
+        self.market.tick()
+        app["ticker"] = create_task(self.ticker())
+        if self.drop_every:
+            app["dropper"] = create_task(self.dropper())
+
+    async def ticker(self) -> None:
+        """Tick the market and push the running candle to subscribers"""
+
+        while True:
+            await sleep(self.update_interval)
+            self.market.tick()
+            for channel, websockets in self.market.subscribers.items():
+                bar = channel.replace("candle", "")
+                message = json.dumps(
+                    {
+                        "arg": {"channel": channel, "instId": INSTRUMENT["instId"]},
+                        "data": self.market.latest(bar, 1),
+                    }
+                )
+                for ws in list(websockets):
+                    if ws.closed:
+                        websockets.discard(ws)
+                        continue
+                    await ws.send_str(message)
+
+    async def dropper(self) -> None:
+        """Close all websocket connections periodically to exercise reconnects"""
+
+        while True:
+            await sleep(self.drop_every)
+            logger.info("Dropping all websocket connections")
+            for websockets in self.market.subscribers.values():
+                for ws in list(websockets):
+                    await ws.close()
+                websockets.clear()
+
+    async def instruments(self, request: web.Request) -> web.Response:
+        """GET /api/v1/market/instruments"""
+
+        await sleep(self.latency)
+        return web.json_response({"code": "0", "msg": "success", "data": [INSTRUMENT]})
+
+    async def rest_candles(self, request: web.Request) -> web.Response:
+        """GET /api/v1/market/candles"""
+
+        await sleep(self.latency)
+        bar = request.query.get("bar", "1m")
+        limit = int(request.query.get("limit", "100"))
+        return web.json_response(
+            {"code": "0", "msg": "success", "data": self.market.latest(bar, limit)}
+        )
+
+    async def websocket(self, request: web.Request) -> web.WebSocketResponse:
+        """Public websocket handling ping and candle subscriptions"""
+
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        async for message in ws:
+            if message.type != WSMsgType.TEXT:
+                break
+            if message.data == "ping":
+                await ws.send_str("pong")
+                continue
+            payload = json.loads(message.data)
+            if payload.get("op") != "subscribe":
+                continue
+            for arg in payload.get("args", []):
+                channel = arg.get("channel", "")
+                if channel.replace("candle", "") not in TIMEFRAMES:
+                    await ws.send_str(
+                        json.dumps(
+                            {"event": "error", "code": "60018", "msg": "bad channel"}
+                        )
+                    )
+                    continue
+                self.market.subscribers.setdefault(channel, set()).add(ws)
+                await ws.send_str(json.dumps({"event": "subscribe", "arg": arg}))
+        for websockets in self.market.subscribers.values():
+            websockets.discard(ws)
+        return ws
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument(
+        "--update-interval",
+        type=float,
+        default=0.5,
+        help="seconds between candle updates",
+    )
+    parser.add_argument(
+        "--drop-every",
+        type=float,
+        default=0,
+        help="close websocket connections every N seconds (0 = never)",
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0, help="seconds of REST latency"
+    )
+    args = parser.parse_args()
+    server = StandInServer(args.update_interval, args.drop_every, args.latency)
+    web.run_app(server.app, port=args.port)
@@ -0,0 +1,92 @@
+from asyncio import sleep
+import random
+
+import aiohttp
+from decouple import config
+import orjson
+
+from logger import logger
+
+
+COINALYZE_TIMEOUT = config("COINALYZE_TIMEOUT", cast=float, default="10.0")  # seconds
+COINALYZE_RETRIES = config("COINALYZE_RETRIES", cast=int, default="3")
+COINALYZE_BACKOFF = config("COINALYZE_BACKOFF", cast=float, default="0.5")  # seconds
+COINALYZE_MAX_BACKOFF = 10.0  # seconds
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CoinalyzeError(Exception):
+    """Raised when the Coinalyze API keeps failing after all retries"""
+
+
+class CoinalyzeClient:
+    """Async Coinalyze client keeping 1 keep-alive session for all requests"""
+
+    def __init__(self, api_key: str) -> None:
+        self.api_key = api_key
+        self._session: aiohttp.ClientSession | None = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """Return the pooled session, created lazily inside the running event loop"""
+
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=10, keepalive_timeout=300),
+                headers={"api_key": self.api_key},
+                timeout=aiohttp.ClientTimeout(total=COINALYZE_TIMEOUT),
+            )
+        return self._session
+
+    async def close(self) -> None:
+        """Close the pooled session"""
+
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def backoff(self, attempt: int, retry_after: str | None = None) -> float:
+        """Return the seconds to wait before the next attempt, with full jitter"""
+
+        if retry_after:
+            try:
+                return min(float(retry_after), COINALYZE_MAX_BACKOFF)
+            except ValueError:
+                pass
+        return random.uniform(
+            0, min(COINALYZE_BACKOFF * 2**attempt, COINALYZE_MAX_BACKOFF)
+        )
+
+    async def get(self, url: str, params: dict | None = None) -> list | dict:
+        """GET the url and return the decoded json, retrying on timeouts, connection
+        errors, rate limits and server errors
+
+        Raises:
+            CoinalyzeError: when all attempts failed or the request is invalid
+        """
+
+        error: str = ""
+        for attempt in range(COINALYZE_RETRIES + 1):
+            retry_after: str | None = None
+            try:
+                async with self.session.get(url, params=params or {}) as response:
+                    if response.status in RETRY_STATUSES:
+                        retry_after = response.headers.get("Retry-After")
+                        error = f"{response.status} {response.reason} for url: {url}"
+                    elif response.status >= 400:
+                        raise CoinalyzeError(
+                            f"{response.status} {response.reason} for url: {url}"
+                        )
+                    else:
+                        return orjson.loads(await response.read())
+            except (aiohttp.ClientError, TimeoutError) as e:
+                error = f"{type(e).__name__}: {e}"
+
+            if attempt < COINALYZE_RETRIES:
+                delay = self.backoff(attempt, retry_after)
+                logger.warning(
+                    f"Coinalyze request failed ({error}), retrying in {delay:.2f}s"
+                )
+                await sleep(delay)
+
+        raise CoinalyzeError(error)
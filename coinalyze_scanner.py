@@ -1,6 +1,7 @@
+from asyncio import Task, create_task, to_thread
+from coinalyze_client import CoinalyzeClient
 from datetime import datetime, timedelta
 from decouple import config, Csv
-from functools import cached_property
 
 from discord_client import USE_DISCORD
 
@@ -10,15 +11,22 @@ if USE_DISCORD:
         DISCORD_CHANNEL_LIQUIDATIONS_ID,
         DISCORD_CHANNEL_HEARTBEAT_ID,
     )
+from liquidation_store import LiquidationStore, STORE_INTERVAL
 from logger import logger
+from metrics import timed
+from tracing import traced
 from misc import Candle, DiscordMessage, Liquidation, LiquidationSet
-import requests
-from typing import List
+from typing import List, Set
 
 
 COINALYZE_SECRET_API_KEY = config("COINALYZE_SECRET_API_KEY")
-COINALYZE_LIQUIDATION_URL = "https://api.coinalyze.net/v1/liquidation-history"
-FUTURE_MARKETS_URL = "https://api.coinalyze.net/v1/future-markets"
+# point the scanner to a local stand-in, e.g. coinalyze_server.py
+COINALYZE_BASE_URL = config(
+    "COINALYZE_BASE_URL", default="https://api.coinalyze.net/v1"
+).rstrip("/")
+logger.info(f"{COINALYZE_BASE_URL=}")
+COINALYZE_LIQUIDATION_URL = f"{COINALYZE_BASE_URL}/liquidation-history"
+FUTURE_MARKETS_URL = f"{COINALYZE_BASE_URL}/future-markets"
 
 MINIMAL_NR_OF_LIQUIDATIONS = config("MINIMAL_NR_OF_LIQUIDATIONS", default="1", cast=int)
 logger.info(f"{MINIMAL_NR_OF_LIQUIDATIONS=}")
@@ -32,16 +40,39 @@ LIQUIDATION_DAYS = config(
     "LIQUIDATION_DAYS", cast=Csv(int), default="0,1,2,3,4"
 )  # Monday to Friday
 logger.info(f"{LIQUIDATION_DAYS=}")
+DEFAULT_ASSET = "BTC"
+ASSETS = config("ASSETS", cast=Csv(), default=DEFAULT_ASSET)  # e.g. BTC,ETH,SOL
+logger.info(f"{ASSETS=}")
 
 
 class CoinalyzeScanner:
     """Scans coinalyze to notify for changes in open interest and liquidations through
     text to speech"""
 
-    def __init__(self, now: datetime, liquidation_set: LiquidationSet) -> None:
+    def __init__(
+        self,
+        now: datetime,
+        liquidation_set: LiquidationSet,
+        asset: str = DEFAULT_ASSET,
+        client: CoinalyzeClient | None = None,
+    ) -> None:
         self.now = now
         self.liquidation_set = liquidation_set
+        self.asset = asset
         self.exchange = None
+        self.liquidation_store: LiquidationStore | None = None
+        self.store_tasks: Set[Task] = set()
+        # scanners of multiple assets share 1 Coinalyze session
+        self.client = (
+            CoinalyzeClient(api_key=COINALYZE_SECRET_API_KEY)
+            if client is None
+            else client
+        )
+
+    @property
+    def id_prefix(self) -> str:
+        """Returns the asset prefix of liquidation ids, when multiple assets trade"""
+        return f"{self.asset}-" if len(ASSETS) > 1 else ""
 
     @property
     def params(self) -> dict:
@@ -56,23 +87,34 @@ class CoinalyzeScanner:
             "interval": INTERVAL,
         }
 
-    @cached_property
+    @property
     def symbols(self) -> str:
         """Returns the symbols for the request to the API"""
         return self._symbols
 
-    async def set_symbols(self) -> None:
-        """Returns the symbols for the request to the API"""
+    async def get_future_markets(self) -> List[dict]:
+        """Returns the future markets of all assets on Coinalyze"""
+        return await self.handle_coinalyze_url(
+            url=FUTURE_MARKETS_URL, include_params=False, symbols=True
+        )
+
+    async def set_symbols(self, markets: List[dict] | None = None) -> None:
+        """Returns the symbols for the request to the API, from markets if they are
+        already fetched for another asset"""
         symbols = []
         if hasattr(self, "_symbols"):
             symbols = self._symbols.split(",")
-        for market in await self.handle_coinalyze_url(
-            url=FUTURE_MARKETS_URL, include_params=False, symbols=True
-        ):
-            if (symbol := market.get("symbol", "").upper()).startswith("BTCUSD"):
+        if markets is None:
+            markets = await self.get_future_markets()
+        for market in markets:
+            if (symbol := market.get("symbol", "").upper()).startswith(
+                f"{self.asset}USD"
+            ):
                 symbols.append(symbol)
         self._symbols = ",".join(list(set(symbols)))
 
+    @timed("handle_liquidation_set")
+    @traced("handle_liquidation_set")
     async def handle_liquidation_set(self, candle: Candle, symbols: list) -> None:
         """Handle the liquidation set and check for liquidations
 
@@ -100,7 +142,8 @@ class CoinalyzeScanner:
         ):
             long_liquidation = Liquidation(
                 _id=str(
-                    "l-"
+                    self.id_prefix
+                    + "l-"
                     + datetime.fromtimestamp(candle.timestamp / 1000).strftime("%H%M")
                 ),
                 amount=total_long,
@@ -114,7 +157,7 @@ class CoinalyzeScanner:
                 ),
             )
             if long_liquidation.on_liquidation_days:
-                self.liquidation_set.liquidations.insert(0, long_liquidation)
+                self.liquidation_set.add(long_liquidation)
             discord_liquidations.append(long_liquidation)
         if (
             total_short > MINIMAL_LIQUIDATION
@@ -122,7 +165,8 @@ class CoinalyzeScanner:
         ):
             short_liquidation = Liquidation(
                 _id=str(
-                    "s-"
+                    self.id_prefix
+                    + "s-"
                     + datetime.fromtimestamp(candle.timestamp / 1000).strftime("%H%M")
                 ),
                 amount=total_short,
@@ -136,10 +180,10 @@ class CoinalyzeScanner:
                 ),
             )
             if short_liquidation.on_liquidation_days:
-                self.liquidation_set.liquidations.insert(0, short_liquidation)
+                self.liquidation_set.add(short_liquidation)
             discord_liquidations.append(short_liquidation)
         if USE_DISCORD and discord_liquidations:
-            self.exchange.discord_message_queue.append(
+            self.exchange.discord_message_queue.put_nowait(
                 DiscordMessage(
                     channel_id=DISCORD_CHANNEL_LIQUIDATIONS_ID,
                     messages=[
@@ -149,6 +193,8 @@ class CoinalyzeScanner:
                 )
             )
 
+    @timed("handle_coinalyze_url")
+    @traced("handle_coinalyze_url")
     async def handle_coinalyze_url(
         self, url: str, include_params: bool = True, symbols: bool = False
     ) -> List[dict]:
@@ -157,20 +203,15 @@ class CoinalyzeScanner:
         Args:
             url (str): url to check for liquidations
         """
+        params = self.params if include_params else {}
         try:
-            response = requests.get(
-                url,
-                headers={"api_key": COINALYZE_SECRET_API_KEY},
-                params=self.params if include_params else {},
-            )
-            response.raise_for_status()
-            response_json = response.json()
+            response_json = await self.client.get(url, params=params)
             if response_json and not symbols:
                 logger.info(f"COINALYZE: {response_json}")
         except Exception as e:
             logger.error(str(e))
             if USE_DISCORD:
-                self.exchange.discord_message_queue.append(
+                self.exchange.discord_message_queue.put_nowait(
                     DiscordMessage(
                         channel_id=DISCORD_CHANNEL_HEARTBEAT_ID,
                         messages=[
@@ -187,6 +228,23 @@ class CoinalyzeScanner:
         if symbols:
             return response_json
 
+        # keep every bar of every symbol for research and replays, written in a
+        # thread in the background so the tick doesn't wait on disk
+        if (
+            self.liquidation_store is not None
+            and params
+            and params["interval"] == STORE_INTERVAL
+        ):
+            task = create_task(
+                to_thread(
+                    self.liquidation_store.write_response,
+                    response_json,
+                    closed_before=params["to"],
+                )
+            )
+            self.store_tasks.add(task)
+            task.add_done_callback(self.store_tasks.discard)
+
         return [
             symbol.get("history")[0]
             for symbol in response_json
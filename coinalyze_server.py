@@ -0,0 +1,284 @@
+"""Local stand-in for the Coinalyze API, so the scanner can be tested and load
+tested offline.
+
+Serves liquidation-history and future-markets from recorded fixture files, with
+optional latency, 429 rate limiting and extra synthetic symbols. Point the bot to
+it with:
+
+    COINALYZE_BASE_URL=http://localhost:8766/v1
+
+and start it with `python coinalyze_server.py`. Requests outside of the recorded
+period get the recorded bars replayed in a loop, so the live bot gets liquidations
+at any time. Record new fixtures from the live API with
+`python coinalyze_server.py --record BTC,ETH --hours 24`.
+"""
+
+from argparse import ArgumentParser
+from asyncio import run, sleep
+from dataclasses import dataclass, field
+import json
+import math
+import os
+import random
+import time
+from typing import Dict, List
+
+from aiohttp import web
+
+from logger import logger
+
+
+FIXTURE_DIRECTORY = "fixtures/coinalyze/"
+FUTURE_MARKETS_FIXTURE = "future-markets.json"
+LIQUIDATION_HISTORY_FIXTURE = "liquidation-history.json"
+INTERVALS = {
+    "1min": 60,
+    "5min": 300,
+    "15min": 900,
+    "30min": 1800,
+    "1hour": 3600,
+    "2hour": 7200,
+    "4hour": 14400,
+    "6hour": 21600,
+    "12hour": 43200,
+    "daily": 86400,
+}  # seconds
+RATE_LIMIT_WINDOW = 60  # seconds, Coinalyze allows 40 calls per minute per key
+MAX_SYMBOLS_PER_REQUEST = 20  # the live API limit, used when recording
+
+
+@dataclass
+class Fixtures:
+    """Fixtures class to hold the recorded markets and liquidation bars per symbol"""
+
+    markets: List[dict] = field(default_factory=list)
+    histories: Dict[str, List[dict]] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, directory: str = FIXTURE_DIRECTORY) -> "Fixtures":
+        """Load the fixtures from the directory"""
+
+        with open(os.path.join(directory, FUTURE_MARKETS_FIXTURE)) as json_file:
+            markets = json.load(json_file)
+        with open(os.path.join(directory, LIQUIDATION_HISTORY_FIXTURE)) as json_file:
+            histories = {
+                symbol["symbol"]: sorted(symbol["history"], key=lambda bar: bar["t"])
+                for symbol in json.load(json_file)
+            }
+        return cls(markets=markets, histories=histories)
+
+    def save(self, directory: str = FIXTURE_DIRECTORY) -> None:
+        """Write the fixtures to the directory"""
+
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, FUTURE_MARKETS_FIXTURE), "w") as json_file:
+            json.dump(self.markets, json_file, indent=1)
+        with open(
+            os.path.join(directory, LIQUIDATION_HISTORY_FIXTURE), "w"
+        ) as json_file:
+            json.dump(
+                [
+                    {"symbol": symbol, "history": history}
+                    for symbol, history in self.histories.items()
+                ],
+                json_file,
+            )
+
+    def add_extra_symbols(self, extra_symbols: int) -> None:
+        """Add synthetic markets that replay the recorded bars of the recorded
+        markets of the same asset, to load test large symbol counts, markets
+        without recorded bars are skipped"""
+
+        recorded = [
+            market for market in self.markets if self.histories.get(market["symbol"])
+        ]
+        if extra_symbols and not recorded:
+            raise ValueError("No recorded liquidation bars to add extra symbols from")
+        for nr in range(extra_symbols):
+            market = recorded[nr % len(recorded)]
+            symbol = f"{market['base_asset']}USDT_PERP.X{nr}"
+            self.markets.append({**market, "symbol": symbol, "exchange": f"X{nr}"})
+            self.histories[symbol] = self.histories[market["symbol"]]
+
+
+def get_bars(history: List[dict], start: int, end: int, interval: int) -> List[dict]:
+    """Return the bars from start up to and including end, replaying the recorded
+    bars in a loop when the period is not recorded"""
+
+    if history and history[0]["t"] <= start and end <= history[-1]["t"]:
+        return [bar for bar in history if start <= bar["t"] <= end]
+
+    bars = []
+    for timestamp in range(start - start % interval, end + 1, interval):
+        if timestamp >= start:
+            bar = history[timestamp // interval % len(history)]
+            bars.append({**bar, "t": timestamp})
+    return bars
+
+
+class StandInServer:
+    """aiohttp application serving the recorded Coinalyze responses"""
+
+    def __init__(
+        self,
+        fixtures: Fixtures,
+        latency: float,
+        rate_limit: int,
+        rate_limit_probability: float,
+    ) -> None:
+        self.fixtures = fixtures
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.rate_limit_probability = rate_limit_probability
+        self.window_start = time.time()
+        self.window_requests = 0
+        self.requests = 0
+        self.rate_limited = 0
+        self.app = web.Application()
+        self.app.router.add_get("/v1/future-markets", self.future_markets)
+        self.app.router.add_get("/v1/liquidation-history", self.liquidation_history)
+
+    def check_rate_limit(self) -> web.Response | None:
+        """Return a 429 response when the request is over the limit of the current
+        window, or randomly rate limited"""
+
+        self.requests += 1
+        now = time.time()
+        if now - self.window_start >= RATE_LIMIT_WINDOW:
+            self.window_start = now
+            self.window_requests = 0
+        self.window_requests += 1
+
+        retry_after = None
+        if self.rate_limit and self.window_requests > self.rate_limit:
+            retry_after = math.ceil(self.window_start + RATE_LIMIT_WINDOW - now)
+        elif random.random() < self.rate_limit_probability:
+            retry_after = 1
+        if retry_after is None:
+            return None
+
+        self.rate_limited += 1
+        return web.Response(
+            status=429,
+            headers={"Retry-After": str(retry_after)},
+            text="Too Many Requests",
+        )
+
+    async def future_markets(self, request: web.Request) -> web.Response:
+        """GET /v1/future-markets"""
+
+        await sleep(self.latency)
+        if response := self.check_rate_limit():
+            return response
+        return web.json_response(self.fixtures.markets)
+
+    async def liquidation_history(self, request: web.Request) -> web.Response:
+        """GET /v1/liquidation-history"""
+
+        await sleep(self.latency)
+        if response := self.check_rate_limit():
+            return response
+        try:
+            symbols = [
+                symbol for symbol in request.query["symbols"].split(",") if symbol
+            ]
+            interval = INTERVALS[request.query["interval"]]
+            start = int(request.query["from"])
+            end = int(request.query["to"])
+        except (KeyError, ValueError) as e:
+            return web.json_response({"message": f"Invalid request: {e}"}, status=400)
+
+        return web.json_response(
+            [
+                {
+                    "symbol": symbol,
+                    "history": get_bars(
+                        self.fixtures.histories[symbol], start, end, interval
+                    ),
+                }
+                for symbol in symbols
+                if self.fixtures.histories.get(symbol)
+            ]
+        )
+
+
+async def record(assets: List[str], hours: int, directory: str) -> None:
+    """Record the markets and the 5 minute liquidation bars of the last hours of
+    the assets from the live API"""
+
+    from coinalyze_client import CoinalyzeClient
+    from coinalyze_scanner import COINALYZE_BASE_URL, COINALYZE_SECRET_API_KEY
+
+    client = CoinalyzeClient(api_key=COINALYZE_SECRET_API_KEY)
+    try:
+        markets = [
+            market
+            for market in await client.get(f"{COINALYZE_BASE_URL}/future-markets")
+            if market.get("is_perpetual") and market.get("base_asset") in assets
+        ]
+        symbols = [market["symbol"] for market in markets]
+        end = int(time.time()) // 300 * 300
+        histories = {}
+        for nr in range(0, len(symbols), MAX_SYMBOLS_PER_REQUEST):
+            for symbol in await client.get(
+                f"{COINALYZE_BASE_URL}/liquidation-history",
+                params={
+                    "symbols": ",".join(symbols[nr : nr + MAX_SYMBOLS_PER_REQUEST]),
+                    "interval": "5min",
+                    "from": end - hours * 3600,
+                    "to": end,
+                },
+            ):
+                histories[symbol["symbol"]] = symbol["history"]
+    finally:
+        await client.close()
+
+    Fixtures(markets=markets, histories=histories).save(directory)
+    logger.info(f"Recorded {len(markets)} markets of {assets} to {directory}")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--fixtures", default=FIXTURE_DIRECTORY)
+    parser.add_argument("--latency", type=float, default=0, help="seconds")
+    parser.add_argument(
+        "--rate-limit",
+        type=int,
+        default=0,
+        help=f"requests per {RATE_LIMIT_WINDOW}s before 429s (0 = unlimited)",
+    )
+    parser.add_argument(
+        "--rate-limit-probability",
+        type=float,
+        default=0,
+        help="fraction of requests answered with a 429",
+    )
+    parser.add_argument(
+        "--extra-symbols",
+        type=int,
+        default=0,
+        help="synthetic symbols added to the recorded ones",
+    )
+    parser.add_argument(
+        "--record",
+        metavar="ASSETS",
+        help="record the fixtures of these assets (e.g. BTC,ETH) from the live API",
+    )
+    parser.add_argument(
+        "--hours", type=int, default=24, help="hours of liquidations to record"
+    )
+    args = parser.parse_args()
+
+    if args.record:
+        run(record(args.record.split(","), args.hours, args.fixtures))
+    else:
+        fixtures = Fixtures.load(args.fixtures)
+        try:
+            fixtures.add_extra_symbols(args.extra_symbols)
+        except ValueError as e:
+            parser.error(str(e))
+        server = StandInServer(
+            fixtures, args.latency, args.rate_limit, args.rate_limit_probability
+        )
+        web.run_app(server.app, port=args.port)
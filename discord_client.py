@@ -1,12 +1,27 @@
-from typing import List
+from asyncio import Queue, Task, create_task, get_running_loop, sleep
+from collections import defaultdict
+from dataclasses import dataclass, field
+from functools import cache
+from heapq import heappop, heappush
+from itertools import count
+import math
+import re
+from time import monotonic
+from typing import Dict, List, Tuple
 from decouple import config
-import discord
+from lazy_imports import lazy_import
 from logger import logger
-import yaml
+from metrics import timed
+from tracing import TRACER, USE_TRACING
 
 from misc import DiscordMessage
 
 
+# imported on first use, the bot runs without discord.py and PyYAML loaded when
+# USE_DISCORD is false
+discord = lazy_import("discord")
+yaml = lazy_import("yaml")
+
 USE_DISCORD = config("USE_DISCORD", cast=bool, default=False)
 logger.info(f"{USE_DISCORD=}")
 if USE_DISCORD:
@@ -20,11 +35,150 @@ if USE_DISCORD:
     DISCORD_PRIVATE_KEY = config("DISCORD_PRIVATE_KEY")
     USE_AT_EVERYONE = config("USE_AT_EVERYONE", cast=bool, default="false")
 
+    # lower goes first, a burst of heartbeat errors can't delay a trade
+    CHANNEL_PRIORITIES: Dict[int, int] = {
+        DISCORD_CHANNEL_TRADES_ID: 0,
+        DISCORD_CHANNEL_WAITING_ID: 1,
+        DISCORD_CHANNEL_POSITIONS_ID: 2,
+        DISCORD_CHANNEL_LIQUIDATIONS_ID: 3,
+        DISCORD_CHANNEL_HEARTBEAT_ID: 4,
+    }
+else:
+    CHANNEL_PRIORITIES = {}
+DISCORD_MAX_ATTEMPTS = config("DISCORD_MAX_ATTEMPTS", cast=int, default="5")
+DISCORD_RETRY_BACKOFF = 2.0  # seconds, doubled per attempt
+DISCORD_MAX_RETRY_BACKOFF = 60.0  # seconds
+
+# discord allows about 5 messages per 5 seconds per channel and 50 per second
+DISCORD_CHANNEL_RATE_LIMIT = 5
+DISCORD_CHANNEL_RATE_PERIOD = 5.0  # seconds
+DISCORD_GLOBAL_RATE_LIMIT = 50
+DISCORD_GLOBAL_RATE_PERIOD = 1.0  # seconds
+DISCORD_MESSAGE_LIMIT = 2000  # characters
+CODE_BLOCK = "```"
+
+# strings yaml writes plain (unquoted), anything else is left to yaml.dump
+PLAIN_STRING = re.compile(r"[A-Za-z0-9$_(/][\x20-\x7e]*")
+NOT_PLAIN = re.compile(r": |:$| #| $")
+YAML_WIDTH = 80  # yaml wraps longer lines
+
+
+@cache
+def get_yaml_resolver() -> "yaml.resolver.Resolver":
+    """Return the resolver of yaml's implicit tags, e.g. strings that read as
+    numbers or booleans"""
+
+    return yaml.resolver.Resolver()
+
+
+class RenderFallback(Exception):
+    """Raised when a value can't be rendered exactly like yaml does"""
+
+
+def render_scalar(value) -> str:
+    """Return a scalar like yaml.dump writes it in a block mapping"""
+
+    if isinstance(value, str):
+        if (
+            PLAIN_STRING.fullmatch(value)
+            and not NOT_PLAIN.search(value)
+            and (resolver := get_yaml_resolver()).resolve(
+                yaml.ScalarNode, value, (True, False)
+            )
+            == resolver.DEFAULT_SCALAR_TAG
+        ):
+            return value
+    elif value is None:
+        return "null"
+    elif isinstance(value, bool):
+        return "true" if value else "false"
+    elif type(value) is int:
+        return str(value)
+    elif type(value) is float and math.isfinite(value):
+        if "e" not in (text := repr(value)):
+            return text
+    raise RenderFallback(repr(value))
+
+
+def render_mapping(obj: dict, indent: str, lines: List[str]) -> None:
+    """Append the lines of a block mapping, with sorted keys like yaml"""
+
+    for key in sorted(obj):
+        value = obj[key]
+        prefix = f"{indent}{render_scalar(key)}:"
+        if isinstance(value, dict) and value:
+            lines.append(prefix)
+            render_mapping(value, indent + "  ", lines)
+        elif isinstance(value, (list, tuple)) and value:
+            lines.append(prefix)
+            for item in value:
+                if isinstance(item, (dict, list, tuple)):
+                    raise RenderFallback(repr(item))
+                lines.append(f"{indent}- {render_scalar(item)}")
+        elif isinstance(value, dict):
+            lines.append(f"{prefix} {{}}")
+        elif isinstance(value, (list, tuple)):
+            lines.append(f"{prefix} []")
+        else:
+            lines.append(f"{prefix} {render_scalar(value)}")
+        if len(lines[-1]) > YAML_WIDTH:
+            raise RenderFallback(lines[-1])
+
 
 def get_discord_table(obj: dict) -> str:
-    """Convert a dictionary to a discord friendly table"""
+    """Convert a dictionary to a discord friendly table, rendered like
+    yaml.dump(obj, default_flow_style=False) without its overhead"""
+
+    lines: List[str] = []
+    try:
+        if not obj:
+            raise RenderFallback("empty")
+        render_mapping(obj, "", lines)
+    except (RenderFallback, TypeError):  # TypeError: keys yaml can't sort either
+        return f"{CODE_BLOCK}{yaml.dump(obj, default_flow_style=False)}{CODE_BLOCK}"
+    lines.append(CODE_BLOCK)
+    return CODE_BLOCK + "\n".join(lines)
+
+
+def split_message(message: str, limit: int = DISCORD_MESSAGE_LIMIT) -> List[str]:
+    """Split a message over the limit at line ends, closing and reopening a code
+    block that is cut in two"""
+
+    closer = f"\n{CODE_BLOCK}"
+    max_line = limit - len(CODE_BLOCK) - len(closer)
+    parts: List[str] = []
+    part, in_code_block = "", False
+    for message_line in message.split("\n"):
+        # a line that doesn't fit on its own is cut hard
+        for start in range(0, max(len(message_line), 1), max_line):
+            line = message_line[start : start + max_line]
+            in_code_block_after = in_code_block ^ bool(line.count(CODE_BLOCK) % 2)
+            candidate = f"{part}\n{line}" if part else line
+            if (
+                part
+                and len(candidate) + (len(closer) if in_code_block_after else 0) > limit
+            ):
+                parts.append(part + (closer if in_code_block else ""))
+                candidate = (CODE_BLOCK if in_code_block else "") + line
+            part, in_code_block = candidate, in_code_block_after
+    parts.append(part)
+    return parts
 
-    return f"```{yaml.dump(obj, default_flow_style=False)}```"
+
+def pack_messages(messages: List[str], limit: int = DISCORD_MESSAGE_LIMIT) -> List[str]:
+    """Join messages for 1 channel into as few messages under the limit as possible,
+    keeping their order"""
+
+    packed: List[str] = []
+    for message in messages:
+        for part in (
+            split_message(message, limit) if len(message) > limit else [message]
+        ):
+            if packed and len(packed[-1]) + 1 + len(part) <= limit:
+                packed[-1] += f"\n{part}"
+            else:
+                packed.append(part)
+    return packed
 
 
 def get_formatted_unordered_list(obj: dict, nested: bool = False) -> str:
@@ -41,31 +195,204 @@ def get_formatted_unordered_list(obj: dict, nested: bool = False) -> str:
     return formatted_string
 
 
-def post_to_discord(message_queue: List[DiscordMessage]) -> None:
-    """Post messages to discord and empty the message queue"""
+@dataclass
+class TokenBucket:
+    """TokenBucket class to pace requests, allowing bursts up to capacity"""
+
+    capacity: int
+    period: float  # seconds to refill the whole capacity
+    tokens: float = field(init=False)
+    updated: float = field(default_factory=monotonic)
+
+    def __post_init__(self) -> None:
+        self.tokens = self.capacity
+
+    def delay(self) -> float:
+        """Return the seconds until a token is available, 0 if there is one"""
+
+        now = monotonic()
+        self.tokens = min(
+            self.capacity,
+            self.tokens + (now - self.updated) * self.capacity / self.period,
+        )
+        self.updated = now
+        return max(1 - self.tokens, 0) * self.period / self.capacity
+
+    def take(self) -> None:
+        """Take a token"""
 
-    if not USE_DISCORD:
-        return
+        self.tokens -= 1
 
-    intents = discord.Intents.default()
-    intents.messages = True
-    client = discord.Client(intents=intents)
+    async def acquire(self) -> None:
+        """Wait for a token and take it"""
+
+        while (delay := self.delay()) > 0:
+            await sleep(delay)
+        self.take()
+
+
+@dataclass
+class OutboxEntry:
+    """OutboxEntry class to hold a queued DiscordMessage and its delivery state"""
+
+    discord_message: DiscordMessage
+    key: Tuple
+    priority: int
+    sequence: int
+    repeated: int = 1
+    attempts: int = 0
+    parts: List[str] | None = None  # packed messages not delivered yet
+
+    def get_parts(self) -> List[str]:
+        """Return the packed messages left to post, packed on the first attempt"""
+
+        if self.parts is None:
+            messages = [f"{message}" for message in self.discord_message.messages]
+            if self.repeated > 1:
+                messages.append(f"(repeated {self.repeated} times)")
+            if self.discord_message.at_everyone:
+                messages.insert(0, "@everyone")
+            self.parts = pack_messages(messages)
+        return self.parts
+
+
+class DiscordOutbox(Queue):
+    """Queue of the messages to post, ordered by channel priority and then by age.
+
+    Producers put DiscordMessages like on a plain Queue, the message itself is
+    queued without copying. A message identical to one still waiting is counted on
+    the waiting one instead of queued again.
+    """
+
+    def _init(self, maxsize: int) -> None:
+        self._queue: List[Tuple[int, int, OutboxEntry]] = []
+        self.waiting: Dict[Tuple, OutboxEntry] = {}
+        self.sequence = count()
+
+    def _put(self, entry: OutboxEntry) -> None:
+        heappush(self._queue, (entry.priority, entry.sequence, entry))
+
+    def _get(self) -> OutboxEntry:
+        entry = heappop(self._queue)[2]
+        if self.waiting.get(entry.key) is entry:
+            del self.waiting[entry.key]
+        return entry
+
+    def put_nowait(self, discord_message: DiscordMessage) -> None:
+        """Queue a message, or count it on the identical message still waiting"""
+
+        if USE_TRACING:
+            TRACER.event("discord_enqueue", channel_id=discord_message.channel_id)
+        key = (
+            discord_message.channel_id,
+            tuple(discord_message.messages),
+            discord_message.at_everyone,
+        )
+        if (entry := self.waiting.get(key)) is not None:
+            entry.repeated += 1
+            return
+        entry = OutboxEntry(
+            discord_message=discord_message,
+            key=key,
+            priority=CHANNEL_PRIORITIES.get(
+                discord_message.channel_id, len(CHANNEL_PRIORITIES)
+            ),
+            sequence=next(self.sequence),
+        )
+        self.waiting[key] = entry
+        super().put_nowait(entry)
+
+    def retry(self, entry: OutboxEntry) -> None:
+        """Queue an entry again, in its original place"""
+
+        super().put_nowait(entry)
+
+
+class DiscordDispatcher:
+    """Long-lived discord client that posts messages from a queue, instead of
+    logging in for every batch of messages"""
+
+    def __init__(self, outbox: DiscordOutbox) -> None:
+        intents = discord.Intents.default()
+        intents.messages = True
+        self.client = discord.Client(intents=intents)
+        self.outbox = outbox
+        self.channel_buckets: Dict[int, TokenBucket] = defaultdict(
+            lambda: TokenBucket(DISCORD_CHANNEL_RATE_LIMIT, DISCORD_CHANNEL_RATE_PERIOD)
+        )
+        self.global_bucket = TokenBucket(
+            DISCORD_GLOBAL_RATE_LIMIT, DISCORD_GLOBAL_RATE_PERIOD
+        )
+        self.tasks: List[Task] = []
+
+    def start(self) -> None:
+        """Connect to discord and start posting messages from the queue"""
+
+        self.tasks = [create_task(self.connect()), create_task(self.worker())]
+
+    async def close(self) -> None:
+        """Stop posting messages and disconnect from discord"""
+
+        for task in self.tasks:
+            task.cancel()
+        await self.client.close()
+
+    async def connect(self) -> None:
+        """Keep the discord connection open, discord.py handles reconnects"""
 
-    @client.event
-    async def on_ready():
         try:
-            for discord_message in message_queue:
-                channel = client.get_channel(discord_message.channel_id)
-                if discord_message.at_everyone:
-                    await channel.send(f"@everyone\n")
-                for message in discord_message.messages:
-                    await channel.send(f"{message}")
+            await self.client.start(token=DISCORD_PRIVATE_KEY)
         except Exception as e:
-            logger.error(f"Failed to post to Discord: {e}")
-        finally:
-            await client.close()
+            logger.error(f"Failed to connect to Discord: {e}")
 
-    try:
-        client.run(token=DISCORD_PRIVATE_KEY, log_handler=None)
-    except Exception as e:
-        logger.error(f"Failed to post to Discord: {e}")
+    async def worker(self) -> None:
+        """Post messages from the outbox, most important first. An entry whose
+        channel is at its rate limit goes back to the outbox until the channel has
+        room, so it doesn't hold up other channels. Failed entries are retried with
+        a backoff."""
+
+        await self.client.wait_until_ready()
+        while True:
+            entry = await self.outbox.get()
+            try:
+                if delay := await self.post(entry):
+                    get_running_loop().call_later(delay, self.outbox.retry, entry)
+            except Exception as e:
+                entry.attempts += 1
+                if entry.attempts >= DISCORD_MAX_ATTEMPTS:
+                    logger.error(
+                        f"Dropping Discord message after {entry.attempts} attempts: {e}"
+                    )
+                else:
+                    delay = min(
+                        DISCORD_RETRY_BACKOFF * 2 ** (entry.attempts - 1),
+                        DISCORD_MAX_RETRY_BACKOFF,
+                    )
+                    logger.warning(
+                        f"Failed to post to Discord ({e}), retrying in {delay:.0f}s"
+                    )
+                    get_running_loop().call_later(delay, self.outbox.retry, entry)
+            finally:
+                self.outbox.task_done()
+
+    @timed("discord_flush")
+    async def post(self, entry: OutboxEntry) -> float:
+        """Post the messages of 1 outbox entry to its channel within the channel
+        and global rate limits, continuing with the first message that wasn't
+        delivered yet. Returns the seconds until the channel has room for the
+        rest, 0 when all messages are delivered."""
+
+        channel_id = entry.discord_message.channel_id
+        channel = self.client.get_channel(
+            channel_id
+        ) or await self.client.fetch_channel(channel_id)
+        channel_bucket = self.channel_buckets[channel_id]
+        parts = entry.get_parts()
+        while parts:
+            if delay := channel_bucket.delay():
+                return delay
+            await self.global_bucket.acquire()
+            channel_bucket.take()
+            await channel.send(parts[0])
+            parts.pop(0)
+        return 0.0
@@ -1,27 +1,37 @@
-from asyncio import sleep
-from copy import deepcopy
-import os
+from asyncio import Lock, Queue, gather, sleep
+from algorithm_input import AlgorithmInputStore
 import ccxt.pro as ccxt
-from coinalyze_scanner import CoinalyzeScanner
-from datetime import datetime, timedelta, date
+from candle_buffer import CandleBuffer
+from candle_feed import CandleFeed, USE_CANDLE_FEED
+from coinalyze_scanner import ASSETS, DEFAULT_ASSET, CoinalyzeScanner
+from datetime import datetime, timedelta
 from decouple import config, Csv
 from logger import logger
+from metrics import timed
 from misc import (
+    Account,
+    AlgorithmInput,
     Candle,
     DiscordMessage,
+    ExchangeState,
     Liquidation,
     LiquidationSet,
+    OpenOrder,
+    OpenPosition,
     PositionToOpen,
 )
-import pandas as pd
-from typing import List, Tuple
+from order_fills import OrderFillWatcher, USE_ORDER_FILL_WATCHER
+from state_store import StateStore, get_key
+from time import monotonic
+from tracing import USE_TRACING, trace_calls, traced
+from typing import Dict, List, Tuple
 
 from discord_client import USE_DISCORD, get_discord_table
 
-TICKER: str = "BTC/USDT:USDT"
+TICKER: str = "{asset}/USDT:USDT"
 EXCHANGE_PRICE_PRECISION: int = config(
     "EXCHANGE_PRICE_PRECISION", cast=int, default="1"
-)
+)  # default for assets without an <ASSET>_PRICE_PRECISION setting
 SMOOTH_OUT_SETUPS = config("SMOOTH_OUT_SETUPS", cast=bool, default=True)
 SMOOTH_AMOUNT = config("SMOOTH_AMOUNT", cast=float, default=0.1)
 
@@ -44,11 +54,8 @@ EXCHANGE_NAME = config("EXCHANGE_NAME", default="blofin")
 EXCHANGE_API_KEY = config("EXCHANGE_API_KEY")
 EXCHANGE_SECRET_KEY = config("EXCHANGE_SECRET_KEY")
 EXCHANGE_PASSPHRASE = config("EXCHANGE_PASSPHRASE")
-EXCHANGE_CONFIG = {
-    "apiKey": EXCHANGE_API_KEY,
-    "secret": EXCHANGE_SECRET_KEY,
-    "password": EXCHANGE_PASSPHRASE,
-}
+EXCHANGE_REST_URL = config("EXCHANGE_REST_URL", default="")
+EXCHANGE_WS_URL = config("EXCHANGE_WS_URL", default="")
 
 # trade settings
 LEVERAGE = config("LEVERAGE", cast=int, default="10")
@@ -62,6 +69,62 @@ else:
     POSITION_PERCENTAGE = config("POSITION_PERCENTAGE", cast=float, default="1.0")
     logger.info(f"{POSITION_PERCENTAGE=}")
 
+# accounts, the main account above and extra accounts that copy its trades with
+# settings prefixed by their name, e.g. EXTRA_ACCOUNTS=bob and BOB_EXCHANGE_API_KEY
+MAIN_ACCOUNT = Account(
+    name="main",
+    api_key=EXCHANGE_API_KEY,
+    secret_key=EXCHANGE_SECRET_KEY,
+    passphrase=EXCHANGE_PASSPHRASE,
+    leverage=LEVERAGE,
+    use_fixed_risk=USE_FIXED_RISK,
+    fixed_risk_ex_fees=config("FIXED_RISK_EX_FEES", cast=float, default="50.0"),
+    position_percentage=config("POSITION_PERCENTAGE", cast=float, default="1.0"),
+)
+
+
+def get_extra_account(name: str) -> Account:
+    """Return the settings of an extra account, sizing defaults to the main one"""
+
+    prefix = f"{name.upper()}_"
+    return Account(
+        name=name,
+        api_key=config(prefix + "EXCHANGE_API_KEY"),
+        secret_key=config(prefix + "EXCHANGE_SECRET_KEY"),
+        passphrase=config(prefix + "EXCHANGE_PASSPHRASE"),
+        leverage=config(prefix + "LEVERAGE", cast=int, default=LEVERAGE),
+        use_fixed_risk=config(
+            prefix + "USE_FIXED_RISK", cast=bool, default=USE_FIXED_RISK
+        ),
+        fixed_risk_ex_fees=config(
+            prefix + "FIXED_RISK_EX_FEES",
+            cast=float,
+            default=MAIN_ACCOUNT.fixed_risk_ex_fees,
+        ),
+        position_percentage=config(
+            prefix + "POSITION_PERCENTAGE",
+            cast=float,
+            default=MAIN_ACCOUNT.position_percentage,
+        ),
+    )
+
+
+EXTRA_ACCOUNTS = config("EXTRA_ACCOUNTS", cast=Csv(), default="")
+ACCOUNTS: List[Account] = [MAIN_ACCOUNT] + [
+    get_extra_account(name) for name in EXTRA_ACCOUNTS
+]
+for account in ACCOUNTS[1:]:
+    logger.info(f"{account.name}: {account.to_dict()}")
+
+ORDER_FILL_TIMEOUT = config(
+    "ORDER_FILL_TIMEOUT", cast=float, default="5.0"
+)  # seconds to wait for the market order fill before placing the take profit
+ORDER_FILL_POLL_INTERVAL = 0.1  # seconds, REST polling without the fill watcher
+# seconds, REST safety net while the fill watcher pushes the fills
+ORDER_FILL_WATCHER_POLL_INTERVAL = 1.0
+# contracts, the position size until the market is known (minimum of BTC-USDT)
+DEFAULT_POSITION_SIZE = 0.1
+
 FORBIDDEN_NR_OF_CANDLES_BEFORE_ENTRY = config(
     "FORBIDDEN_NR_OF_CANDLES_BEFORE_ENTRY",
     cast=Csv(int),
@@ -69,43 +132,106 @@ FORBIDDEN_NR_OF_CANDLES_BEFORE_ENTRY = config(
 )
 
 
+# the request / response calls of a tick, the watch_* streams run outside of ticks
+CCXT_TRACED_METHODS: List[str] = [
+    "create_order",
+    "fetch_balance",
+    "fetch_ohlcv",
+    "fetch_open_orders",
+    "fetch_order_trades",
+    "fetch_positions",
+    "fetch_ticker",
+    "load_markets",
+    "set_leverage",
+]
+
+
+def get_ccxt_exchange(account: Account = MAIN_ACCOUNT) -> ccxt.Exchange:
+    """Return a new exchange connection for the account"""
+
+    exchange: ccxt.Exchange = getattr(ccxt, EXCHANGE_NAME)(
+        config={
+            "apiKey": account.api_key,
+            "secret": account.secret_key,
+            "password": account.passphrase,
+        }
+    )
+    # point ccxt to a local stand-in, e.g. candle_feed_server.py (BloFin layout)
+    if EXCHANGE_REST_URL:
+        exchange.urls["api"]["rest"] = EXCHANGE_REST_URL
+    if EXCHANGE_WS_URL:
+        exchange.urls["api"]["ws"]["swap"]["public"] = EXCHANGE_WS_URL
+    if USE_TRACING:
+        trace_calls(exchange, CCXT_TRACED_METHODS, prefix="ccxt")
+    return exchange
+
+
 class Exchange:
-    """Exchange class to handle the exchange"""
+    """Exchange class to handle 1 asset on the exchange"""
 
     def __init__(
-        self, liquidation_set: LiquidationSet, scanner: CoinalyzeScanner
+        self,
+        liquidation_set: LiquidationSet,
+        scanner: CoinalyzeScanner,
+        asset: str = DEFAULT_ASSET,
+        exchange: ccxt.Exchange | None = None,
+        discord_message_queue: Queue[DiscordMessage] | None = None,
+        account: Account = MAIN_ACCOUNT,
     ) -> None:
-        self.exchange: ccxt.Exchange = getattr(ccxt, EXCHANGE_NAME)(
-            config=EXCHANGE_CONFIG
+        # pipelines of multiple assets share 1 exchange connection per account and
+        # 1 message queue
+        self.account: Account = account
+        self.exchange: ccxt.Exchange = (
+            get_ccxt_exchange(account) if exchange is None else exchange
+        )
+        self.asset: str = asset
+        self.ticker: str = TICKER.format(asset=asset)
+        self.price_precision: int = config(
+            f"{asset}_PRICE_PRECISION", cast=int, default=EXCHANGE_PRICE_PRECISION
+        )
+        self.candle_feed: CandleFeed = CandleFeed(self.exchange, self.ticker)
+        # created by seed_candles, only for the exchange that runs the strategy
+        self.candles: CandleBuffer | None = None
+        self.algorithm_input: AlgorithmInputStore = AlgorithmInputStore(asset=asset)
+        self.order_fills: OrderFillWatcher = OrderFillWatcher(
+            self.exchange, self.ticker
         )
         self.liquidation_set: LiquidationSet = liquidation_set
         self.positions_to_open: List[PositionToOpen] = []
-        self.positions: List[dict] = []
-        self.market_sl_orders: List[dict] = []
-        self.limit_orders: List[dict] = []
+        self.followers: List[Exchange] = []  # same asset on the extra accounts
+        self.state_store: StateStore | None = None
+        self.order_locks: Dict[str, Lock] = {LONG: Lock(), SHORT: Lock()}
+        self.state: ExchangeState = ExchangeState((), (), ())
+        self.state_hash: int = hash(self.state)
         self.scanner: CoinalyzeScanner = scanner
-        self.discord_message_queue: List[DiscordMessage] = []
+        self.discord_message_queue: Queue[DiscordMessage] = (
+            Queue() if discord_message_queue is None else discord_message_queue
+        )
 
-    async def get_open_positions(self) -> List[dict]:
-        """Get open positions from the exchange"""
+    async def fetch_open_positions(self) -> Tuple[OpenPosition, ...]:
+        """Fetch open positions from the exchange"""
 
-        # get open positions info
         try:
-            positions = await self.exchange.fetch_positions(symbols=[TICKER])
-            open_positions = [
-                {
-                    "amount": f"{position.get("info", {}).get("positions")} contract(s)",
-                    "direction": position.get("info", {}).get("positionSide", ""),
-                    "price": f"$ {round(float(position.get("info", {}).get("averagePrice", 0.0)), EXCHANGE_PRICE_PRECISION):,}",
-                    "liquidation_price": f"$ {round(float(position.get("info", {}).get("liquidationPrice", 0.0)), EXCHANGE_PRICE_PRECISION):,}",
-                }
+            positions = await self.exchange.fetch_positions(symbols=[self.ticker])
+            return tuple(
+                OpenPosition(
+                    amount=str(position.get("info", {}).get("positions")),
+                    direction=position.get("info", {}).get("positionSide", ""),
+                    price=round(
+                        float(position.get("info", {}).get("averagePrice", 0.0)),
+                        self.price_precision,
+                    ),
+                    liquidation_price=round(
+                        float(position.get("info", {}).get("liquidationPrice", 0.0)),
+                        self.price_precision,
+                    ),
+                )
                 for position in positions
-            ]
+            )
         except Exception as e:
             logger.error(f"Error fetching positions: {e}")
-            open_positions = []
             if USE_DISCORD:
-                self.discord_message_queue.append(
+                self.discord_message_queue.put_nowait(
                     DiscordMessage(
                         channel_id=DISCORD_CHANNEL_HEARTBEAT_ID,
                         messages=[
@@ -114,27 +240,34 @@ class Exchange:
                         ],
                     )
                 )
+            return ()
+
+    async def fetch_market_sl_orders(self) -> Tuple[OpenOrder, ...]:
+        """Fetch open market tpsl orders from the exchange"""
 
-        # get open market tpsl orders
         try:
-            open_orders = await self.exchange.fetch_open_orders(params={"tpsl": True})
-            market_sl_orders_info = [
-                {
-                    "amount": f"{order.get("info", {}).get("size")} contract(s)",
-                    "direction": order.get("info", {}).get("positionSide", ""),
-                    "price": (
-                        f"$ {round(float(order.get("info", {}).get("slTriggerPrice", 0.0)), EXCHANGE_PRICE_PRECISION):,}"
+            open_orders = await self.exchange.fetch_open_orders(
+                symbol=self.ticker, params={"tpsl": True}
+            )
+            return tuple(
+                OpenOrder(
+                    amount=str(order.get("info", {}).get("size")),
+                    direction=order.get("info", {}).get("positionSide", ""),
+                    price=(
+                        round(
+                            float(order.get("info", {}).get("slTriggerPrice", 0.0)),
+                            self.price_precision,
+                        )
                         if order.get("info", {}).get("slTriggerPrice")
-                        else "-"
+                        else None
                     ),
-                }
+                )
                 for order in open_orders
-            ]
+            )
         except Exception as e:
             logger.error(f"Error fetching open orders: {e}")
-            market_sl_orders_info = []
             if USE_DISCORD:
-                self.discord_message_queue.append(
+                self.discord_message_queue.put_nowait(
                     DiscordMessage(
                         channel_id=DISCORD_CHANNEL_HEARTBEAT_ID,
                         messages=[
@@ -143,23 +276,28 @@ class Exchange:
                         ],
                     )
                 )
+            return ()
+
+    async def fetch_limit_orders(self) -> Tuple[OpenOrder, ...]:
+        """Fetch open limit orders from the exchange"""
 
-        # get open limit orders
         try:
-            open_orders = await self.exchange.fetch_open_orders()
-            limit_orders_info = [
-                {
-                    "amount": f"{order.get("amount", 0.0)} contract(s)",
-                    "direction": order.get("info", {}).get("side", ""),
-                    "price": f"$ {round(float(order.get("info", {}).get("price", 0.0)), EXCHANGE_PRICE_PRECISION):,}",
-                }
+            open_orders = await self.exchange.fetch_open_orders(symbol=self.ticker)
+            return tuple(
+                OpenOrder(
+                    amount=str(order.get("amount", 0.0)),
+                    direction=order.get("info", {}).get("side", ""),
+                    price=round(
+                        float(order.get("info", {}).get("price", 0.0)),
+                        self.price_precision,
+                    ),
+                )
                 for order in open_orders
-            ]
+            )
         except Exception as e:
             logger.error(f"Error fetching open limit orders: {e}")
-            limit_orders_info = []
             if USE_DISCORD:
-                self.discord_message_queue.append(
+                self.discord_message_queue.put_nowait(
                     DiscordMessage(
                         channel_id=DISCORD_CHANNEL_HEARTBEAT_ID,
                         messages=[
@@ -168,51 +306,77 @@ class Exchange:
                         ],
                     )
                 )
+            return ()
+
+    @timed("get_open_positions")
+    async def get_open_positions(self) -> None:
+        """Get open positions and orders from the exchange concurrently and post
+        them to discord if they changed"""
+
+        state = ExchangeState(
+            *await gather(
+                self.fetch_open_positions(),
+                self.fetch_market_sl_orders(),
+                self.fetch_limit_orders(),
+            )
+        )
 
-        # only log and post to discord if there are changes
-        if (
-            self.positions != open_positions
-            or self.market_sl_orders != market_sl_orders_info
-            or self.limit_orders != limit_orders_info
-        ):
-            self.market_sl_orders = market_sl_orders_info
-            self.limit_orders = limit_orders_info
-            self.positions = open_positions
-            if not any(self.market_sl_orders or self.limit_orders or self.positions):
-                open_positions_and_orders = ["No open positions / orders."]
-            else:
-                stripes = [40 * "-"]
-                open_positions_and_orders = (
-                    stripes
-                    + ["Position(s):"]
-                    + (
-                        [get_discord_table(position) for position in self.positions]
-                        if self.positions
-                        else ["```-```"]
-                    )
-                    + ["Market SL order(s):"]
-                    + (
-                        [get_discord_table(order) for order in self.market_sl_orders]
-                        if self.market_sl_orders
-                        else ["```-```"]
-                    )
-                    + ["Limit order(s):"]
-                    + (
-                        [get_discord_table(order) for order in self.limit_orders]
-                        if self.limit_orders
-                        else ["```-```"]
-                    )
-                    + stripes
+        # only format, log and post to discord if there are changes
+        if hash(state) == self.state_hash:
+            return
+        self.state = state
+        self.state_hash = hash(state)
+
+        if state.is_empty():
+            open_positions_and_orders = ["No open positions / orders."]
+        else:
+            stripes = [40 * "-"]
+            open_positions_and_orders = (
+                stripes
+                + ["Position(s):"]
+                + (
+                    [
+                        get_discord_table(position.to_dict())
+                        for position in state.positions
+                    ]
+                    if state.positions
+                    else ["```-```"]
                 )
+                + ["Market SL order(s):"]
+                + (
+                    [
+                        get_discord_table(order.to_dict())
+                        for order in state.market_sl_orders
+                    ]
+                    if state.market_sl_orders
+                    else ["```-```"]
+                )
+                + ["Limit order(s):"]
+                + (
+                    [get_discord_table(order.to_dict()) for order in state.limit_orders]
+                    if state.limit_orders
+                    else ["```-```"]
+                )
+                + stripes
+            )
 
-            logger.info(f"{open_positions_and_orders=}")
-            if USE_DISCORD:
-                self.discord_message_queue.append(
-                    DiscordMessage(
-                        channel_id=DISCORD_CHANNEL_POSITIONS_ID,
-                        messages=open_positions_and_orders,
-                    )
+        # name the asset / account when multiple of them share the channel
+        label: List[str] = []
+        if len(ASSETS) > 1:
+            label.append(self.ticker)
+        if len(ACCOUNTS) > 1:
+            label.append(f"account {self.account.name}")
+        if label:
+            open_positions_and_orders.insert(0, f"{' on '.join(label)}:")
+
+        logger.info(f"{open_positions_and_orders=}")
+        if USE_DISCORD:
+            self.discord_message_queue.put_nowait(
+                DiscordMessage(
+                    channel_id=DISCORD_CHANNEL_POSITIONS_ID,
+                    messages=open_positions_and_orders,
                 )
+            )
 
     async def set_leverage(self, symbol: str, leverage: int, direction: str) -> None:
         """Set the leverage for the exchange"""
@@ -228,22 +392,41 @@ class Exchange:
         except Exception as e:
             logger.warning(f"Error settings leverage: {e}")
 
+    @timed("get_last_candle")
+    @traced("get_last_candle")
     async def get_last_candle(self) -> Candle | None:
-        """Get the last candle from the exchange"""
+        """Get the last candle from the exchange, from the candle feed if it is
+        connected and through REST otherwise"""
+
+        if USE_CANDLE_FEED and self.candle_feed.connected:
+            candle: Candle | None = await self.candle_feed.get_candle(
+                int(self.scanner.now.replace(second=0, microsecond=0).timestamp())
+                * 1000
+            )
+            if candle:
+                # the feed also holds the final version of the candle that closed
+                if self.candles is not None:
+                    self.candles.extend(self.candle_feed.candles.values())
+                logger.info(f"{candle=}")
+                return candle
+            logger.warning("Falling back to fetching ohlcv through REST")
 
         try:
+            # with a buffer also the candle that closed, with its final values
             last_candles = await self.exchange.fetch_ohlcv(
-                symbol=TICKER,
+                symbol=self.ticker,
                 timeframe="5m",
-                limit=1,
+                limit=1 if self.candles is None else 2,
             )
-            candle: Candle = Candle(*last_candles[0])
+            if self.candles is not None:
+                self.candles.extend(Candle(*ohlcv) for ohlcv in last_candles)
+            candle: Candle = Candle(*last_candles[-1])
             logger.info(f"{candle=}")
             return candle
         except Exception as e:
             logger.error(f"Error fetching ohlcv: {e}")
             if USE_DISCORD:
-                self.discord_message_queue.append(
+                self.discord_message_queue.put_nowait(
                     DiscordMessage(
                         channel_id=DISCORD_CHANNEL_HEARTBEAT_ID,
                         messages=[
@@ -254,6 +437,60 @@ class Exchange:
                 )
             return None
 
+    def restore_state(self) -> None:
+        """Rebuild the pending liquidations, positions to open and the position size
+        from the state store after a restart"""
+
+        if not self.state_store:
+            return
+        start: float = monotonic()
+        position_size = self.state_store.load_position_size(
+            self.asset, self.account.name
+        )
+        if position_size is not None:
+            self._position_size = position_size
+        # followers share the liquidation set and don't run the strategy
+        if self.account is MAIN_ACCOUNT:
+            liquidations, positions_to_open = self.state_store.load_pending(self.asset)
+            for liquidation in liquidations:
+                self.liquidation_set.add(liquidation)
+            # a crash right after sending the orders can leave the entered position
+            # to open in the store, it must not be entered twice
+            order_ids = self.state_store.load_order_ids(self.asset)
+            for position_to_open in positions_to_open:
+                if get_key(position_to_open.liquidation) in order_ids:
+                    logger.warning(
+                        f"Not restoring {position_to_open._id}, its orders were sent"
+                    )
+                    continue
+                self.positions_to_open.append(position_to_open)
+            logger.info(
+                f"Restored {len(liquidations)} liquidation(s) and "
+                + f"{len(self.positions_to_open)} position(s) to open of {self.asset} in "
+                + f"{(monotonic() - start) * 1000:.1f}ms"
+            )
+
+    def save_state(self) -> None:
+        """Store the pending liquidations and positions to open"""
+
+        if self.state_store:
+            self.state_store.save_pending(
+                self.asset, self.liquidation_set, self.positions_to_open
+            )
+
+    @property
+    def min_amount(self) -> float:
+        """Return the minimum order amount (contracts) of the market"""
+
+        market: dict = self.exchange.market(self.ticker)
+        return market["limits"]["amount"]["min"] or market["precision"]["amount"]
+
+    def round_amount(self, amount: float) -> float:
+        """Return the amount (contracts) rounded to the amount step of the market"""
+
+        step: float = self.exchange.market(self.ticker)["precision"]["amount"]
+        return round(round(amount / step) * step, 8)
+
     async def set_position_sizes(self) -> None:
         """Set the position size for the exchange"""
 
@@ -262,19 +499,28 @@ class Exchange:
             balance: dict = await self.exchange.fetch_balance()
             total_balance: float = balance.get("USDT", {}).get("total", 1)
             price = await self.get_price()
+            contract_size: float = self.exchange.market(self.ticker)["contractSize"]
 
             # calculate position size
-            if USE_FIXED_RISK:
-                usdt_size: float = FIXED_RISK_EX_FEES * (1 / LEVERAGE * 100)
+            leverage: int = self.account.leverage
+            if self.account.use_fixed_risk:
+                usdt_size: float = self.account.fixed_risk_ex_fees * (
+                    1 / leverage * 100
+                )
             else:
-                usdt_size: float = total_balance / LEVERAGE * POSITION_PERCENTAGE
-            position_size: float = round(usdt_size / price * LEVERAGE * 1000, 1)
+                usdt_size: float = (
+                    total_balance / leverage * self.account.position_percentage
+                )
+            position_size: float = self.round_amount(
+                usdt_size / price * leverage / contract_size
+            )
 
         except Exception as e:
-            position_size = 0.1
+            # keep the last position size, the market may be what failed
+            position_size = getattr(self, "_position_size", DEFAULT_POSITION_SIZE)
             logger.error(f"Error setting position size: {e}")
             if USE_DISCORD:
-                self.discord_message_queue.append(
+                self.discord_message_queue.put_nowait(
                     DiscordMessage(
                         channel_id=DISCORD_CHANNEL_HEARTBEAT_ID,
                         messages=[
@@ -288,12 +534,20 @@ class Exchange:
         if not hasattr(self, "_position_size"):
             self._position_size = position_size
             logger.info(f"Initial {self._position_size=}")
+            if self.state_store:
+                self.state_store.save_position_size(
+                    self.asset, self.account.name, position_size
+                )
             return
 
         # set the position sizes if they have changed
         if position_size != self._position_size:
             logger.info(f"{position_size=}")
             self._position_size = position_size
+            if self.state_store:
+                self.state_store.save_position_size(
+                    self.asset, self.account.name, position_size
+                )
 
     @property
     def position_size(self) -> int:
@@ -301,6 +555,7 @@ class Exchange:
 
         return self._position_size
 
+    @traced("handle_position_to_open")
     async def handle_position_to_open(
         self, position_to_open: PositionToOpen, last_candle: Candle
     ) -> None:
@@ -329,16 +584,16 @@ class Exchange:
             canceling_position_log_info = {
                 "_id": position_to_open._id,
                 "price": (
-                    f"$ {round(last_candle.close, EXCHANGE_PRICE_PRECISION):,} is "
+                    f"$ {round(last_candle.close, self.price_precision):,} is "
                     + (f"above" if cancel_above else "below")
-                    + f" $ {round((position_to_open.cancel_above if cancel_above else position_to_open.cancel_below), EXCHANGE_PRICE_PRECISION):,}"
+                    + f" $ {round((position_to_open.cancel_above if cancel_above else position_to_open.cancel_below), self.price_precision):,}"
                 ),
                 "status": "canceled",
                 "reason": "price moved beyond 'no order' threshold",
             }
             logger.info(f"{canceling_position_log_info=}")
             if USE_DISCORD:
-                self.discord_message_queue.append(
+                self.discord_message_queue.put_nowait(
                     DiscordMessage(
                         channel_id=DISCORD_CHANNEL_WAITING_ID,
                         messages=[get_discord_table(canceling_position_log_info)],
@@ -353,8 +608,11 @@ class Exchange:
             )
             return
 
-        # at this point, we either enter or cancel
+        # at this point, we either enter or cancel, stored before any order is
+        # sent so a restart doesn't enter it again
         self.positions_to_open.remove(position_to_open)
+        if self.state_store:
+            self.state_store.remove_position_to_open(self.asset, position_to_open)
 
         # calculate number of candles before entry
         first_candle_after_confirmation = datetime.fromtimestamp(
@@ -370,16 +628,16 @@ class Exchange:
             canceling_position_log_info = {
                 "_id": position_to_open._id,
                 "price": (
-                    f"$ {round(last_candle.close, EXCHANGE_PRICE_PRECISION):,} is "
+                    f"$ {round(last_candle.close, self.price_precision):,} is "
                     + (f"above" if long_above else "below")
-                    + f" $ {round((position_to_open.long_above if long_above else position_to_open.short_below), EXCHANGE_PRICE_PRECISION):,}"
+                    + f" $ {round((position_to_open.long_above if long_above else position_to_open.short_below), self.price_precision):,}"
                 ),
                 "status": "canceled",
                 "reason": f"number of candles before entry can not be {nr_of_candles_before_entry}",
             }
             logger.info(f"{canceling_position_log_info=}")
             if USE_DISCORD:
-                self.discord_message_queue.append(
+                self.discord_message_queue.put_nowait(
                     DiscordMessage(
                         channel_id=DISCORD_CHANNEL_WAITING_ID,
                         messages=[get_discord_table(canceling_position_log_info)],
@@ -401,91 +659,107 @@ class Exchange:
             entering_position_log_info = {
                 "_id": position_to_open._id,
                 "price": (
-                    f"$ {round(last_candle.close, EXCHANGE_PRICE_PRECISION):,} is "
+                    f"$ {round(last_candle.close, self.price_precision):,} is "
                     + ("above" if long_above else "below")
-                    + f" $ {round(price_above_or_below, EXCHANGE_PRICE_PRECISION):,}"
+                    + f" $ {round(price_above_or_below, self.price_precision):,}"
                 ),
                 "status": "entering " + (LONG if long_above else SHORT),
             }
-            self.discord_message_queue.append(
+            self.discord_message_queue.put_nowait(
                 DiscordMessage(
                     channel_id=DISCORD_CHANNEL_WAITING_ID,
                     messages=[get_discord_table(entering_position_log_info)],
                 )
             )
 
-        amount = round(
+        # enter on all accounts at once, 1 failing account doesn't stop the others
+        accounts: List[Exchange] = [self] + self.followers
+        results = await gather(
+            *(
+                exchange.open_position(
+                    position_to_open, direction=LONG if long_above else SHORT
+                )
+                for exchange in accounts
+            ),
+            return_exceptions=True,
+        )
+        for exchange, result in zip(accounts, results):
+            if isinstance(result, Exception):
+                logger.error(
+                    f"Error opening position on account {exchange.account.name}: "
+                    + f"{result}"
+                )
+
+    @traced("open_position")
+    async def open_position(
+        self, position_to_open: PositionToOpen, direction: str
+    ) -> None:
+        """Size and place the orders of a position to open on this account"""
+
+        start: float = monotonic()
+        amount = self.round_amount(
             self.position_size
             * (
                 position_to_open.long_weight
-                if long_above
+                if direction == LONG
                 else position_to_open.short_weight
             )
-            / (position_to_open.long_sl if long_above else position_to_open.short_sl),
-            1,
+            / (
+                position_to_open.long_sl
+                if direction == LONG
+                else position_to_open.short_sl
+            )
         )
-        amount = max(amount, 0.1)  # minimum amount is 0.1 contract
+        amount = max(amount, self.min_amount)
         takeprofit_percentage = (
-            position_to_open.long_tp if long_above else position_to_open.short_tp
+            position_to_open.long_tp if direction == LONG else position_to_open.short_tp
         )
         price, stoploss_price, takeprofit_price = await self.order_placement(
-            direction=LONG if long_above else SHORT,
+            direction=direction,
             amount=amount,
             stoploss_percentage=(
-                position_to_open.long_sl if long_above else position_to_open.short_sl
+                position_to_open.long_sl
+                if direction == LONG
+                else position_to_open.short_sl
             ),
             takeprofit_percentage=takeprofit_percentage,
         )
+        latency: float = monotonic() - start
+        if self.state_store:
+            self.state_store.add_order(
+                self.asset,
+                self.account.name,
+                get_key(position_to_open.liquidation),
+                dict(
+                    direction=direction,
+                    amount=amount,
+                    price=price,
+                    stoploss_price=stoploss_price,
+                    takeprofit_price=takeprofit_price,
+                    latency=latency,
+                ),
+            )
+        logger.info(
+            f"Orders for {position_to_open._id} on account {self.account.name} "
+            + f"placed in {latency * 1000:.0f}ms"
+        )
 
         if USE_DISCORD:
             await self.post_trade_to_discord(
                 _id=position_to_open.liquidation._id,
-                direction=LONG if long_above else SHORT,
+                direction=direction,
                 price=price,
                 stoploss_price=stoploss_price,
                 takeprofit_price=takeprofit_price,
                 amount=amount,
+                latency=latency,
             )
 
-    async def get_algorithm_input_file(
-        self, strategy_type: str, input_date: date
-    ) -> pd.DataFrame:
-        """Get the algorithm input file for the given strategy type and date"""
-
-        try:
-            # try the current day first
-            algorithm_input: pd.DataFrame = pd.read_csv(
-                # TODO: BTC only for now, make it dynamic later
-                f"algorithm_input/algorithm_input-BTCUSDT-{input_date}-{strategy_type}-lvl2.csv"
-            )
-            return algorithm_input
-        except:
-            file_names = os.listdir("algorithm_input/")
-            file_names = [
-                name
-                for name in os.listdir("algorithm_input/")
-                if os.path.isfile(os.path.join("algorithm_input/", name))
-            ]
-            file_names = [
-                name
-                for name in file_names
-                if (
-                    name.startswith("algorithm_input-BTCUSDT-")
-                    and strategy_type in name
-                    and name.endswith("lvl2.csv")
-                )
-            ]
-            file_names.sort()
-            last_file_name = file_names[-1]
-            algorithm_input: pd.DataFrame = pd.read_csv(
-                f"algorithm_input/{last_file_name}"
-            )
-            return algorithm_input
-
+    @traced("handle_liquidation")
     async def handle_liquidation(
         self, liquidation: Liquidation, last_candle: Candle
     ) -> None:
-        """Handle 1 liquidation inside self.liquidation_set.liquidations"""
+        """Handle 1 liquidation inside self.liquidation_set"""
 
         liquidation_datetime: datetime = datetime.fromtimestamp(
             liquidation.candle.timestamp / 1000
@@ -495,7 +769,7 @@ class Exchange:
             self.scanner.now.replace(second=0, microsecond=0) - timedelta(minutes=15)
         ):
             logger.info(f"Removing old liquidation: {liquidation._id}")
-            self.liquidation_set.liquidations.remove(liquidation)
+            self.liquidation_set.remove(liquidation)
             return
 
         # if reaction to liquidation is strong, add it to positions to open
@@ -504,39 +778,37 @@ class Exchange:
             candles_before_confirmation = (
                 int(round((now - liquidation_datetime).total_seconds() / 300, 0)) - 1
             )
-            self.liquidation_set.liquidations.remove(liquidation)
+            self.liquidation_set.remove(liquidation)
 
             # read reversed algorithm input file
             reversed_trade: bool = False
-            reversed_algorithm_input: pd.DataFrame = (
-                await self.get_algorithm_input_file(
-                    strategy_type="reversed", input_date=liquidation_datetime.date()
-                )
+            algorithm_input: AlgorithmInput | None = self.algorithm_input.get(
+                strategy_type="reversed",
+                input_date=liquidation_datetime.date(),
+                hour=liquidation_datetime.hour,
             )
-            for row in reversed_algorithm_input.itertuples():
-                if row.hour == liquidation_datetime.hour:
-                    reversed_trade = row.trade_lvl2
-                    if reversed_trade:
-                        reversed_tp: float = (
-                            row.tp
-                            if not SMOOTH_OUT_SETUPS
-                            else round(row.tp * (1 - SMOOTH_AMOUNT), 2)
-                        )
-                        reversed_weight: float = round(
-                            min(row.performance_lvl2 / 5, 1), 2
-                        )
-                        reversed_sl: float = (
-                            row.sl
-                            if not SMOOTH_OUT_SETUPS
-                            else round(row.sl * (1 + SMOOTH_AMOUNT), 2)
-                        )
+            if algorithm_input and algorithm_input.trade_lvl2:
+                reversed_trade = True
+                reversed_tp: float = (
+                    algorithm_input.tp
+                    if not SMOOTH_OUT_SETUPS
+                    else round(algorithm_input.tp * (1 - SMOOTH_AMOUNT), 2)
+                )
+                reversed_weight: float = round(
+                    min(algorithm_input.performance_lvl2 / 5, 1), 2
+                )
+                reversed_sl: float = (
+                    algorithm_input.sl
+                    if not SMOOTH_OUT_SETUPS
+                    else round(algorithm_input.sl * (1 + SMOOTH_AMOUNT), 2)
+                )
 
             long_above = short_below = short_tp = short_sl = short_weight = long_tp = (
                 long_sl
             ) = long_weight = cancel_above = cancel_below = None
 
             if liquidation.direction == LONG:
-                below_price = round(last_candle.close * 0.996, EXCHANGE_PRICE_PRECISION)
+                below_price = round(last_candle.close * 0.996, self.price_precision)
                 if reversed_trade:
                     short_below = below_price
                     short_tp = reversed_tp
@@ -545,12 +817,10 @@ class Exchange:
                 else:
                     cancel_below = below_price
 
-                cancel_above = round(
-                    last_candle.close * 1.004, EXCHANGE_PRICE_PRECISION
-                )
+                cancel_above = round(last_candle.close * 1.004, self.price_precision)
 
             elif liquidation.direction == SHORT:
-                above_price = round(last_candle.close * 1.004, EXCHANGE_PRICE_PRECISION)
+                above_price = round(last_candle.close * 1.004, self.price_precision)
                 if reversed_trade:
                     long_above = above_price
                     long_tp = reversed_tp
@@ -559,9 +829,7 @@ class Exchange:
                 else:
                     cancel_above = above_price
 
-                cancel_below = round(
-                    last_candle.close * 0.996, EXCHANGE_PRICE_PRECISION
-                )
+                cancel_below = round(last_candle.close * 0.996, self.price_precision)
 
             if cancel_above and cancel_below:
                 # both cancel_above and cancel_below are set, no need to place order
@@ -589,7 +857,7 @@ class Exchange:
             if USE_DISCORD:
                 position_to_enter_log_info = position_to_open.init_message_dict()
                 logger.info(f"{position_to_enter_log_info=}")
-                self.discord_message_queue.append(
+                self.discord_message_queue.put_nowait(
                     DiscordMessage(
                         channel_id=DISCORD_CHANNEL_WAITING_ID,
                         messages=[
@@ -599,16 +867,32 @@ class Exchange:
                     )
                 )
 
+    @timed("run_loop")
+    @traced("run_loop")
     async def run_loop(self, last_candle: Candle) -> None:
         """Run the loop for the exchange"""
 
-        for position_to_open in deepcopy(self.positions_to_open):
-            await self.handle_position_to_open(position_to_open, last_candle)
-            await sleep(1)
+        # evaluate all pending positions at once, order placement is serialized
+        results = await gather(
+            *(
+                self.handle_position_to_open(position_to_open, last_candle)
+                for position_to_open in tuple(self.positions_to_open)
+            ),
+            return_exceptions=True,
+        )
 
-        # loop over detected liquidations
-        for liquidation in deepcopy(self.liquidation_set.liquidations):
-            await self.handle_liquidation(liquidation, last_candle)
+        # loop over detected liquidations, after the positions so new positions
+        # to open are evaluated from the next candle on
+        results += await gather(
+            *(
+                self.handle_liquidation(liquidation, last_candle)
+                for liquidation in self.liquidation_set
+            ),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Error running loop: {result}")
 
     async def reaction_to_liquidation_is_strong(
         self, liquidation: Liquidation, price: float
@@ -633,31 +917,45 @@ class Exchange:
         direction"""
 
         stoploss_price = (
-            round(price * (1 - (stoploss_percentage / 100)), EXCHANGE_PRICE_PRECISION)
+            round(price * (1 - (stoploss_percentage / 100)), self.price_precision)
             if direction == LONG
-            else round(
-                price * (1 + (stoploss_percentage / 100)), EXCHANGE_PRICE_PRECISION
-            )
+            else round(price * (1 + (stoploss_percentage / 100)), self.price_precision)
         )
         takeprofit_price = (
-            round(price * (1 + (takeprofit_percentage / 100)), EXCHANGE_PRICE_PRECISION)
+            round(price * (1 + (takeprofit_percentage / 100)), self.price_precision)
             if direction == LONG
             else round(
-                price * (1 - (takeprofit_percentage / 100)), EXCHANGE_PRICE_PRECISION
+                price * (1 - (takeprofit_percentage / 100)), self.price_precision
             )
         )
         return stoploss_price, takeprofit_price
 
+    async def seed_candles(self) -> None:
+        """Create the candle buffer and fill it with 1 bulk fetch of the last
+        candles, the ticks append to it from then on"""
+
+        self.candles = CandleBuffer()
+        try:
+            self.candles.extend(
+                Candle(*ohlcv)
+                for ohlcv in await self.exchange.fetch_ohlcv(
+                    symbol=self.ticker, timeframe="5m", limit=self.candles.size
+                )
+            )
+            logger.info(f"Seeded {len(self.candles)} {self.asset} candles")
+        except Exception as e:
+            logger.error(f"Error seeding candles: {e}")
+
     async def get_price(self) -> float | None:
         """Get the current price from the exchange ticker"""
 
         try:
-            ticker_data = await self.exchange.fetch_ticker(symbol=TICKER)
+            ticker_data = await self.exchange.fetch_ticker(symbol=self.ticker)
             return ticker_data["last"]
         except Exception as e:
             logger.error(f"Error fetching ticker: {e}")
             if USE_DISCORD:
-                self.discord_message_queue.append(
+                self.discord_message_queue.put_nowait(
                     DiscordMessage(
                         channel_id=DISCORD_CHANNEL_HEARTBEAT_ID,
                         messages=[
@@ -668,13 +966,67 @@ class Exchange:
                 )
             return None
 
+    async def get_filled_amount(self, order: dict, amount: float) -> float:
+        """Wait until the market order is filled, through the order fill watcher
+        with a slow status poll as safety net, or a fast status poll when the
+        watcher is disconnected, and return the filled amount"""
+
+        order_id: str = order.get("id", "")
+        if order.get("status") == "closed" and order.get("filled"):
+            return order["filled"]
+
+        filled_amount: float = 0.0
+        errors: int = 0
+        deadline: float = monotonic() + ORDER_FILL_TIMEOUT
+        while (remaining := deadline - monotonic()) > 0:
+            if USE_ORDER_FILL_WATCHER and self.order_fills.connected:
+                filled_amount = await self.order_fills.wait_for_fill(
+                    order_id, amount, min(ORDER_FILL_WATCHER_POLL_INTERVAL, remaining)
+                )
+            else:
+                await sleep(ORDER_FILL_POLL_INTERVAL)
+            if filled_amount < amount:
+                try:
+                    trades = await self.exchange.fetch_order_trades(
+                        id=order_id, symbol=self.ticker
+                    )
+                    filled_amount = max(
+                        filled_amount, sum(trade.get("amount") or 0 for trade in trades)
+                    )
+                except Exception as e:
+                    if not errors:
+                        logger.warning(f"Error fetching fills of order {order_id}: {e}")
+                    errors += 1
+            if filled_amount >= amount:
+                return self.round_amount(filled_amount)
+
+        if filled_amount:
+            logger.warning(f"Order {order_id} only filled {filled_amount} of {amount}")
+            return self.round_amount(filled_amount)
+
+        logger.error(f"No fill confirmed for order {order_id}, using {amount=}")
+        if USE_DISCORD:
+            self.discord_message_queue.put_nowait(
+                DiscordMessage(
+                    channel_id=DISCORD_CHANNEL_HEARTBEAT_ID,
+                    messages=[
+                        f"No fill confirmed for order {order_id} "
+                        + f"within {ORDER_FILL_TIMEOUT}s, placing take profit for "
+                        + f"{amount} contract(s)",
+                    ],
+                )
+            )
+        return amount
+
+    @timed("order_placement")
+    @traced("order_placement")
     async def order_placement(
         self,
         direction: str,
         amount: float,
         stoploss_percentage: float,
         takeprofit_percentage: float,
-    ) -> Tuple[float, float, float]:
+    ) -> Tuple[float | None, float | None, float | None]:
         """Process the order placement for the strategy using a market order
 
         Returns:
@@ -683,58 +1035,63 @@ class Exchange:
 
         logger.info(f"Placing {direction} order")
 
-        try:
-            price = await self.get_price()
-            price = (
-                round(price * 1.0001, EXCHANGE_PRICE_PRECISION)
-                if direction == SHORT
-                else round(price * 0.9999, EXCHANGE_PRICE_PRECISION)
-            )
-            stoploss_price, takeprofit_price = await self.get_sl_and_tp_price(
-                direction, price, stoploss_percentage, takeprofit_percentage
-            )
-
-            # place market order with stop loss
-            await self.exchange.create_order(
-                symbol=TICKER,
-                type="market",
-                side="buy" if direction == LONG else "sell",
-                amount=amount,
-                params=dict(
-                    marginMode="isolated",
-                    positionSide=direction,
-                    stopLoss=dict(reduceOnly=True, triggerPrice=stoploss_price),
-                ),
-            )
+        price = stoploss_price = takeprofit_price = None
+
+        # 1 entry and take profit pair per position side at a time, so 2 setups in
+        # the same direction can't interleave their orders on the shared position
+        async with self.order_locks[direction]:
+            try:
+                price = await self.get_price()
+                price = (
+                    round(price * 1.0001, self.price_precision)
+                    if direction == SHORT
+                    else round(price * 0.9999, self.price_precision)
+                )
+                stoploss_price, takeprofit_price = await self.get_sl_and_tp_price(
+                    direction, price, stoploss_percentage, takeprofit_percentage
+                )
 
-            # ensure the market order is placed before the take profit limit order is placed
-            await sleep(2)
+                # place market order with stop loss
+                order: dict = await self.exchange.create_order(
+                    symbol=self.ticker,
+                    type="market",
+                    side="buy" if direction == LONG else "sell",
+                    amount=amount,
+                    params=dict(
+                        marginMode="isolated",
+                        positionSide=direction,
+                        stopLoss=dict(reduceOnly=True, triggerPrice=stoploss_price),
+                    ),
+                )
 
-            # add take profit limit order
-            await self.exchange.create_order(
-                symbol=TICKER,
-                type="limit",
-                side=("buy" if direction == SHORT else "sell"),
-                amount=amount,
-                price=takeprofit_price,
-                params=dict(
-                    marginMode="isolated",
-                    positionSide=direction,
-                    reduceOnly=True,
-                ),
-            )
-        except Exception as e:
-            logger.error(f"Error placing order: {e}")
-            if USE_DISCORD:
-                self.discord_message_queue.append(
-                    DiscordMessage(
-                        channel_id=DISCORD_CHANNEL_HEARTBEAT_ID,
-                        messages=[
-                            "Error placing order:",
-                            str(e),
-                        ],
-                    )
+                # ensure the market order is filled before the take profit limit order is placed
+                filled_amount: float = await self.get_filled_amount(order, amount)
+
+                # add take profit limit order
+                await self.exchange.create_order(
+                    symbol=self.ticker,
+                    type="limit",
+                    side=("buy" if direction == SHORT else "sell"),
+                    amount=filled_amount,
+                    price=takeprofit_price,
+                    params=dict(
+                        marginMode="isolated",
+                        positionSide=direction,
+                        reduceOnly=True,
+                    ),
                 )
+            except Exception as e:
+                logger.error(f"Error placing order: {e}")
+                if USE_DISCORD:
+                    self.discord_message_queue.put_nowait(
+                        DiscordMessage(
+                            channel_id=DISCORD_CHANNEL_HEARTBEAT_ID,
+                            messages=[
+                                "Error placing order:",
+                                str(e),
+                            ],
+                        )
+                    )
         return price, stoploss_price, takeprofit_price
 
     async def post_trade_to_discord(
@@ -745,6 +1102,7 @@ class Exchange:
         stoploss_price: float,
         takeprofit_price: float,
         amount: float,
+        latency: float,
     ) -> None:
         """Post the order details to discord"""
         try:
@@ -752,13 +1110,16 @@ class Exchange:
                 _id=_id,
                 amount=f"{amount} contract(s)",
                 direction=direction,
-                price=f"$ {round(price, EXCHANGE_PRICE_PRECISION):,}",
-                stop_loss=f"$ {round(stoploss_price, EXCHANGE_PRICE_PRECISION):,}",
-                take_profit=f"$ {round(takeprofit_price, EXCHANGE_PRICE_PRECISION):,}",
+                price=f"$ {round(price, self.price_precision):,}",
+                stop_loss=f"$ {round(stoploss_price, self.price_precision):,}",
+                take_profit=f"$ {round(takeprofit_price, self.price_precision):,}",
             )
+            if len(ACCOUNTS) > 1:
+                order_log_info["account"] = self.account.name
+                order_log_info["latency"] = f"{latency * 1000:.0f}ms"
             logger.info(f"{order_log_info=}")
             if USE_DISCORD:
-                self.discord_message_queue.append(
+                self.discord_message_queue.put_nowait(
                     DiscordMessage(
                         channel_id=DISCORD_CHANNEL_TRADES_ID,
                         messages=[
@@ -770,7 +1131,7 @@ class Exchange:
         except Exception as e:
             logger.error(f"Error posting order to discord: {e}")
             if USE_DISCORD:
-                self.discord_message_queue.append(
+                self.discord_message_queue.put_nowait(
                     DiscordMessage(
                         channel_id=DISCORD_CHANNEL_HEARTBEAT_ID,
                         messages=[
@@ -0,0 +1,37 @@
+import csv
+import json
+from typing import Dict, List
+
+from misc import Candle
+
+
+def read_candles(path: str) -> List[Candle]:
+    """Read 5m candles from a csv file, ordered by timestamp"""
+
+    with open(path, newline="") as csv_file:
+        candles = [
+            Candle(
+                timestamp=int(float(row["timestamp"])),
+                open=float(row["open"]),
+                high=float(row["high"]),
+                low=float(row["low"]),
+                close=float(row["close"]),
+                volume=float(row["volume"]),
+            )
+            for row in csv.DictReader(csv_file)
+        ]
+    return sorted(candles, key=lambda candle: candle.timestamp)
+
+
+def read_liquidations(path: str) -> Dict[int, List[dict]]:
+    """Read a Coinalyze liquidation-history response and group the bars of all
+    symbols by bar time (s)"""
+
+    with open(path) as json_file:
+        response_json = json.load(json_file)
+
+    liquidations: Dict[int, List[dict]] = {}
+    for symbol in response_json:
+        for history in symbol.get("history", []):
+            liquidations.setdefault(history["t"], []).append(history)
+    return liquidations
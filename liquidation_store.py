@@ -0,0 +1,280 @@
+"""Disk-backed store of the 5min Coinalyze liquidation-history bars per symbol.
+
+Every symbol has 1 .npy file per UTC day of BARS_PER_DAY rows of (long, short)
+amounts, NaN where a bar wasn't fetched yet. The live scanner writes the closed
+bars of every request, gaps are filled from the API with:
+
+    python liquidation_store.py --assets BTC,ETH --days 7
+
+Research and replays read the day files memory-mapped, without the API.
+"""
+
+from argparse import ArgumentParser
+from asyncio import run
+from datetime import date, datetime, timedelta, timezone
+import os
+from threading import Lock
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from decouple import config
+
+from lazy_imports import lazy_import
+from logger import logger
+
+
+USE_LIQUIDATION_STORE = config("USE_LIQUIDATION_STORE", cast=bool, default=False)
+logger.info(f"{USE_LIQUIDATION_STORE=}")
+LIQUIDATION_STORE_DIRECTORY = config(
+    "LIQUIDATION_STORE_DIRECTORY", default="liquidations/"
+)
+STORE_INTERVAL = "5min"  # only 5min bars are stored
+BAR_SECONDS = 300
+BARS_PER_DAY = 86400 // BAR_SECONDS
+LONG, SHORT = 0, 1  # columns
+MAX_BARS_PER_REQUEST = 1000
+MAX_SYMBOLS_PER_REQUEST = 20
+
+# imported on first use, the scanner imports this module with the store disabled
+np = lazy_import("numpy")
+
+
+def get_day(timestamp: int) -> date:
+    """Return the UTC day of a timestamp (s)"""
+
+    return datetime.fromtimestamp(timestamp, timezone.utc).date()
+
+
+def get_day_start(day: date) -> int:
+    """Return the timestamp (s) of the start of a UTC day"""
+
+    return int(datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp())
+
+
+class LiquidationStore:
+    """Columnar store of liquidation bars, 1 memory-mapped file per symbol per day"""
+
+    def __init__(self, directory: str = LIQUIDATION_STORE_DIRECTORY) -> None:
+        self.directory = directory
+        self.lock = Lock()  # the scanner writes from threads
+
+    def get_path(self, symbol: str, day: date) -> str:
+        """Return the path of the day file of the symbol"""
+
+        return os.path.join(self.directory, symbol, f"{day.isoformat()}.npy")
+
+    def symbols(self, prefix: str = "") -> List[str]:
+        """Return the stored symbols starting with prefix, e.g. BTCUSD"""
+
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            symbol for symbol in os.listdir(self.directory) if symbol.startswith(prefix)
+        )
+
+    def read_day(self, symbol: str, day: date) -> "np.ndarray | None":
+        """Return the bars of the day memory-mapped read-only, None if not stored"""
+
+        try:
+            return np.load(self.get_path(symbol, day), mmap_mode="r")
+        except FileNotFoundError:
+            return None
+
+    def iter_days(
+        self, symbol: str, start: int, end: int
+    ) -> Iterator[Tuple[date, "np.ndarray | None"]]:
+        """Yield the memory-mapped bars of every day from start up to and
+        including end (s), without copying"""
+
+        day = get_day(start)
+        while day <= get_day(end):
+            yield day, self.read_day(symbol, day)
+            day += timedelta(days=1)
+
+    def read(
+        self, symbol: str, start: int, end: int
+    ) -> Tuple["np.ndarray", "np.ndarray"]:
+        """Return the bar timestamps and the (long, short) bars from start up to and
+        including end (s), NaN where not stored"""
+
+        first = start - start % BAR_SECONDS
+        timestamps = np.arange(first, end + 1, BAR_SECONDS, dtype=np.int64)
+        bars = np.full((len(timestamps), 2), np.nan)
+        for day, day_bars in self.iter_days(symbol, first, end):
+            if day_bars is None:
+                continue
+            day_start = get_day_start(day)
+            begin = max(first, day_start)
+            stop = min(end, day_start + 86400 - 1)
+            bars[(begin - first) // BAR_SECONDS : (stop - first) // BAR_SECONDS + 1] = (
+                day_bars[
+                    (begin - day_start)
+                    // BAR_SECONDS : (stop - day_start)
+                    // BAR_SECONDS
+                    + 1
+                ]
+            )
+        return timestamps, bars
+
+    def write(self, symbol: str, history: Iterable[dict]) -> int:
+        """Store Coinalyze bars ({"t", "l", "s"}) of the symbol, returns the number
+        of bars written"""
+
+        per_day: Dict[date, List[dict]] = {}
+        for bar in history:
+            per_day.setdefault(get_day(bar["t"]), []).append(bar)
+
+        written = 0
+        for day, bars in per_day.items():
+            path = self.get_path(symbol, day)
+            if os.path.exists(path):
+                day_bars = np.load(path, mmap_mode="r+")
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                day_bars = np.lib.format.open_memmap(
+                    path, mode="w+", dtype=np.float64, shape=(BARS_PER_DAY, 2)
+                )
+                day_bars[:] = np.nan
+            day_start = get_day_start(day)
+            for bar in bars:
+                index = (bar["t"] - day_start) // BAR_SECONDS
+                day_bars[index, LONG] = bar["l"]
+                day_bars[index, SHORT] = bar["s"]
+            day_bars.flush()
+            written += len(bars)
+        return written
+
+    def write_response(self, response_json: List[dict], closed_before: int) -> None:
+        """Store the bars of a liquidation-history response that closed before the
+        timestamp (s), the running bar is fetched again later"""
+
+        try:
+            with self.lock:
+                for symbol in response_json:
+                    self.write(
+                        symbol["symbol"],
+                        (
+                            bar
+                            for bar in symbol.get("history", [])
+                            if bar["t"] + BAR_SECONDS <= closed_before
+                        ),
+                    )
+        except Exception as e:
+            logger.error(f"Error storing liquidations: {e}")
+
+    def missing_ranges(
+        self, symbol: str, start: int, end: int
+    ) -> List[Tuple[int, int]]:
+        """Return the (first, last) bar timestamps (s) of the runs of bars from
+        start up to and including end that aren't stored"""
+
+        timestamps, bars = self.read(symbol, start, end)
+        missing = np.isnan(bars[:, LONG])
+        if not missing.any():
+            return []
+        # the edges of the runs of missing bars
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], missing, [0]))))
+        return [
+            (int(timestamps[first]), int(timestamps[last - 1]))
+            for first, last in zip(edges[::2], edges[1::2])
+        ]
+
+    def to_history(
+        self, symbols: List[str], start: int, end: int
+    ) -> Dict[int, List[dict]]:
+        """Return the stored bars grouped by bar time (s), the format of
+        history.read_liquidations"""
+
+        liquidations: Dict[int, List[dict]] = {}
+        for symbol in symbols:
+            timestamps, bars = self.read(symbol, start, end)
+            stored = ~np.isnan(bars[:, LONG])
+            for timestamp, (long, short) in zip(
+                timestamps[stored].tolist(), bars[stored].tolist()
+            ):
+                liquidations.setdefault(timestamp, []).append(
+                    {"t": timestamp, "l": long, "s": short}
+                )
+        return liquidations
+
+
+async def backfill(
+    store: LiquidationStore, assets: List[str], start: int, end: int
+) -> None:
+    """Fetch the bars of the assets' symbols that aren't stored yet"""
+
+    from coinalyze_client import CoinalyzeClient
+    from coinalyze_scanner import (
+        COINALYZE_LIQUIDATION_URL,
+        COINALYZE_SECRET_API_KEY,
+        FUTURE_MARKETS_URL,
+        CoinalyzeScanner,
+    )
+    from misc import LiquidationSet
+
+    client = CoinalyzeClient(api_key=COINALYZE_SECRET_API_KEY)
+    try:
+        markets = await client.get(FUTURE_MARKETS_URL)
+        symbols: List[str] = []
+        for asset in assets:
+            scanner = CoinalyzeScanner(
+                datetime.now(), LiquidationSet(), asset=asset, client=client
+            )
+            await scanner.set_symbols(markets)
+            symbols += [symbol for symbol in scanner.symbols.split(",") if symbol]
+
+        # symbols missing the same range share requests
+        requests: Dict[Tuple[int, int], List[str]] = {}
+        for symbol in symbols:
+            for first, last in store.missing_ranges(symbol, start, end):
+                for chunk in range(first, last + 1, MAX_BARS_PER_REQUEST * BAR_SECONDS):
+                    chunk_last = min(
+                        chunk + (MAX_BARS_PER_REQUEST - 1) * BAR_SECONDS, last
+                    )
+                    requests.setdefault((chunk, chunk_last), []).append(symbol)
+
+        written = 0
+        for (first, last), range_symbols in requests.items():
+            for nr in range(0, len(range_symbols), MAX_SYMBOLS_PER_REQUEST):
+                for symbol in await client.get(
+                    COINALYZE_LIQUIDATION_URL,
+                    params={
+                        "symbols": ",".join(
+                            range_symbols[nr : nr + MAX_SYMBOLS_PER_REQUEST]
+                        ),
+                        "interval": STORE_INTERVAL,
+                        "from": first,
+                        "to": last,
+                    },
+                ):
+                    written += store.write(
+                        symbol["symbol"],
+                        (
+                            bar
+                            for bar in symbol.get("history", [])
+                            if first <= bar["t"] <= last
+                        ),
+                    )
+    finally:
+        await client.close()
+    logger.info(
+        f"Backfilled {written} bars of {len(symbols)} symbols in {len(requests)} range(s)"
+    )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--assets", default="BTC", help="e.g. BTC,ETH")
+    parser.add_argument("--days", type=int, default=7, help="back from now")
+    parser.add_argument("--directory", default=LIQUIDATION_STORE_DIRECTORY)
+    args = parser.parse_args()
+
+    # the last closed bar
+    end = int(datetime.now().timestamp()) // BAR_SECONDS * BAR_SECONDS - BAR_SECONDS
+    run(
+        backfill(
+            LiquidationStore(args.directory),
+            args.assets.split(","),
+            end - args.days * 86400,
+            end,
+        )
+    )
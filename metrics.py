@@ -0,0 +1,203 @@
+from asyncio import CancelledError, Task, create_task, get_running_loop, sleep
+from bisect import bisect_left
+from collections import defaultdict
+from functools import wraps
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Tuple, TypeVar
+
+from decouple import config
+
+from lazy_imports import lazy_import
+from logger import logger
+
+
+USE_METRICS = config("USE_METRICS", cast=bool, default=False)
+logger.info(f"{USE_METRICS=}")
+METRICS_HOST = config("METRICS_HOST", default="127.0.0.1")
+METRICS_PORT = config("METRICS_PORT", cast=int, default="9108")
+LOOP_LAG_INTERVAL = 0.5  # seconds
+
+# imported on first use, aiohttp's server side only loads when USE_METRICS is true
+web = lazy_import("aiohttp.web")
+
+# seconds, from a websocket candle to a slow Coinalyze retry
+BUCKETS: Tuple[float, ...] = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+T = TypeVar("T")
+
+
+class Histogram:
+    """Prometheus histogram of 1 label value, cumulative buckets are only summed
+    when rendered so observing stays a bisect and 3 additions"""
+
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts: List[int] = [0] * (len(buckets) + 1)
+        self.sum: float = 0.0
+        self.count: int = 0
+
+    def observe(self, value: float) -> None:
+        """Record 1 observation"""
+
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str) -> List[str]:
+        """Return the Prometheus text lines of the histogram"""
+
+        lines = []
+        cumulative = 0
+        for bucket, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            le = "+Inf" if bucket == float("inf") else repr(bucket)
+            lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+class Metrics:
+    """Latency histograms and counters of the trading tick, rendered in the
+    Prometheus text format"""
+
+    def __init__(self) -> None:
+        self.stage_durations: Dict[str, Histogram] = defaultdict(Histogram)
+        self.stage_errors: Dict[str, int] = defaultdict(int)
+        self.log_messages: Dict[str, int] = defaultdict(int)
+        self.loop_lag: Histogram = Histogram()
+
+    def render(self) -> str:
+        """Return all metrics in the Prometheus text format"""
+
+        lines = [
+            "# HELP bot_stage_duration_seconds Duration of a stage of the trading tick",
+            "# TYPE bot_stage_duration_seconds histogram",
+        ]
+        for stage, histogram in sorted(self.stage_durations.items()):
+            lines += histogram.render("bot_stage_duration_seconds", f'stage="{stage}"')
+        lines += [
+            "# HELP bot_stage_errors_total Exceptions raised out of a stage",
+            "# TYPE bot_stage_errors_total counter",
+        ]
+        lines += [
+            f'bot_stage_errors_total{{stage="{stage}"}} {count}'
+            for stage, count in sorted(self.stage_errors.items())
+        ]
+        lines += [
+            "# HELP bot_log_messages_total Logged messages per level",
+            "# TYPE bot_log_messages_total counter",
+        ]
+        lines += [
+            f'bot_log_messages_total{{level="{level}"}} {count}'
+            for level, count in sorted(self.log_messages.items())
+        ]
+        lines += [
+            "# HELP bot_event_loop_lag_seconds Delay of the event loop waking up",
+            "# TYPE bot_event_loop_lag_seconds histogram",
+        ]
+        lines += self.loop_lag.render("bot_event_loop_lag_seconds", 'loop="main"')
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+
+class LogCounter(logging.Handler):
+    """Counts the log messages per level, errors that are caught and logged still
+    show up in the metrics"""
+
+    def emit(self, record: logging.LogRecord) -> None:
+        METRICS.log_messages[record.levelname.lower()] += 1
+
+
+logger.addHandler(LogCounter())
+
+
+def timed(
+    stage: str,
+) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]]]:
+    """Decorate a coroutine function to record its duration and exceptions"""
+
+    def decorator(function: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        histogram = METRICS.stage_durations[stage]
+
+        @wraps(function)
+        async def wrapper(*args, **kwargs) -> T:
+            start = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            except Exception:
+                METRICS.stage_errors[stage] += 1
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+class MetricsServer:
+    """Serves the metrics on a local http endpoint and measures the event loop
+    lag in the background"""
+
+    def __init__(self, host: str = METRICS_HOST, port: int = METRICS_PORT) -> None:
+        self.host = host
+        self.port = port
+        self.runner: web.AppRunner | None = None
+        self.task: Task | None = None
+
+    async def handle_metrics(self, request: "web.Request") -> "web.Response":
+        """Return the metrics"""
+
+        return web.Response(
+            text=METRICS.render(), content_type="text/plain", charset="utf-8"
+        )
+
+    async def start(self) -> None:
+        """Start the http endpoint and the event loop lag monitor"""
+
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle_metrics)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+        self.task = create_task(self.monitor_loop_lag())
+        logger.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self) -> None:
+        """Stop the http endpoint and the event loop lag monitor"""
+
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except CancelledError:
+                pass
+        if self.runner:
+            await self.runner.cleanup()
+
+    async def monitor_loop_lag(self) -> None:
+        """Record how late the event loop wakes up from a short sleep"""
+
+        loop = get_running_loop()
+        while True:
+            start = loop.time()
+            await sleep(LOOP_LAG_INTERVAL)
+            METRICS.loop_lag.observe(max(loop.time() - start - LOOP_LAG_INTERVAL, 0.0))
@@ -1,8 +1,7 @@
-from copy import deepcopy
+from collections import deque
 from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import List
-from logger import logger
+from typing import Deque, Dict, Iterable, Iterator, List, Tuple
 
 
 @dataclass
@@ -34,38 +33,83 @@ class Liquidation:
     def to_dict(self) -> dict:
         """Convert the Liquidation instance to a json dumpable dictionary."""
 
-        liquidation_dict = deepcopy(self.__dict__)
-        liquidation_dict["amount"] = f"$ {round(self.amount, 2):,}"
-        del liquidation_dict["time"]
-        del liquidation_dict["candle"]
-        del liquidation_dict["time_frame"]
-        del liquidation_dict["nr_of_liquidations"]
-        return liquidation_dict
+        return {
+            "_id": self._id,
+            "amount": f"$ {round(self.amount, 2):,}",
+            "direction": self.direction,
+            "on_liquidation_days": self.on_liquidation_days,
+        }
 
 
 @dataclass
 class LiquidationSet:
-    """LiquidationSet class to hold a set of liquidations"""
+    """LiquidationSet class to hold a set of liquidations, newest first, with running
+    totals per direction"""
 
-    liquidations: list[Liquidation]
+    liquidations: Iterable[Liquidation] = ()
+
+    def __post_init__(self) -> None:
+        liquidations = self.liquidations
+        self.liquidations: Deque[Liquidation] = deque()
+        self.counts: Dict[str, int] = {}
+        self.amounts: Dict[str, int] = {}
+        for liquidation in sorted(
+            liquidations, key=lambda liquidation: liquidation.time
+        ):
+            self.add(liquidation)
+
+    def __len__(self) -> int:
+        return len(self.liquidations)
+
+    def __iter__(self) -> Iterator[Liquidation]:
+        """Iterate over a snapshot, so liquidations can be removed while iterating."""
+
+        return iter(tuple(self.liquidations))
+
+    def add(self, liquidation: Liquidation) -> None:
+        """Add a liquidation, O(1) when it is the newest one in the set."""
+
+        if not self.liquidations or liquidation.time >= self.liquidations[0].time:
+            self.liquidations.appendleft(liquidation)
+        else:
+            # out of order, keep the set sorted by time
+            index = next(
+                (
+                    index
+                    for index, other in enumerate(self.liquidations)
+                    if liquidation.time >= other.time
+                ),
+                len(self.liquidations),
+            )
+            self.liquidations.insert(index, liquidation)
+        self.counts[liquidation.direction] = (
+            self.counts.get(liquidation.direction, 0) + liquidation.nr_of_liquidations
+        )
+        self.amounts[liquidation.direction] = (
+            self.amounts.get(liquidation.direction, 0) + liquidation.amount
+        )
+
+    def remove(self, liquidation: Liquidation) -> None:
+        """Remove a liquidation from the set."""
+
+        self.liquidations.remove(liquidation)
+        self.subtract(liquidation)
+
+    def subtract(self, liquidation: Liquidation) -> None:
+        """Subtract a removed liquidation from the running totals."""
+
+        self.counts[liquidation.direction] -= liquidation.nr_of_liquidations
+        self.amounts[liquidation.direction] -= liquidation.amount
 
     def total_liquidations(self, direction: str) -> int:
         """Return the total number of liquidations in the set for a given direction."""
 
-        return sum(
-            liquidation.nr_of_liquidations
-            for liquidation in self.liquidations
-            if liquidation.direction == direction
-        )
+        return self.counts.get(direction, 0)
 
     def total_amount(self, direction: str) -> int:
         """Return the total amount of liquidations in the set for a given direction."""
 
-        return sum(
-            liquidation.amount
-            for liquidation in self.liquidations
-            if liquidation.direction == direction
-        )
+        return self.amounts.get(direction, 0)
 
     def to_dict(self) -> dict:
         """Convert the LiquidationSet instance to a json dumpable dictionary."""
@@ -75,16 +119,14 @@ class LiquidationSet:
         )
 
     def remove_old_liquidations(self, now: datetime) -> None:
-        """Remove liquidations older than 10 minutes (5m + beginning of candle = 10)."""
+        """Remove liquidations older than 10 minutes (5m + beginning of candle = 10).
+        The oldest liquidations are at the end, so this stops at the first one that
+        is recent enough."""
 
-        try:
-            for liquidation in self.liquidations:
-                now_rounded = now.replace(second=0, microsecond=0)
-                if liquidation.time < (now_rounded - timedelta(minutes=10)).timestamp():
-                    self.liquidations.remove(liquidation)
-        except Exception as e:
-            logger.error(f"Error removing old liquidations: {e}")
-            self.liquidations = []
+        now_rounded = now.replace(second=0, microsecond=0)
+        oldest_time = (now_rounded - timedelta(minutes=10)).timestamp()
+        while self.liquidations and self.liquidations[-1].time < oldest_time:
+            self.subtract(self.liquidations.pop())
 
 
 @dataclass
@@ -132,6 +174,96 @@ class PositionToOpen:
         return message_dict
 
 
+@dataclass
+class AlgorithmInput:
+    """AlgorithmInput class to hold 1 hour of an algorithm input file"""
+
+    hour: int
+    tp: float | None
+    sl: float | None
+    performance_lvl2: float
+    trade_lvl2: bool
+
+
+@dataclass(frozen=True)
+class OpenPosition:
+    """OpenPosition class to hold 1 open position on the exchange"""
+
+    amount: str
+    direction: str
+    price: float
+    liquidation_price: float
+
+    def to_dict(self) -> dict:
+        """Convert the OpenPosition instance to a json dumpable dictionary."""
+
+        return {
+            "amount": f"{self.amount} contract(s)",
+            "direction": self.direction,
+            "price": f"$ {self.price:,}",
+            "liquidation_price": f"$ {self.liquidation_price:,}",
+        }
+
+
+@dataclass(frozen=True)
+class OpenOrder:
+    """OpenOrder class to hold 1 open stop loss or limit order on the exchange"""
+
+    amount: str
+    direction: str
+    price: float | None
+
+    def to_dict(self) -> dict:
+        """Convert the OpenOrder instance to a json dumpable dictionary."""
+
+        return {
+            "amount": f"{self.amount} contract(s)",
+            "direction": self.direction,
+            "price": f"$ {self.price:,}" if self.price is not None else "-",
+        }
+
+
+@dataclass(frozen=True)
+class ExchangeState:
+    """ExchangeState class to hold a hashable snapshot of the open positions and
+    orders on the exchange"""
+
+    positions: Tuple[OpenPosition, ...]
+    market_sl_orders: Tuple[OpenOrder, ...]
+    limit_orders: Tuple[OpenOrder, ...]
+
+    def is_empty(self) -> bool:
+        """Return whether there are no open positions or orders."""
+
+        return not (self.positions or self.market_sl_orders or self.limit_orders)
+
+
+@dataclass
+class Account:
+    """Account class to hold the credentials and sizing settings of 1 exchange
+    account"""
+
+    name: str
+    api_key: str
+    secret_key: str
+    passphrase: str
+    leverage: int
+    use_fixed_risk: bool
+    fixed_risk_ex_fees: float
+    position_percentage: float
+
+    def to_dict(self) -> dict:
+        """Convert the Account instance to a json dumpable dictionary, without the
+        credentials."""
+
+        account_dict = dict(leverage=self.leverage, use_fixed_risk=self.use_fixed_risk)
+        if self.use_fixed_risk:
+            account_dict["fixed_risk_ex_fees"] = self.fixed_risk_ex_fees
+        else:
+            account_dict["position_percentage"] = self.position_percentage
+        return account_dict
+
+
 @dataclass
 class DiscordMessage:
     """DiscordMessage class to hold the discord message data"""
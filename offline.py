@@ -0,0 +1,18 @@
+"""Import before any bot module to run the bot offline: dummy credentials for
+Coinalyze and the exchange, no discord, no websocket subscriptions and no state
+store."""
+
+import os
+
+
+for key in [
+    "COINALYZE_SECRET_API_KEY",
+    "EXCHANGE_API_KEY",
+    "EXCHANGE_SECRET_KEY",
+    "EXCHANGE_PASSPHRASE",
+]:
+    os.environ.setdefault(key, "offline")
+os.environ["USE_DISCORD"] = "false"
+os.environ["USE_CANDLE_FEED"] = "false"
+os.environ["USE_ORDER_FILL_WATCHER"] = "false"
+os.environ["USE_STATE_STORE"] = "false"
@@ -0,0 +1,84 @@
+from asyncio import CancelledError, Event, Task, create_task, sleep, timeout
+import ccxt.pro as ccxt
+from decouple import config
+from logger import logger
+from typing import Dict
+
+USE_ORDER_FILL_WATCHER = config("USE_ORDER_FILL_WATCHER", cast=bool, default=True)
+logger.info(f"{USE_ORDER_FILL_WATCHER=}")
+ORDER_FILL_RECONNECT_DELAY = 1.0  # seconds
+ORDER_FILL_MAX_ORDERS = 100
+
+
+class OrderFillWatcher:
+    """Keeps a private websocket subscription to the orders of 1 symbol, so fills
+    are known the moment the exchange reports them"""
+
+    def __init__(self, exchange: ccxt.Exchange, symbol: str) -> None:
+        self.exchange = exchange
+        self.symbol = symbol
+        self.fills: Dict[str, float] = {}
+        self.connected: bool = False
+        self.errors: int = 0
+        self.updated: Event = Event()
+        self.task: Task | None = None
+
+    def start(self) -> None:
+        """Start watching orders in the background"""
+
+        if self.task is None or self.task.done():
+            self.task = create_task(self.watch())
+
+    async def stop(self) -> None:
+        """Stop watching orders"""
+
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except CancelledError:
+                pass
+        self.task = None
+        self.connected = False
+
+    async def watch(self) -> None:
+        """Store the filled amount of every order update, reconnecting on errors"""
+
+        while True:
+            try:
+                orders = await self.exchange.watch_orders(symbol=self.symbol)
+            except CancelledError:
+                raise
+            except Exception as e:
+                if not self.errors:
+                    logger.warning(f"Order fill watcher disconnected: {e}")
+                self.errors += 1
+                self.connected = False
+                await sleep(ORDER_FILL_RECONNECT_DELAY)
+                continue
+
+            # connected once an update came through, not when subscribing
+            if not self.connected:
+                logger.info(f"Order fill watcher connected for {self.symbol}")
+            self.connected = True
+            self.errors = 0
+            for order in orders:
+                if order.get("id") and order.get("filled"):
+                    self.fills[order["id"]] = order["filled"]
+            for order_id in list(self.fills)[:-ORDER_FILL_MAX_ORDERS]:
+                del self.fills[order_id]
+
+            updated, self.updated = self.updated, Event()
+            updated.set()
+
+    async def wait_for_fill(self, order_id: str, amount: float, wait: float) -> float:
+        """Return the filled amount of the order once it is (fully) filled, or what
+        was filled so far when the wait is over"""
+
+        try:
+            async with timeout(wait):
+                while self.fills.get(order_id, 0.0) < amount:
+                    await self.updated.wait()
+        except TimeoutError:
+            pass
+        return self.fills.get(order_id, 0.0)
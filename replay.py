@@ -0,0 +1,154 @@
+"""Replay historical 5m candles and Coinalyze liquidation history through the
+strategy on a virtual clock, filling orders on a simulated exchange.
+
+    python replay.py --candles candles.csv --liquidations liquidations.json
+
+candles.csv holds timestamp (ms), open, high, low, close and volume columns,
+liquidations.json is a (merged) Coinalyze liquidation-history response with 5min
+bars for the scanned symbols. Instead of it, --liquidation-store replays the bars
+of the asset's symbols in a liquidation_store.py directory.
+"""
+
+import offline  # noqa: F401, must be imported before the bot modules
+
+from argparse import ArgumentParser
+from asyncio import run, sleep
+import csv
+from dataclasses import asdict, fields
+from datetime import datetime
+import logging
+import time
+from typing import Dict, List
+
+from algorithm_input import ALGORITHM_INPUT_DIRECTORY, AlgorithmInputStore
+from coinalyze_scanner import DEFAULT_ASSET, CoinalyzeScanner
+import exchange as exchange_module
+from exchange import Exchange
+from history import read_candles, read_liquidations
+from liquidation_store import LiquidationStore
+from logger import logger
+from misc import Candle, LiquidationSet
+from simulated_exchange import SimulatedExchange, SimulatedTrade
+
+
+async def skip_sleep(seconds: float) -> None:
+    """Virtual clock: replayed time only moves with the candles"""
+
+    await sleep(0)
+
+
+class Replay:
+    """Drive the real CoinalyzeScanner and Exchange strategy code with
+    historical data"""
+
+    def __init__(
+        self,
+        candles: List[Candle],
+        liquidations: Dict[int, List[dict]],
+        balance: float,
+        algorithm_input_directory: str = ALGORITHM_INPUT_DIRECTORY,
+        asset: str = DEFAULT_ASSET,
+    ) -> None:
+        self.candles = candles
+        self.liquidations = liquidations
+        self.simulated_exchange = SimulatedExchange(balance=balance)
+        self.algorithm_input_directory = algorithm_input_directory
+        self.asset = asset
+
+    async def run(self) -> List[SimulatedTrade]:
+        """Replay all candles and return the closed trades"""
+
+        start = datetime.fromtimestamp(self.candles[0].timestamp / 1000)
+        scanner = CoinalyzeScanner(
+            start, LiquidationSet(liquidations=[]), asset=self.asset
+        )
+        exchange = Exchange(scanner.liquidation_set, scanner, asset=self.asset)
+        exchange.exchange = self.simulated_exchange
+        exchange.algorithm_input = AlgorithmInputStore(
+            directory=self.algorithm_input_directory, asset=self.asset
+        )
+        scanner.exchange = exchange
+
+        # the strategy waits with exchange.sleep, restored afterwards for later
+        # use in the same process, e.g. benchmarks or another replay
+        exchange_module.sleep = skip_sleep
+        try:
+            previous_candle: Candle | None = None
+            for candle in self.candles:
+                # stop losses and take profits hit while the previous candle formed
+                if previous_candle:
+                    self.simulated_exchange.fill_candle(previous_candle)
+                previous_candle = candle
+
+                # the bot wakes up at the open of the candle
+                scanner.now = datetime.fromtimestamp(candle.timestamp / 1000)
+                self.simulated_exchange.set_candle(candle)
+                await exchange.set_position_sizes()
+                last_candle: Candle | None = await exchange.get_last_candle()
+                await exchange.run_loop(last_candle)
+                await scanner.handle_liquidation_set(
+                    last_candle,
+                    self.liquidations.get(candle.timestamp // 1000 - 300, []),
+                )
+        finally:
+            exchange_module.sleep = sleep
+            await scanner.client.close()
+
+        return self.simulated_exchange.trades
+
+
+def write_trades(trades: List[SimulatedTrade], path: str) -> None:
+    """Write the trade list to a csv file"""
+
+    with open(path, "w", newline="") as csv_file:
+        writer = csv.DictWriter(
+            csv_file, fieldnames=[field.name for field in fields(SimulatedTrade)]
+        )
+        writer.writeheader()
+        writer.writerows(asdict(trade) for trade in trades)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--candles", required=True)
+    liquidations_input = parser.add_mutually_exclusive_group(required=True)
+    liquidations_input.add_argument("--liquidations")
+    liquidations_input.add_argument("--liquidation-store")
+    parser.add_argument("--algorithm-input", default=ALGORITHM_INPUT_DIRECTORY)
+    parser.add_argument("--asset", default=DEFAULT_ASSET)
+    parser.add_argument("--balance", type=float, default=1000.0)
+    parser.add_argument("--output", default="trades.csv")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logger.setLevel(logging.WARNING)
+
+    started = time.perf_counter()
+    candles = read_candles(args.candles)
+    if args.liquidations:
+        liquidations = read_liquidations(args.liquidations)
+    else:
+        liquidation_store = LiquidationStore(args.liquidation_store)
+        liquidations = liquidation_store.to_history(
+            liquidation_store.symbols(prefix=f"{args.asset}USD"),
+            candles[0].timestamp // 1000 - 300,
+            candles[-1].timestamp // 1000,
+        )
+    replay = Replay(
+        candles,
+        liquidations,
+        args.balance,
+        args.algorithm_input,
+        args.asset,
+    )
+    trades = run(replay.run())
+    write_trades(trades, args.output)
+
+    wins = [trade for trade in trades if trade.pnl > 0]
+    print(f"candles replayed: {len(replay.candles)}")
+    print(f"trades: {len(trades)} ({len(wins)} won)")
+    print(f"pnl: $ {round(sum(trade.pnl for trade in trades), 2):,}")
+    print(f"final balance: $ {round(replay.simulated_exchange.balance, 2):,}")
+    print(f"open lots: {len(replay.simulated_exchange.lots)}")
+    print(f"replayed in {time.perf_counter() - started:.2f}s, trades in {args.output}")
@@ -0,0 +1,128 @@
+from asyncio import sleep
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from decouple import config
+from logger import logger
+from tracing import TRACER, USE_TRACING
+from typing import Awaitable, Callable, Dict, List
+
+
+SCHEDULER_LATENESS_WARNING = config(
+    "SCHEDULER_LATENESS_WARNING", cast=float, default="1.0"
+)  # seconds
+logger.info(f"{SCHEDULER_LATENESS_WARNING=}")
+
+
+@dataclass
+class Job:
+    """Job class to hold a periodic job that is aligned to the wall clock"""
+
+    name: str
+    callback: Callable[[datetime], Awaitable[None]]
+    period: timedelta
+    offset: timedelta = timedelta(0)
+    deadline: datetime | None = None
+    runs: int = 0
+    missed_runs: int = 0
+    last_lateness: float = 0.0
+    max_lateness: float = 0.0
+    total_lateness: float = 0.0
+
+    def next_deadline(self, now: datetime) -> datetime:
+        """Return the first deadline after now, aligned to local midnight + offset."""
+
+        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        periods_passed = (now - midnight - self.offset) // self.period
+        deadline = midnight + self.offset + periods_passed * self.period
+        while deadline <= now:
+            deadline += self.period
+        return deadline
+
+    def to_dict(self) -> dict:
+        """Convert the Job lateness statistics to a json dumpable dictionary."""
+
+        return dict(
+            runs=self.runs,
+            missed_runs=self.missed_runs,
+            last_lateness=f"{self.last_lateness:.3f}s",
+            max_lateness=f"{self.max_lateness:.3f}s",
+            avg_lateness=f"{self.total_lateness / max(self.runs, 1):.3f}s",
+        )
+
+
+@dataclass
+class Scheduler:
+    """Scheduler class that sleeps until the next job deadline instead of polling.
+
+    Jobs whose deadline passed while another job was running are run once, late,
+    instead of being dropped. Multiple missed periods of the same job collapse into
+    that single late run.
+    """
+
+    jobs: List[Job] = field(default_factory=list)
+
+    def add_job(
+        self,
+        name: str,
+        callback: Callable[[datetime], Awaitable[None]],
+        period: timedelta,
+        offset: timedelta = timedelta(0),
+    ) -> Job:
+        """Register a job that runs every period, offset from local midnight"""
+
+        job = Job(name=name, callback=callback, period=period, offset=offset)
+        job.deadline = job.next_deadline(datetime.now())
+        self.jobs.append(job)
+        logger.info(f"Scheduled {name} every {period} (next run at {job.deadline})")
+        return job
+
+    def lateness_report(self) -> Dict[str, dict]:
+        """Return the lateness statistics per job"""
+
+        return {job.name: job.to_dict() for job in self.jobs}
+
+    async def run_job(self, job: Job) -> None:
+        """Run 1 due job, record its lateness and schedule its next deadline"""
+
+        deadline = job.deadline
+        now = datetime.now()
+        lateness = (now - deadline).total_seconds()
+        missed_runs = (now - deadline) // job.period
+        job.runs += 1
+        job.missed_runs += missed_runs
+        job.last_lateness = lateness
+        job.max_lateness = max(job.max_lateness, lateness)
+        job.total_lateness += lateness
+        if lateness > SCHEDULER_LATENESS_WARNING:
+            logger.warning(
+                f"Job {job.name} is running {lateness:.3f}s late"
+                + (f" ({missed_runs} run(s) coalesced)" if missed_runs else "")
+            )
+
+        # schedule the next deadline before running, so a slow job can't shift it
+        job.deadline = job.next_deadline(now)
+        try:
+            # every scheduler wake up is 1 tick in the trace files
+            with (
+                TRACER.trace_tick(job.name, lateness=lateness)
+                if USE_TRACING
+                else nullcontext()
+            ):
+                await job.callback(deadline)
+        except Exception as e:
+            logger.error(f"Error running job {job.name}: {e}")
+
+    async def run(self) -> None:
+        """Sleep until the next deadline and run all due jobs in deadline order"""
+
+        while True:
+            next_deadline = min(job.deadline for job in self.jobs)
+            delay = (next_deadline - datetime.now()).total_seconds()
+            if delay > 0:
+                await sleep(delay)
+                continue
+
+            for job in sorted(self.jobs, key=lambda job: job.deadline):
+                if job.deadline <= datetime.now():
+                    await self.run_job(job)
@@ -0,0 +1,295 @@
+from asyncio import sleep
+from copy import deepcopy
+from dataclasses import dataclass, field
+from datetime import datetime
+from itertools import count
+import random
+import time
+from typing import Dict, List, Tuple
+
+import ccxt.pro as ccxt
+
+from misc import Candle
+
+# BloFin BTC-USDT as ccxt describes the market, 1 contract is 0.001 BTC
+MARKET = {
+    "contractSize": 0.001,
+    "precision": {"amount": 0.1, "price": 0.1},
+    "limits": {"amount": {"min": 0.1, "max": None}},
+}
+TAKER_FEE = 0.0006
+MAKER_FEE = 0.0002
+
+LONG = "long"
+SHORT = "short"
+
+
+@dataclass
+class SimulatedLot:
+    """SimulatedLot class to hold 1 filled market entry with its stop loss and
+    take profit"""
+
+    _id: str
+    direction: str
+    amount: float
+    entry_price: float
+    entry_time: int
+    stoploss_price: float | None
+    takeprofit_price: float | None = None
+    takeprofit_order_id: str | None = None
+
+
+@dataclass
+class SimulatedTrade:
+    """SimulatedTrade class to hold 1 closed lot"""
+
+    _id: str
+    direction: str
+    amount: float
+    entry_time: str
+    entry_price: float
+    exit_time: str
+    exit_price: float
+    exit_reason: str
+    fees: float
+    pnl: float
+
+
+@dataclass
+class SimulatedExchange:
+    """Stand-in for the subset of the ccxt.pro async API the bot uses, filling
+    orders against replayed candles.
+
+    Every call waits latency seconds (+/- jitter) before it is acknowledged. Calls
+    fail with a ccxt.NetworkError for the next fail_next[method] calls of a method
+    and at random with failure_rate. Acknowledged calls are logged in calls. With
+    report_fills off, order responses carry only the id like BloFin's do and fills
+    have to be fetched with fetch_order_trades. The replayed symbol trades with
+    the contract size, precision and limits of market_info.
+    """
+
+    latency: float = 0.0
+    report_fills: bool = True
+    jitter: float = 0.0
+    failure_rate: float = 0.0
+    fail_next: Dict[str, int] = field(default_factory=dict)
+    calls: List[Tuple[str, float]] = field(default_factory=list)
+    seed: int | None = None
+    balance: float = 1000.0
+    price: float = 0.0
+    candle: Candle | None = None
+    lots: List[SimulatedLot] = field(default_factory=list)
+    trades: List[SimulatedTrade] = field(default_factory=list)
+    leverage: Dict[str, int] = field(default_factory=dict)
+    order_ids: count = field(default_factory=lambda: count(1))
+    market_info: dict = field(default_factory=lambda: deepcopy(MARKET))
+
+    def __post_init__(self) -> None:
+        self.random = random.Random(self.seed)
+
+    async def call(self, method: str) -> None:
+        """Simulate the round trip of an API call and inject failures"""
+
+        if self.latency:
+            await sleep(
+                max(self.latency * (1 + self.random.uniform(-1, 1) * self.jitter), 0)
+            )
+        if self.fail_next.get(method):
+            self.fail_next[method] -= 1
+            raise ccxt.NetworkError(f"simulated {method} failure")
+        if self.failure_rate and self.random.random() < self.failure_rate:
+            raise ccxt.NetworkError(f"simulated random {method} failure")
+        self.calls.append((method, time.perf_counter()))
+
+    def set_candle(self, candle: Candle) -> None:
+        """Move the market to the open of a new candle"""
+
+        self.candle = candle
+        self.price = candle.open
+
+    def fill_candle(self, candle: Candle) -> None:
+        """Trigger stop losses and take profits hit during a finished candle, the
+        stop loss wins if both are hit within the same candle"""
+
+        for lot in list(self.lots):
+            is_long = lot.direction == LONG
+            if lot.stoploss_price and (
+                (is_long and candle.low <= lot.stoploss_price)
+                or (not is_long and candle.high >= lot.stoploss_price)
+            ):
+                self.close_lot(lot, lot.stoploss_price, candle, "stop loss", TAKER_FEE)
+            elif lot.takeprofit_price and (
+                (is_long and candle.high >= lot.takeprofit_price)
+                or (not is_long and candle.low <= lot.takeprofit_price)
+            ):
+                self.close_lot(
+                    lot, lot.takeprofit_price, candle, "take profit", MAKER_FEE
+                )
+
+    def close_lot(
+        self, lot: SimulatedLot, price: float, candle: Candle, reason: str, fee: float
+    ) -> None:
+        """Close a lot and book the trade"""
+
+        size = lot.amount * self.market_info["contractSize"]
+        direction = 1 if lot.direction == LONG else -1
+        fees = size * (lot.entry_price * TAKER_FEE + price * fee)
+        pnl = size * (price - lot.entry_price) * direction - fees
+        self.balance += pnl
+        self.lots.remove(lot)
+        self.trades.append(
+            SimulatedTrade(
+                _id=lot._id,
+                direction=lot.direction,
+                amount=lot.amount,
+                entry_time=str(datetime.fromtimestamp(lot.entry_time / 1000)),
+                entry_price=lot.entry_price,
+                exit_time=str(datetime.fromtimestamp(candle.timestamp / 1000)),
+                exit_price=price,
+                exit_reason=reason,
+                fees=round(fees, 4),
+                pnl=round(pnl, 4),
+            )
+        )
+
+    def order(self, order_id: str, status: str, amount: float, price: float) -> dict:
+        """Return a ccxt order structure"""
+
+        if not self.report_fills:
+            return {"id": order_id, "status": None, "filled": None, "info": {}}
+        return {
+            "id": order_id,
+            "status": status,
+            "amount": amount,
+            "filled": amount if status == "closed" else 0.0,
+            "average": price if status == "closed" else None,
+            "price": price,
+            "info": {},
+        }
+
+    async def create_order(
+        self,
+        symbol: str,
+        type: str,
+        side: str,
+        amount: float,
+        price: float | None = None,
+        params: dict = {},
+    ) -> dict:
+        """Fill market orders at the current price and attach reduce only limit
+        orders as take profit to the matching lot"""
+
+        await self.call("create_order")
+        order_id = str(next(self.order_ids))
+        direction = params.get("positionSide", LONG if side == "buy" else SHORT)
+        if type == "market":
+            self.lots.append(
+                SimulatedLot(
+                    _id=order_id,
+                    direction=direction,
+                    amount=amount,
+                    entry_price=self.price,
+                    entry_time=self.candle.timestamp if self.candle else 0,
+                    stoploss_price=params.get("stopLoss", {}).get("triggerPrice"),
+                )
+            )
+            return self.order(order_id, "closed", amount, self.price)
+
+        for lot in self.lots:
+            if lot.direction == direction and lot.takeprofit_price is None:
+                lot.takeprofit_price = price
+                lot.takeprofit_order_id = order_id
+                break
+        return self.order(order_id, "open", amount, price)
+
+    async def fetch_order_trades(self, id: str, symbol: str) -> List[dict]:
+        """Return the fill of a market order as 1 trade"""
+
+        await self.call("fetch_order_trades")
+        return [
+            {"order": lot._id, "amount": lot.amount, "price": lot.entry_price}
+            for lot in self.lots + self.trades
+            if lot._id == id
+        ]
+
+    def market(self, symbol: str) -> dict:
+        """Return the market of the symbol"""
+
+        return {"symbol": symbol, **self.market_info}
+
+    async def fetch_ticker(self, symbol: str) -> dict:
+        """Return the current price as ticker"""
+
+        await self.call("fetch_ticker")
+        return {"symbol": symbol, "last": self.price}
+
+    async def fetch_ohlcv(
+        self, symbol: str, timeframe: str = "5m", limit: int | None = None
+    ) -> List[list]:
+        """Return the candle that just opened, as seen right at the boundary"""
+
+        await self.call("fetch_ohlcv")
+        return [
+            [self.candle.timestamp, self.price, self.price, self.price, self.price, 0]
+        ]
+
+    async def fetch_balance(self) -> dict:
+        """Return the balance including closed trades"""
+
+        await self.call("fetch_balance")
+        return {"USDT": {"total": self.balance}}
+
+    async def set_leverage(self, symbol: str, leverage: int, params: dict = {}) -> dict:
+        """Store the leverage per position side"""
+
+        await self.call("set_leverage")
+        self.leverage[params.get("positionSide", "")] = leverage
+        return {"leverage": leverage}
+
+    async def fetch_positions(self, symbols: List[str] | None = None) -> List[dict]:
+        """Return the open lots as BloFin positions"""
+
+        await self.call("fetch_positions")
+        return [
+            {
+                "info": {
+                    "positions": lot.amount,
+                    "positionSide": lot.direction,
+                    "averagePrice": lot.entry_price,
+                    "liquidationPrice": 0.0,
+                }
+            }
+            for lot in self.lots
+        ]
+
+    async def fetch_open_orders(
+        self, symbol: str | None = None, params: dict = {}
+    ) -> List[dict]:
+        """Return the stop losses (tpsl) or take profit limit orders of open lots"""
+
+        await self.call("fetch_open_orders")
+        if params.get("tpsl"):
+            return [
+                {
+                    "info": {
+                        "size": lot.amount,
+                        "positionSide": lot.direction,
+                        "slTriggerPrice": lot.stoploss_price,
+                    }
+                }
+                for lot in self.lots
+            ]
+        return [
+            {
+                "amount": lot.amount,
+                "info": {
+                    "side": "sell" if lot.direction == LONG else "buy",
+                    "price": lot.takeprofit_price,
+                },
+            }
+            for lot in self.lots
+            if lot.takeprofit_price
+        ]
+
+    async def close(self) -> None:
+        """Nothing to close"""
@@ -0,0 +1,113 @@
+from asyncio import Task, create_task
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Set
+
+from decouple import config
+import orjson
+
+from logger import logger
+
+
+USE_STARTUP_CACHE = config("USE_STARTUP_CACHE", cast=bool, default=True)
+logger.info(f"{USE_STARTUP_CACHE=}")
+STARTUP_CACHE_PATH = config("STARTUP_CACHE_PATH", default="startup_cache.json")
+STARTUP_CACHE_TTL = config("STARTUP_CACHE_TTL", cast=int, default="86400")  # seconds
+
+
+class StartupCache:
+    """JSON file of the market metadata fetched at startup, so a restart uses the
+    cached metadata right away and refreshes it in the background"""
+
+    def __init__(
+        self,
+        path: str = STARTUP_CACHE_PATH,
+        ttl: int = STARTUP_CACHE_TTL,
+        enabled: bool = USE_STARTUP_CACHE,
+    ) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.enabled = enabled
+        self.entries: Dict[str, dict] = {}
+        self.tasks: Set[Task] = set()
+        if not enabled:
+            return
+        try:
+            with open(path, "rb") as cache_file:
+                self.entries = orjson.loads(cache_file.read())
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Error reading the startup cache {path}: {e}")
+
+    def get(self, key: str, max_age: float | None = None) -> Any | None:
+        """Return the cached value, None if it isn't cached or older than max_age
+        (s, default the ttl)"""
+
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry["time"] > (self.ttl if max_age is None else max_age):
+            return None
+        return entry["value"]
+
+    def set(self, key: str, value: Any) -> None:
+        """Cache the value and replace the file, a crash while writing keeps the
+        previous file"""
+
+        self.entries[key] = {"time": time.time(), "value": value}
+        if not self.enabled:
+            return
+        try:
+            temporary_path = f"{self.path}.tmp"
+            with open(temporary_path, "wb") as cache_file:
+                cache_file.write(orjson.dumps(self.entries))
+            os.replace(temporary_path, self.path)
+        except Exception as e:
+            logger.error(f"Error writing the startup cache {self.path}: {e}")
+
+    async def refresh(
+        self,
+        key: str,
+        fetch: Callable[[], Awaitable[Any]],
+        apply: Callable[[Any], Awaitable[None]],
+    ) -> Any | None:
+        """Fetch the value, cache and apply it, returns None when the fetch failed"""
+
+        try:
+            value = await fetch()
+        except Exception as e:
+            logger.error(f"Error refreshing {key}: {e}")
+            return None
+        if not value:
+            return None
+        self.set(key, value)
+        await apply(value)
+        return value
+
+    async def load(
+        self,
+        key: str,
+        fetch: Callable[[], Awaitable[Any]],
+        apply: Callable[[Any], Awaitable[None]],
+        default: Any | None = None,
+    ) -> None:
+        """Apply the cached value and refresh it in the background, when it isn't
+        cached (or expired) fetch it first, falling back to an expired value and
+        then to the default when the fetch fails"""
+
+        if (value := self.get(key)) is not None:
+            await apply(value)
+            task = create_task(self.refresh(key, fetch, apply))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+            logger.info(f"Using the cached {key}, refreshing in the background")
+            return
+
+        if await self.refresh(key, fetch, apply) is not None:
+            return
+        if (value := self.get(key, max_age=float("inf"))) is not None:
+            logger.warning(f"Using the expired cached {key}")
+            await apply(value)
+        elif default is not None:
+            await apply(default)
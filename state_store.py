@@ -0,0 +1,263 @@
+from dataclasses import asdict
+from datetime import datetime
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Set, Tuple
+
+from decouple import config
+import orjson
+
+from logger import logger
+from misc import Candle, Liquidation, PositionToOpen
+
+USE_STATE_STORE = config("USE_STATE_STORE", cast=bool, default=True)
+logger.info(f"{USE_STATE_STORE=}")
+STATE_STORE_PATH = config("STATE_STORE_PATH", default="state.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS liquidations (
+    asset TEXT NOT NULL,
+    id TEXT NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (asset, id)
+);
+CREATE TABLE IF NOT EXISTS positions_to_open (
+    asset TEXT NOT NULL,
+    id TEXT NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (asset, id)
+);
+CREATE TABLE IF NOT EXISTS position_sizes (
+    asset TEXT NOT NULL,
+    account TEXT NOT NULL,
+    size REAL NOT NULL,
+    PRIMARY KEY (asset, account)
+);
+CREATE TABLE IF NOT EXISTS orders (
+    asset TEXT NOT NULL,
+    account TEXT NOT NULL,
+    id TEXT NOT NULL,
+    time REAL NOT NULL,
+    data BLOB NOT NULL
+);
+"""
+
+
+def get_key(liquidation: Liquidation) -> str:
+    """Return the stored id of a liquidation or its position to open, the ids
+    (e.g. l-1405) only hold the time of day"""
+
+    return (
+        f"{datetime.fromtimestamp(liquidation.candle.timestamp / 1000):%Y-%m-%d}"
+        + f"-{liquidation._id}"
+    )
+
+
+def liquidation_from_dict(liquidation_dict: dict) -> Liquidation:
+    """Rebuild a Liquidation from its stored dictionary"""
+
+    return Liquidation(
+        **{
+            **liquidation_dict,
+            "candle": Candle(**liquidation_dict["candle"]),
+        }
+    )
+
+
+def position_to_open_from_dict(position_to_open_dict: dict) -> PositionToOpen:
+    """Rebuild a PositionToOpen from its stored dictionary"""
+
+    return PositionToOpen(
+        **{
+            **position_to_open_dict,
+            "liquidation": liquidation_from_dict(position_to_open_dict["liquidation"]),
+        }
+    )
+
+
+class StateStore:
+    """SQLite (WAL) store of the pending liquidations and setups, position sizes and
+    sent orders, so a restart continues where the bot stopped"""
+
+    def __init__(self, path: str = STATE_STORE_PATH) -> None:
+        self.path = path
+        self.connection = sqlite3.connect(path, isolation_level=None)
+        # the write-ahead log only needs an fsync at checkpoints, commits stay cheap
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        # the stored rows per (table, asset), so a save only writes the changes
+        self.saved: Dict[Tuple[str, str], Dict[str, bytes]] = {}
+
+    def close(self) -> None:
+        """Close the database"""
+
+        self.connection.close()
+
+    def sync(self, table: str, asset: str, rows: Iterable[Tuple[str, bytes]]) -> None:
+        """Make the rows of the asset in a table equal to rows in 1 transaction,
+        only writing the rows that were added, changed or removed since the last
+        save"""
+
+        if (table, asset) not in self.saved:
+            self.saved[(table, asset)] = dict(
+                self.connection.execute(
+                    f"SELECT id, data FROM {table} WHERE asset = ?", (asset,)
+                ).fetchall()
+            )
+        saved = self.saved[(table, asset)]
+        rows = dict(rows)
+        changed = [(_id, data) for _id, data in rows.items() if saved.get(_id) != data]
+        removed = [_id for _id in saved if _id not in rows]
+        if not changed and not removed:
+            return
+        with self.connection:
+            self.connection.execute("BEGIN")
+            self.connection.executemany(
+                f"DELETE FROM {table} WHERE asset = ? AND id = ?",
+                [(asset, _id) for _id in removed],
+            )
+            # an upsert keeps the rowid, so the restored order stays the same
+            self.connection.executemany(
+                f"INSERT INTO {table} (asset, id, data) VALUES (?, ?, ?) "
+                + "ON CONFLICT (asset, id) DO UPDATE SET data = excluded.data",
+                [(asset, _id, data) for _id, data in changed],
+            )
+        self.saved[(table, asset)] = rows
+
+    def save_pending(
+        self,
+        asset: str,
+        liquidations: Iterable[Liquidation],
+        positions_to_open: Iterable[PositionToOpen],
+    ) -> None:
+        """Store the pending liquidations and positions to open of the asset"""
+
+        try:
+            self.sync(
+                "liquidations",
+                asset,
+                (
+                    (get_key(liquidation), orjson.dumps(asdict(liquidation)))
+                    for liquidation in liquidations
+                ),
+            )
+            self.sync(
+                "positions_to_open",
+                asset,
+                (
+                    (
+                        get_key(position_to_open.liquidation),
+                        orjson.dumps(asdict(position_to_open)),
+                    )
+                    for position_to_open in positions_to_open
+                ),
+            )
+        except Exception as e:
+            logger.error(f"Error saving state of {asset}: {e}")
+
+    def remove_position_to_open(
+        self, asset: str, position_to_open: PositionToOpen
+    ) -> None:
+        """Delete 1 position to open of the asset, e.g. right before it is entered"""
+
+        key = get_key(position_to_open.liquidation)
+        try:
+            with self.connection:
+                self.connection.execute(
+                    "DELETE FROM positions_to_open WHERE asset = ? AND id = ?",
+                    (asset, key),
+                )
+            self.saved.get(("positions_to_open", asset), {}).pop(key, None)
+        except Exception as e:
+            logger.error(f"Error removing {position_to_open._id} of {asset}: {e}")
+
+    def load_pending(
+        self, asset: str
+    ) -> Tuple[List[Liquidation], List[PositionToOpen]]:
+        """Return the stored liquidations and positions to open of the asset"""
+
+        try:
+            liquidations = [
+                liquidation_from_dict(orjson.loads(data))
+                for (data,) in self.connection.execute(
+                    "SELECT data FROM liquidations WHERE asset = ?", (asset,)
+                )
+            ]
+            positions_to_open = [
+                position_to_open_from_dict(orjson.loads(data))
+                for (data,) in self.connection.execute(
+                    "SELECT data FROM positions_to_open WHERE asset = ? ORDER BY rowid",
+                    (asset,),
+                )
+            ]
+        except Exception as e:
+            logger.error(f"Error loading state of {asset}: {e}")
+            return [], []
+
+        self.saved[("liquidations", asset)] = {
+            get_key(liquidation): orjson.dumps(asdict(liquidation))
+            for liquidation in liquidations
+        }
+        self.saved[("positions_to_open", asset)] = {
+            get_key(position_to_open.liquidation): orjson.dumps(
+                asdict(position_to_open)
+            )
+            for position_to_open in positions_to_open
+        }
+        return liquidations, positions_to_open
+
+    def save_position_size(self, asset: str, account: str, size: float) -> None:
+        """Store the position size of the asset on the account"""
+
+        try:
+            with self.connection:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO position_sizes (asset, account, size) "
+                    + "VALUES (?, ?, ?)",
+                    (asset, account, size),
+                )
+        except Exception as e:
+            logger.error(f"Error saving position size of {asset}: {e}")
+
+    def load_position_size(self, asset: str, account: str) -> float | None:
+        """Return the stored position size of the asset on the account"""
+
+        try:
+            row = self.connection.execute(
+                "SELECT size FROM position_sizes WHERE asset = ? AND account = ?",
+                (asset, account),
+            ).fetchone()
+        except Exception as e:
+            logger.error(f"Error loading position size of {asset}: {e}")
+            return None
+        return row[0] if row else None
+
+    def add_order(self, asset: str, account: str, _id: str, order: dict) -> None:
+        """Append a sent order to the order log, _id is the key of the position
+        to open"""
+
+        try:
+            with self.connection:
+                self.connection.execute(
+                    "INSERT INTO orders (asset, account, id, time, data) "
+                    + "VALUES (?, ?, ?, ?, ?)",
+                    (asset, account, _id, time.time(), orjson.dumps(order)),
+                )
+        except Exception as e:
+            logger.error(f"Error saving order {_id}: {e}")
+
+    def load_order_ids(self, asset: str) -> Set[str]:
+        """Return the keys of the positions to open of the asset that orders were
+        sent for"""
+
+        try:
+            return {
+                _id
+                for (_id,) in self.connection.execute(
+                    "SELECT DISTINCT id FROM orders WHERE asset = ?", (asset,)
+                )
+            }
+        except Exception as e:
+            logger.error(f"Error loading orders of {asset}: {e}")
+            return set()
@@ -0,0 +1,247 @@
+from asyncio import Task, create_task, current_task, get_running_loop, to_thread
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime
+from functools import wraps
+from glob import glob
+from itertools import count
+import os
+from threading import Lock
+import time
+from typing import Awaitable, Callable, Dict, Iterator, List, Set, TypeVar
+
+from decouple import config
+import orjson
+
+from logger import logger
+
+USE_TRACING = config("USE_TRACING", cast=bool, default=False)
+logger.info(f"{USE_TRACING=}")
+TRACE_DIRECTORY = config("TRACE_DIRECTORY", default="traces/")
+TRACE_FORMAT = config("TRACE_FORMAT", default="jsonl")  # jsonl or chrome
+TRACE_MAX_FILES = config("TRACE_MAX_FILES", cast=int, default="1000")
+
+T = TypeVar("T")
+
+
+@dataclass
+class Span:
+    """Span class to hold 1 timed step of a tick, nested through parent"""
+
+    name: str
+    _id: int
+    parent: int | None
+    task: int
+    start: int  # monotonic ns
+    end: int | None = None
+    args: dict = field(default_factory=dict)
+
+
+@dataclass
+class Tick:
+    """Tick class to hold the spans of 1 scheduler wake up"""
+
+    name: str
+    started: datetime
+    spans: List[Span] = field(default_factory=list)
+
+
+class Tracer:
+    """Records nested spans per tick and writes every finished tick to its own
+    file in a thread, keeping the last max_files files of the directory"""
+
+    def __init__(
+        self,
+        directory: str = TRACE_DIRECTORY,
+        trace_format: str = TRACE_FORMAT,
+        max_files: int = TRACE_MAX_FILES,
+    ) -> None:
+        self.directory = directory
+        self.trace_format = trace_format
+        self.max_files = max_files
+        self.tick: ContextVar[Tick | None] = ContextVar("tick", default=None)
+        self.parent: ContextVar[int | None] = ContextVar("parent", default=None)
+        self.span_ids = count(1)
+        self.task_ids: Dict[int, int] = {}
+        self.tasks: Set[Task] = set()
+        self.lock = Lock()  # ticks are written from threads
+
+    def get_task_id(self) -> int:
+        """Return a small id of the running task, the thread id in Chrome traces"""
+
+        task = current_task()
+        return self.task_ids.setdefault(id(task), len(self.task_ids) + 1)
+
+    @contextmanager
+    def span(self, name: str, **args) -> Iterator[Span | None]:
+        """Record a span inside the current tick, nothing outside of ticks"""
+
+        tick = self.tick.get()
+        if tick is None:
+            yield None
+            return
+        span = Span(
+            name=name,
+            _id=next(self.span_ids),
+            parent=self.parent.get(),
+            task=self.get_task_id(),
+            start=time.monotonic_ns(),
+            args=args,
+        )
+        tick.spans.append(span)
+        token = self.parent.set(span._id)
+        try:
+            yield span
+        except Exception as e:
+            span.args["error"] = str(e)
+            raise
+        finally:
+            span.end = time.monotonic_ns()
+            self.parent.reset(token)
+
+    def event(self, name: str, **args) -> None:
+        """Record an instant event inside the current tick"""
+
+        if (tick := self.tick.get()) is not None:
+            now = time.monotonic_ns()
+            tick.spans.append(
+                Span(
+                    name=name,
+                    _id=next(self.span_ids),
+                    parent=self.parent.get(),
+                    task=self.get_task_id(),
+                    start=now,
+                    end=now,
+                    args=args,
+                )
+            )
+
+    @contextmanager
+    def trace_tick(self, name: str, **args) -> Iterator[Tick]:
+        """Start a new tick with a root span and write it out when it is done"""
+
+        tick = Tick(name=name, started=datetime.now())
+        tick_token = self.tick.set(tick)
+        parent_token = self.parent.set(None)
+        try:
+            with self.span(name, **args):
+                yield tick
+        finally:
+            self.tick.reset(tick_token)
+            self.parent.reset(parent_token)
+            self.write(tick)
+
+    def render(self, tick: Tick) -> bytes:
+        """Return the spans of the tick as JSONL or as a Chrome trace"""
+
+        if self.trace_format == "chrome":
+            return orjson.dumps(
+                {
+                    "traceEvents": [
+                        {
+                            "name": span.name,
+                            "ph": "X" if span.end != span.start else "i",
+                            "ts": span.start / 1000,
+                            "dur": ((span.end or span.start) - span.start) / 1000,
+                            "pid": 1,
+                            "tid": span.task,
+                            "args": span.args,
+                        }
+                        for span in tick.spans
+                    ],
+                    "displayTimeUnit": "ms",
+                }
+            )
+        return b"".join(
+            orjson.dumps(
+                {
+                    "tick": tick.name,
+                    "name": span.name,
+                    "id": span._id,
+                    "parent": span.parent,
+                    "task": span.task,
+                    "start_ns": span.start,
+                    "duration_ns": (span.end or span.start) - span.start,
+                    "args": span.args,
+                }
+            )
+            + b"\n"
+            for span in tick.spans
+        )
+
+    def write_file(self, path: str, data: bytes) -> None:
+        """Write a rendered tick and remove the oldest trace files, also those of
+        previous runs"""
+
+        try:
+            with self.lock:
+                os.makedirs(self.directory, exist_ok=True)
+                with open(path, "wb") as trace_file:
+                    trace_file.write(data)
+                # the file names start with the tick start, so sorting is by age
+                paths = sorted(glob(os.path.join(self.directory, "*.json*")))
+                for old_path in paths[: max(len(paths) - self.max_files, 0)]:
+                    os.remove(old_path)
+        except Exception as e:
+            logger.error(f"Error writing trace {path}: {e}")
+
+    def write(self, tick: Tick) -> None:
+        """Render the tick and write it in a thread, the loop doesn't wait on disk"""
+
+        try:
+            extension = "json" if self.trace_format == "chrome" else "jsonl"
+            path = os.path.join(
+                self.directory,
+                f"{tick.started:%Y%m%d-%H%M%S-%f}-{tick.name}.{extension}",
+            )
+            data = self.render(tick)
+            try:
+                get_running_loop()
+            except RuntimeError:
+                self.write_file(path, data)  # outside of the loop, e.g. scripts
+            else:
+                task = create_task(to_thread(self.write_file, path, data))
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+        except Exception as e:
+            logger.error(f"Error writing trace of {tick.name}: {e}")
+        self.task_ids.clear()
+
+
+TRACER = Tracer()
+
+
+def traced(
+    name: str,
+) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]]]:
+    """Decorate a coroutine function to record a span per call, the function is
+    left untouched when tracing is off"""
+
+    def decorator(function: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        if not USE_TRACING:
+            return function
+
+        @wraps(function)
+        async def wrapper(*args, **kwargs) -> T:
+            with TRACER.span(name):
+                return await function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def trace_calls(instance: object, methods: List[str], prefix: str) -> None:
+    """Record a span for every call of the methods of 1 instance, e.g. the ccxt
+    calls of an exchange connection"""
+
+    for method in methods:
+        if hasattr(instance, method):
+            bound = getattr(instance, method)
+
+            async def wrapper(*args, bound=bound, method=method, **kwargs):
+                with TRACER.span(f"{prefix}.{method}"):
+                    return await bound(*args, **kwargs)
+
+            setattr(instance, method, wrapper)